@@ -212,7 +212,7 @@ reg data_gen_reset_reg = 1'b0, data_gen_reset_next;
 reg data_check_enable_reg = 1'b0, data_check_enable_next;
 reg data_check_reset_reg = 1'b0, data_check_reset_next;
 
-reg [31:0] active_cycle_count_reg = 0, active_cycle_count_next;
+reg [63:0] active_cycle_count_reg = 0, active_cycle_count_next;
 
 reg [31:0] write_count_reg = 0, write_count_next;
 reg [31:0] read_count_reg = 0, read_count_next;
@@ -457,6 +457,7 @@ always @* begin
             RBB+8'h50: reg_rd_data_next = fifo_occupancy_sync_2_reg;
             RBB+8'h54: reg_rd_data_next = fifo_occupancy_sync_2_reg >> 32;
             RBB+8'h60: reg_rd_data_next = active_cycle_count_reg;
+            RBB+8'h64: reg_rd_data_next = active_cycle_count_reg >> 32;
             RBB+8'h68: reg_rd_data_next = write_count_reg;
             RBB+8'h6C: reg_rd_data_next = read_count_reg;
             default: reg_rd_ack_next = 1'b0;
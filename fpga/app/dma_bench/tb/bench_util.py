@@ -0,0 +1 @@
+../../../common/tb/bench_util.py
\ No newline at end of file
@@ -0,0 +1,232 @@
+# SPDX-License-Identifier: BSD-2-Clause-Views
+# Copyright (c) 2023 The Regents of the University of California
+
+import cocotb
+from cocotb.log import SimLog
+from cocotb.triggers import Timer, Combine
+from cocotb.utils import get_sim_time
+
+try:
+    from bench_util import read_qword, write_qword, read_counter, format_table as _format_table, format_csv as _format_csv
+except ImportError:
+    from .bench_util import read_qword, write_qword, read_counter, format_table as _format_table, format_csv as _format_csv
+
+DRAM_TEST_TYPE = 0x12348102
+DRAM_TEST_VER  = 0x00000100
+
+DRAM_TEST_REG_AXI_ADDR_WIDTH   = 0x10
+DRAM_TEST_REG_AXI_DATA_WIDTH   = 0x14
+DRAM_TEST_REG_LANE_COUNT       = 0x18
+DRAM_TEST_REG_LANE_WIDTH       = 0x1C
+DRAM_TEST_REG_FIFO_CTRL        = 0x20
+DRAM_TEST_REG_DATA_CTRL        = 0x24
+DRAM_TEST_REG_FIFO_BASE_MAX    = 0x30
+DRAM_TEST_REG_FIFO_SIZE_MAX    = 0x38
+DRAM_TEST_REG_FIFO_BASE        = 0x40
+DRAM_TEST_REG_FIFO_SIZE_MASK   = 0x48
+DRAM_TEST_REG_FIFO_OCCUPANCY   = 0x50
+DRAM_TEST_REG_CYCLE_COUNT      = 0x60
+DRAM_TEST_REG_WRITE_COUNT      = 0x68
+DRAM_TEST_REG_READ_COUNT       = 0x6C
+DRAM_TEST_REG_LANE_ERR_BASE    = 0x80
+
+DRAM_TEST_FIFO_CTRL_ENABLE     = 1 << 0
+DRAM_TEST_FIFO_CTRL_RESET      = 1 << 1
+
+DRAM_TEST_DATA_CTRL_GEN_EN     = 1 << 0
+DRAM_TEST_DATA_CTRL_GEN_RST    = 1 << 1
+DRAM_TEST_DATA_CTRL_CHECK_EN   = 1 << 8
+DRAM_TEST_DATA_CTRL_CHECK_RST  = 1 << 9
+
+BENCH_FIELDS = ['channel', 'op', 'fifo_size', 'burst_len', 'bytes', 'cycles', 'time_ns',
+    'write_gbps', 'read_gbps', 'errors', 'polls']
+
+
+class DramTestCh:
+    def __init__(self, rb, clk_period=4.0, poll_interval=1000, burst_len=None, index=0):
+        # rb needs read_dword/write_dword
+        self.rb = rb
+        self.clk_period = clk_period
+        self.poll_interval = poll_interval
+        self.burst_len = burst_len
+        self.index = index
+        self.log = SimLog("cocotb.dram_test")
+
+        self.addr_width = None
+        self.data_width = None
+        self.lane_count = None
+        self.lane_width = None
+        self.fifo_size_max = None
+
+    @classmethod
+    async def find_all(cls, reg_blocks, clk_period=4.0, poll_interval=1000):
+        channels = []
+        while True:
+            rb = reg_blocks.find(DRAM_TEST_TYPE, DRAM_TEST_VER, len(channels))
+            if not rb:
+                break
+            ch = cls(rb, clk_period, poll_interval, index=len(channels))
+            await ch.init()
+            channels.append(ch)
+        return channels
+
+    async def init(self):
+        self.addr_width = await self.rb.read_dword(DRAM_TEST_REG_AXI_ADDR_WIDTH)
+        self.data_width = await self.rb.read_dword(DRAM_TEST_REG_AXI_DATA_WIDTH)
+        self.lane_count = await self.rb.read_dword(DRAM_TEST_REG_LANE_COUNT)
+        self.lane_width = await self.rb.read_dword(DRAM_TEST_REG_LANE_WIDTH)
+        self.fifo_size_max = await read_qword(self.rb, DRAM_TEST_REG_FIFO_SIZE_MAX)+1
+
+    @property
+    def word_bytes(self):
+        return self.data_width // 8
+
+    # FIFO
+
+    async def set_fifo(self, size, base=None):
+        if base is not None:
+            await write_qword(self.rb, DRAM_TEST_REG_FIFO_BASE, base)
+        await write_qword(self.rb, DRAM_TEST_REG_FIFO_SIZE_MASK, size-1)
+
+    async def get_fifo_occupancy(self):
+        return await read_qword(self.rb, DRAM_TEST_REG_FIFO_OCCUPANCY)
+
+    async def reset(self):
+        # reset FIFO and data generator/checker
+        await self.rb.write_dword(DRAM_TEST_REG_FIFO_CTRL, DRAM_TEST_FIFO_CTRL_RESET)
+        await self.rb.write_dword(DRAM_TEST_REG_DATA_CTRL, DRAM_TEST_DATA_CTRL_GEN_RST | DRAM_TEST_DATA_CTRL_CHECK_RST)
+
+        await Timer(100, 'ns')
+
+        # enable FIFO
+        await self.rb.write_dword(DRAM_TEST_REG_FIFO_CTRL, DRAM_TEST_FIFO_CTRL_ENABLE)
+        await self.rb.write_dword(DRAM_TEST_REG_DATA_CTRL, 0)
+
+    # data generator/checker
+
+    async def start(self, write_words=0, read_words=0):
+        # cycle counter runs while the generator or checker is enabled
+        await self.rb.write_dword(DRAM_TEST_REG_CYCLE_COUNT, 0)
+        await self.rb.write_dword(DRAM_TEST_REG_WRITE_COUNT, write_words)
+        await self.rb.write_dword(DRAM_TEST_REG_READ_COUNT, read_words)
+
+        val = 0
+        if write_words:
+            val |= DRAM_TEST_DATA_CTRL_GEN_EN
+        if read_words:
+            val |= DRAM_TEST_DATA_CTRL_CHECK_EN
+        await self.rb.write_dword(DRAM_TEST_REG_DATA_CTRL, val)
+
+    async def is_running(self):
+        val = await self.rb.read_dword(DRAM_TEST_REG_DATA_CTRL)
+        return bool(val & (DRAM_TEST_DATA_CTRL_GEN_EN | DRAM_TEST_DATA_CTRL_CHECK_EN))
+
+    async def wait(self, timeout=10000000):
+        # poll at an interval rather than back-to-back register reads
+        polls = 0
+        start = get_sim_time('ns')
+        while True:
+            await Timer(self.poll_interval, 'ns')
+            polls += 1
+            if not await self.is_running():
+                return polls
+            if get_sim_time('ns') - start > timeout:
+                raise Exception("Timed out waiting for DRAM test channel")
+
+    async def get_cycle_count(self):
+        return await read_counter(self.rb, DRAM_TEST_REG_CYCLE_COUNT)
+
+    async def get_lane_errors(self):
+        return [await self.rb.read_dword(DRAM_TEST_REG_LANE_ERR_BASE+k*4) for k in range(self.lane_count)]
+
+    async def run(self, write_words=0, read_words=0, fifo_size=None):
+        await self.start(write_words, read_words)
+        polls = await self.wait()
+        return await self.collect(write_words, read_words, polls, fifo_size)
+
+    async def collect(self, write_words, read_words, polls, fifo_size=None):
+        cycles = await self.get_cycle_count()
+        errors = sum(await self.get_lane_errors())
+        time_ns = cycles*self.clk_period
+
+        if write_words and read_words:
+            op = "stream"
+        elif write_words:
+            op = "write"
+        else:
+            op = "read"
+
+        return {
+            'channel': self.index,
+            'op': op,
+            'fifo_size': fifo_size,
+            'burst_len': self.burst_len,
+            'bytes': max(write_words, read_words)*self.word_bytes,
+            'cycles': cycles,
+            'time_ns': time_ns,
+            'write_gbps': write_words*self.word_bytes*8/time_ns if time_ns else 0.0,
+            'read_gbps': read_words*self.word_bytes*8/time_ns if time_ns else 0.0,
+            'errors': errors,
+            'polls': polls,
+        }
+
+    async def benchmark(self, fifo_sizes, transfer_size=None):
+        # write fills the FIFO, read drains it, stream does both at once
+        rows = []
+        for fifo_size in fifo_sizes:
+            await self.reset()
+            await self.set_fifo(fifo_size)
+
+            words = min(transfer_size or fifo_size, fifo_size) // self.word_bytes
+
+            for write_words, read_words in [(words, 0), (0, words), (words, words)]:
+                row = await self.run(write_words, read_words, fifo_size)
+                self.log.info("ch %d %s FIFO %d B: %d cycles, write %.3f Gbps, read %.3f Gbps, %d errors",
+                    self.index, row['op'], fifo_size, row['cycles'], row['write_gbps'],
+                    row['read_gbps'], row['errors'])
+                rows.append(row)
+        return rows
+
+
+async def run_parallel(channels, write_words=0, read_words=0, fifo_size=None):
+    # run all channels at once and report per-channel and aggregate bandwidth
+    start = get_sim_time('ns')
+
+    for ch in channels:
+        await ch.start(write_words, read_words)
+
+    waits = [cocotb.start_soon(ch.wait()) for ch in channels]
+    await Combine(*[w.join() for w in waits])
+
+    elapsed = get_sim_time('ns') - start
+
+    rows = []
+    for ch, w in zip(channels, waits):
+        rows.append(await ch.collect(write_words, read_words, w.result(), fifo_size))
+
+    total = sum(r['bytes'] for r in rows)
+    agg = {
+        'channel': "all",
+        'op': rows[0]['op'] if rows else None,
+        'fifo_size': fifo_size,
+        'burst_len': rows[0]['burst_len'] if rows else None,
+        'bytes': total,
+        'cycles': max(r['cycles'] for r in rows) if rows else 0,
+        'time_ns': max(r['time_ns'] for r in rows) if rows else 0.0,
+        'errors': sum(r['errors'] for r in rows),
+        'polls': sum(r['polls'] for r in rows),
+        'wall_ns': elapsed,
+    }
+    agg['write_gbps'] = sum(r['write_gbps'] for r in rows)
+    agg['read_gbps'] = sum(r['read_gbps'] for r in rows)
+    rows.append(agg)
+
+    return rows
+
+
+def format_table(rows, fields=BENCH_FIELDS):
+    return _format_table(rows, fields, 12)
+
+
+def format_csv(rows, fields=BENCH_FIELDS):
+    return _format_csv(rows, fields)
@@ -3,6 +3,7 @@
 
 import logging
 import os
+import sys
 
 import cocotb_test.simulator
 import pytest
@@ -14,6 +15,16 @@ from cocotb.regression import TestFactory
 
 from cocotbext.axi import AxiBus, AxiRam
 
+try:
+    from dram_test import DramTestCh, run_parallel, format_table, format_csv
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from dram_test import DramTestCh, run_parallel, format_table, format_csv
+    finally:
+        del sys.path[0]
+
 
 class TB(object):
     def __init__(self, dut):
@@ -86,6 +97,12 @@ class TB(object):
         self.dut.reg_rd_en.value = 0
         return self.dut.reg_rd_data.value.integer
 
+    async def read_dword(self, addr):
+        return await self.read_reg(addr)
+
+    async def write_dword(self, addr, data):
+        await self.write_reg(addr, data)
+
 
 async def run_test(dut):
 
@@ -166,10 +183,45 @@ async def run_test(dut):
     await RisingEdge(dut.clk)
 
 
+async def run_test_bandwidth(dut):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    ch = DramTestCh(tb, clk_period=4.0, poll_interval=200,
+        burst_len=int(os.getenv("PARAM_AXI_MAX_BURST_LEN", "256")))
+    await ch.init()
+
+    fifo_sizes = [2**k for k in range(12, 17, 2)]
+    fifo_sizes = [size for size in fifo_sizes if size <= ch.fifo_size_max]
+
+    rows = await ch.benchmark(fifo_sizes)
+
+    # same transfer through the channel as the single-channel aggregate
+    await ch.reset()
+    await ch.set_fifo(fifo_sizes[-1])
+    words = fifo_sizes[-1] // ch.word_bytes
+    rows += await run_parallel([ch], words, words, fifo_sizes[-1])
+
+    tb.log.info("DRAM test channel bandwidth:\n%s", format_table(rows))
+
+    with open("dram_test_ch_bench.csv", 'w') as f:
+        f.write(format_csv(rows))
+
+    for row in rows:
+        assert row['errors'] == 0
+        assert row['cycles'] > 0
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
 if cocotb.SIM_NAME:
 
     for test in [
                 run_test,
+                run_test_bandwidth,
             ]:
 
         factory = TestFactory(test)
@@ -187,8 +239,9 @@ eth_rtl_dir = os.path.abspath(os.path.join(lib_dir, 'eth', 'rtl'))
 pcie_rtl_dir = os.path.abspath(os.path.join(lib_dir, 'pcie', 'rtl'))
 
 
+@pytest.mark.parametrize("axi_max_burst_len", [16, 256])
 @pytest.mark.parametrize("data_width", [256, 512])
-def test_dram_test_ch(request, data_width):
+def test_dram_test_ch(request, data_width, axi_max_burst_len):
     dut = "dram_test_ch"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
@@ -224,11 +277,11 @@ def test_dram_test_ch(request, data_width):
     parameters = {}
 
     # AXI configuration
-    parameters['AXI_DATA_WIDTH'] = 256
+    parameters['AXI_DATA_WIDTH'] = data_width
     parameters['AXI_ADDR_WIDTH'] = 32
     parameters['AXI_STRB_WIDTH'] = parameters['AXI_DATA_WIDTH'] // 8
     parameters['AXI_ID_WIDTH'] = 8
-    parameters['AXI_MAX_BURST_LEN'] = 256
+    parameters['AXI_MAX_BURST_LEN'] = axi_max_burst_len
 
     # Register interface
     parameters['REG_ADDR_WIDTH'] = 7
@@ -0,0 +1,292 @@
+# SPDX-License-Identifier: BSD-2-Clause-Views
+# Copyright (c) 2021-2023 The Regents of the University of California
+
+from cocotb.log import SimLog
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from cocotbext.pcie.core.caps import PciCapId
+
+try:
+    from bench_util import read_qword, write_qword, read_counter, format_table as _format_table, format_csv as _format_csv
+    from pcie_link import set_mps_mrrs
+except ImportError:
+    from .bench_util import read_qword, write_qword, read_counter, format_table as _format_table, format_csv as _format_csv
+    from .pcie_link import set_mps_mrrs
+
+DMA_BENCH_TYPE = 0x12348101
+DMA_BENCH_VER  = 0x00000100
+
+DMA_BENCH_REG_CTRL           = 0x00C
+DMA_BENCH_REG_CYCLE_COUNT    = 0x010
+DMA_BENCH_REG_RD_ACTIVE      = 0x020
+DMA_BENCH_REG_WR_ACTIVE      = 0x028
+
+DMA_BENCH_REG_RD_DESC        = 0x100
+DMA_BENCH_REG_WR_DESC        = 0x200
+
+DMA_BENCH_DESC_REG_DMA_ADDR  = 0x00
+DMA_BENCH_DESC_REG_RAM_ADDR  = 0x08
+DMA_BENCH_DESC_REG_LEN       = 0x10
+DMA_BENCH_DESC_REG_TAG       = 0x14
+DMA_BENCH_DESC_REG_STATUS    = 0x18
+
+DMA_BENCH_REG_RD_BLOCK       = 0x300
+DMA_BENCH_REG_WR_BLOCK       = 0x400
+
+DMA_BENCH_BLOCK_REG_CTRL             = 0x00
+DMA_BENCH_BLOCK_REG_CYCLE_COUNT      = 0x08
+DMA_BENCH_BLOCK_REG_LEN              = 0x10
+DMA_BENCH_BLOCK_REG_COUNT            = 0x18
+DMA_BENCH_BLOCK_REG_DMA_BASE_ADDR    = 0x80
+DMA_BENCH_BLOCK_REG_DMA_OFFSET       = 0x88
+DMA_BENCH_BLOCK_REG_DMA_OFFSET_MASK  = 0x90
+DMA_BENCH_BLOCK_REG_DMA_STRIDE       = 0x98
+DMA_BENCH_BLOCK_REG_RAM_BASE_ADDR    = 0xC0
+DMA_BENCH_BLOCK_REG_RAM_OFFSET       = 0xC8
+DMA_BENCH_BLOCK_REG_RAM_OFFSET_MASK  = 0xD0
+DMA_BENCH_BLOCK_REG_RAM_STRIDE       = 0xD8
+
+DMA_BENCH_RAM_SIZE = 16384
+
+SWEEP_FIELDS = ['op', 'mps', 'mrrs', 'block_size', 'block_stride', 'block_count',
+    'bytes', 'cycles', 'time_ns', 'gbytes_per_sec', 'latency_cycles', 'latency_ns']
+
+LINK_SWEEP_FIELDS = SWEEP_FIELDS + ['link_util', 'link_peak_gbytes_per_sec', 'credit_stall_ns']
+
+
+class DmaBench:
+    def __init__(self, rb, dev=None, clk_period=4.0, link=None):
+        self.rb = rb
+        self.dev = dev
+        self.clk_period = clk_period
+        self.link = link
+        self.log = SimLog("cocotb.dma_bench")
+
+        if rb.type != DMA_BENCH_TYPE or rb.version != DMA_BENCH_VER:
+            raise Exception(f"Unexpected register block type {rb.type:#010x} version {rb.version:#010x}")
+
+    @classmethod
+    def find(cls, reg_blocks, dev=None, clk_period=4.0, link=None):
+        rb = reg_blocks.find(DMA_BENCH_TYPE, DMA_BENCH_VER)
+        if not rb:
+            return None
+        return cls(rb, dev, clk_period, link)
+
+    async def set_interrupts(self, read=False, write=False):
+        await self.rb.write_dword(DMA_BENCH_REG_CTRL, int(read) | (int(write) << 1))
+
+    async def get_cycle_count(self):
+        return await read_counter(self.rb, DMA_BENCH_REG_CYCLE_COUNT)
+
+    async def get_active_count(self, write=False):
+        return await self.rb.read_dword(DMA_BENCH_REG_WR_ACTIVE if write else DMA_BENCH_REG_RD_ACTIVE)
+
+    # single descriptors
+
+    async def submit_read_desc(self, dma_addr, ram_addr, length, tag):
+        base = DMA_BENCH_REG_RD_DESC
+        await write_qword(self.rb, base+DMA_BENCH_DESC_REG_DMA_ADDR, dma_addr)
+        await self.rb.write_dword(base+DMA_BENCH_DESC_REG_RAM_ADDR, ram_addr)
+        await self.rb.write_dword(base+DMA_BENCH_DESC_REG_LEN, length)
+        await self.rb.write_dword(base+DMA_BENCH_DESC_REG_TAG, tag)
+
+    async def submit_write_desc(self, dma_addr, ram_addr, length, tag, imm=None):
+        base = DMA_BENCH_REG_WR_DESC
+        await write_qword(self.rb, base+DMA_BENCH_DESC_REG_DMA_ADDR, dma_addr)
+        if imm is not None:
+            await self.rb.write_dword(base+DMA_BENCH_DESC_REG_RAM_ADDR, imm)
+            tag |= 0x80000000
+        else:
+            await self.rb.write_dword(base+DMA_BENCH_DESC_REG_RAM_ADDR, ram_addr)
+        await self.rb.write_dword(base+DMA_BENCH_DESC_REG_LEN, length)
+        await self.rb.write_dword(base+DMA_BENCH_DESC_REG_TAG, tag)
+
+    async def read_desc_status(self, write=False):
+        base = DMA_BENCH_REG_WR_DESC if write else DMA_BENCH_REG_RD_DESC
+        val = await self.rb.read_dword(base+DMA_BENCH_DESC_REG_STATUS)
+        # reading the status register clears the valid bit
+        return bool(val & 0x80000000), val & 0xffff, (val >> 24) & 0xf
+
+    async def wait_desc(self, tag, write=False, timeout=100000):
+        start = get_sim_time('ns')
+        while True:
+            valid, status_tag, error = await self.read_desc_status(write)
+            if valid:
+                if status_tag != tag & 0xffff:
+                    raise Exception(f"DMA {'write' if write else 'read'} completed with tag {status_tag:#x}, expected {tag:#x}")
+                return error
+            if get_sim_time('ns') - start > timeout:
+                raise Exception(f"Timed out waiting for DMA {'write' if write else 'read'} tag {tag:#x}")
+            await Timer(100, 'ns')
+
+    async def dma_read(self, dma_addr, ram_addr, length, tag=0xAA):
+        await self.submit_read_desc(dma_addr, ram_addr, length, tag)
+        return await self.wait_desc(tag)
+
+    async def dma_write(self, dma_addr, ram_addr, length, tag=0x55, imm=None):
+        await self.submit_write_desc(dma_addr, ram_addr, length, tag, imm)
+        return await self.wait_desc(tag, write=True)
+
+    # block operations
+
+    async def setup_block(self, dma_base, block_size, block_count, write=False,
+            dma_offset=0, dma_offset_mask=None, dma_stride=None,
+            ram_base=0, ram_offset=0, ram_offset_mask=DMA_BENCH_RAM_SIZE-1, ram_stride=None):
+
+        base = DMA_BENCH_REG_WR_BLOCK if write else DMA_BENCH_REG_RD_BLOCK
+
+        if dma_stride is None:
+            dma_stride = block_size
+        if ram_stride is None:
+            ram_stride = block_size
+        if dma_offset_mask is None:
+            dma_offset_mask = ram_offset_mask
+
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_DMA_BASE_ADDR, dma_base)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_DMA_OFFSET, dma_offset)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_DMA_OFFSET_MASK, dma_offset_mask)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_DMA_STRIDE, dma_stride)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_RAM_BASE_ADDR, ram_base)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_RAM_OFFSET, ram_offset)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_RAM_OFFSET_MASK, ram_offset_mask)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_RAM_STRIDE, ram_stride)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_CYCLE_COUNT, 0)
+        await self.rb.write_dword(base+DMA_BENCH_BLOCK_REG_LEN, block_size)
+        await write_qword(self.rb, base+DMA_BENCH_BLOCK_REG_COUNT, block_count)
+
+    async def start_block(self, write=False):
+        base = DMA_BENCH_REG_WR_BLOCK if write else DMA_BENCH_REG_RD_BLOCK
+        await self.rb.write_dword(base+DMA_BENCH_BLOCK_REG_CTRL, 1)
+
+    async def stop_block(self, write=False):
+        base = DMA_BENCH_REG_WR_BLOCK if write else DMA_BENCH_REG_RD_BLOCK
+        await self.rb.write_dword(base+DMA_BENCH_BLOCK_REG_CTRL, 0)
+
+    async def is_block_running(self, write=False):
+        base = DMA_BENCH_REG_WR_BLOCK if write else DMA_BENCH_REG_RD_BLOCK
+        return bool(await self.rb.read_dword(base+DMA_BENCH_BLOCK_REG_CTRL) & 1)
+
+    async def get_block_count(self, write=False):
+        base = DMA_BENCH_REG_WR_BLOCK if write else DMA_BENCH_REG_RD_BLOCK
+        return await read_qword(self.rb, base+DMA_BENCH_BLOCK_REG_COUNT)
+
+    async def get_block_cycle_count(self, write=False):
+        base = DMA_BENCH_REG_WR_BLOCK if write else DMA_BENCH_REG_RD_BLOCK
+        return await read_qword(self.rb, base+DMA_BENCH_BLOCK_REG_CYCLE_COUNT)
+
+    async def wait_block(self, write=False, timeout=10000000):
+        # the run bit clears once all blocks are issued and none are in flight
+        start = get_sim_time('ns')
+        while await self.is_block_running(write):
+            if get_sim_time('ns') - start > timeout:
+                raise Exception(f"Timed out waiting for DMA block {'write' if write else 'read'}")
+            await Timer(100, 'ns')
+        return await self.get_block_cycle_count(write)
+
+    async def run_block(self, dma_base, block_size, block_count, write=False, **kwargs):
+        await self.setup_block(dma_base, block_size, block_count, write, **kwargs)
+        await self.start_block(write)
+        return await self.wait_block(write)
+
+    # PCIe configuration
+
+    async def set_pcie_config(self, mps=None, mrrs=None):
+        # sizes in bytes; goes through the link model when there is one so
+        # that the port MPS follows the device control register
+        if self.link is not None:
+            await self.link.configure(mps, mrrs)
+        elif self.dev is not None:
+            await set_mps_mrrs(self.dev, mps, mrrs)
+        else:
+            raise Exception("No PCIe device to configure")
+
+    async def get_pcie_config(self):
+        if self.dev is None:
+            return None, None
+        devctl = await self.dev.capability_read_dword(PciCapId.EXP, 0x8)
+        return 128 << ((devctl >> 5) & 7), 128 << ((devctl >> 12) & 7)
+
+    # sweeps
+
+    async def measure(self, dma_base, block_size, block_count, write=False, block_stride=None, region_len=DMA_BENCH_RAM_SIZE):
+        if block_stride is None:
+            block_stride = block_size
+
+        if self.link is not None:
+            self.link.clear_stats()
+
+        cycles = await self.run_block(dma_base, block_size, block_count, write,
+            dma_stride=block_stride, ram_stride=block_stride,
+            dma_offset_mask=region_len-1, ram_offset_mask=min(region_len, DMA_BENCH_RAM_SIZE)-1)
+
+        link_stats = self.link.get_stats() if self.link is not None else None
+
+        # a single block gives the unloaded per-operation latency
+        latency = await self.run_block(dma_base, block_size, 1, write,
+            dma_stride=block_stride, ram_stride=block_stride,
+            dma_offset_mask=region_len-1, ram_offset_mask=min(region_len, DMA_BENCH_RAM_SIZE)-1)
+
+        total = block_size*block_count
+        time_ns = cycles*self.clk_period
+
+        row = {
+            'op': "write" if write else "read",
+            'block_size': block_size,
+            'block_stride': block_stride,
+            'block_count': block_count,
+            'bytes': total,
+            'cycles': cycles,
+            'time_ns': time_ns,
+            'gbytes_per_sec': total/time_ns if time_ns else 0.0,
+            'latency_cycles': latency,
+            'latency_ns': latency*self.clk_period,
+        }
+
+        if link_stats is not None:
+            # write data goes upstream, read data comes back downstream
+            mps, mrrs = await self.get_pcie_config()
+            data_dir = link_stats['upstream'] if write else link_stats['downstream']
+            row['link_util'] = data_dir['utilization']
+            row['link_peak_gbytes_per_sec'] = self.link.peak_dma_gbps(write, mps)/8
+            row['credit_stall_ns'] = sum(link_stats['upstream']['credit_stall_ns'].values())
+
+        return row
+
+    async def sweep(self, dma_base, region_len, block_sizes, block_counts, block_strides=None,
+            pcie_configs=None, ops=("read", "write")):
+
+        if pcie_configs is None:
+            pcie_configs = [(None, None)]
+
+        rows = []
+
+        for mps, mrrs in pcie_configs:
+            if mps is not None or mrrs is not None:
+                await self.set_pcie_config(mps, mrrs)
+            cur_mps, cur_mrrs = await self.get_pcie_config()
+
+            for op in ops:
+                for block_size in block_sizes:
+                    for block_stride in (block_strides or [None]):
+                        if block_stride is not None and block_stride < block_size:
+                            continue
+                        for block_count in block_counts:
+                            row = await self.measure(dma_base, block_size, block_count, op == "write",
+                                block_stride, region_len)
+                            row['mps'] = cur_mps
+                            row['mrrs'] = cur_mrrs
+                            self.log.info("%s %d B x %d (stride %d): %.3f GB/s, latency %.1f ns",
+                                row['op'], block_size, block_count, row['block_stride'],
+                                row['gbytes_per_sec'], row['latency_ns'])
+                            rows.append(row)
+
+        return rows
+
+
+def format_table(rows, fields=SWEEP_FIELDS):
+    return _format_table(rows, fields, 14)
+
+
+def format_csv(rows, fields=SWEEP_FIELDS):
+    return _format_csv(rows, fields)
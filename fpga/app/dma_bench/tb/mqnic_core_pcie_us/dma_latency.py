@@ -0,0 +1 @@
+../../../../common/tb/dma_latency.py
\ No newline at end of file
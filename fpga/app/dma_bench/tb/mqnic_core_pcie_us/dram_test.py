@@ -0,0 +1 @@
+../dram_test.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../../common/tb/host_mem.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../../common/tb/pcie_link.py
\ No newline at end of file
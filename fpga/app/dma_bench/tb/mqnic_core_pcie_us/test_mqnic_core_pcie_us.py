@@ -26,19 +26,32 @@ from cocotbext.pcie.xilinx.us import UltraScalePlusPcieDevice
 
 try:
     import mqnic
+    from dma_bench import DmaBench, format_table, format_csv, SWEEP_FIELDS, LINK_SWEEP_FIELDS
+    from dma_latency import DmaLatencyCollector, RcTlpMonitor, correlate, log_correlation
+    from pcie_link import PcieLink
+    from host_mem import HostMemModel, Iotlb, fixed_latency, numa_latency, jittered_latency, required_read_depth
+    from dram_test import DramTestCh, run_parallel, format_table as format_dram_table
 except ImportError:
     # attempt import from current directory
     sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
     try:
         import mqnic
+        from dma_bench import DmaBench, format_table, format_csv, SWEEP_FIELDS, LINK_SWEEP_FIELDS
+        from dma_latency import DmaLatencyCollector, RcTlpMonitor, correlate, log_correlation
+        from pcie_link import PcieLink
+        from host_mem import HostMemModel, Iotlb, fixed_latency, numa_latency, jittered_latency, required_read_depth
+        from dram_test import DramTestCh, run_parallel, format_table as format_dram_table
     finally:
         del sys.path[0]
 
 
 class TB(object):
-    def __init__(self, dut, msix_count=32):
+    def __init__(self, dut, msix_count=32, link_model=None):
         self.dut = dut
 
+        if link_model is None:
+            link_model = bool(int(os.getenv("PCIE_LINK_MODEL", "0")))
+
         self.log = SimLog("cocotb.tb")
         self.log.setLevel(logging.DEBUG)
 
@@ -266,7 +279,20 @@ class TB(object):
 
         # self.dev.log.setLevel(logging.DEBUG)
 
-        self.rc.make_port().connect(self.dev)
+        self.link = None
+        if link_model:
+            # paced link in place of the default unpaced connection
+            self.link = PcieLink(self.rc, self.dev,
+                generation=self.dev.pcie_generation,
+                width=self.dev.pcie_link_width,
+                max_payload_size=256,
+                max_read_request_size=512)
+        else:
+            self.rc.make_port().connect(self.dev)
+
+        # host memory latency and IOMMU, off until configured
+        self.host_mem = HostMemModel(self.rc)
+        self.host_mem.enabled = False
 
         self.driver = mqnic.Driver()
 
@@ -417,6 +443,10 @@ class TB(object):
 
         await self.rc.enumerate()
 
+        if self.link is not None:
+            # apply the link MPS/MRRS to the enumerated device and the link ports
+            await self.link.configure()
+
     async def _run_loopback(self):
         while True:
             await RisingEdge(self.dut.clk)
@@ -434,6 +464,13 @@ async def run_test_nic(dut):
 
     await tb.init()
 
+    dma_latency = None
+    if bool(int(os.getenv("DMA_LATENCY", "0"))):
+        dma_latency = DmaLatencyCollector(dut.core_pcie_inst.stats_dma_if_pcie.stats_dma_if_pcie_inst,
+            dut.clk, 1e9/tb.dev.user_clk_frequency)
+        tlp_monitor = RcTlpMonitor(tb.rc)
+        dma_latency.start()
+
     tb.log.info("Init driver")
     await tb.driver.init_pcie_dev(tb.rc.find_device(tb.dev.functions[0].pcie_id))
     for interface in tb.driver.interfaces:
@@ -721,7 +758,11 @@ async def run_test_nic(dut):
     app_reg_blocks = mqnic.RegBlockList()
     await app_reg_blocks.enumerate_reg_blocks(tb.driver.app_hw_regs)
 
-    dma_bench_rb = app_reg_blocks.find(0x12348101, 0x00000100)
+    clk_info_rb = tb.driver.reg_blocks.find(mqnic.MQNIC_RB_CLK_INFO_TYPE, mqnic.MQNIC_RB_CLK_INFO_VER)
+    val = await clk_info_rb.read_dword(mqnic.MQNIC_RB_CLK_INFO_CLK_NOM_PER)
+    clk_period = (val >> 16) / (val & 0xffff)
+
+    dma_bench = DmaBench.find(app_reg_blocks, tb.driver.dev, clk_period, tb.link)
 
     mem = tb.rc.mem_pool.alloc_region(16*1024*1024)
     mem_base = mem.get_absolute_address(0)
@@ -731,33 +772,13 @@ async def run_test_nic(dut):
     # write packet data
     mem[0:1024] = bytearray([x % 256 for x in range(1024)])
 
-    # write pcie read descriptor
-    await dma_bench_rb.write_dword(0x100, (mem_base+0x0000) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x104, (mem_base+0x0000 >> 32) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x108, 0x100)
-    await dma_bench_rb.write_dword(0x110, 0x400)
-    await dma_bench_rb.write_dword(0x114, 0xAA)
-
-    await Timer(2000, 'ns')
-
-    # read status
-    val = await dma_bench_rb.read_dword(0x000118)
-    tb.log.info("Status: 0x%x", val)
-    assert val == 0x800000AA
-
-    # write pcie write descriptor
-    await dma_bench_rb.write_dword(0x200, (mem_base+0x1000) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x204, (mem_base+0x1000 >> 32) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x208, 0x100)
-    await dma_bench_rb.write_dword(0x210, 0x400)
-    await dma_bench_rb.write_dword(0x214, 0x55)
-
-    await Timer(2000, 'ns')
+    # pcie read
+    err = await dma_bench.dma_read(mem_base+0x0000, 0x100, 0x400, tag=0xAA)
+    assert err == 0
 
-    # read status
-    val = await dma_bench_rb.read_dword(0x000218)
-    tb.log.info("Status: 0x%x", val)
-    assert val == 0x80000055
+    # pcie write
+    err = await dma_bench.dma_write(mem_base+0x1000, 0x100, 0x400, tag=0x55)
+    assert err == 0
 
     tb.log.info("%s", mem.hexdump_str(0x1000, 64))
 
@@ -765,19 +786,8 @@ async def run_test_nic(dut):
 
     tb.log.info("Test immediate write")
 
-    # write pcie write descriptor
-    await dma_bench_rb.write_dword(0x200, (mem_base+0x1000) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x204, (mem_base+0x1000 >> 32) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x208, 0x44332211)
-    await dma_bench_rb.write_dword(0x210, 0x4)
-    await dma_bench_rb.write_dword(0x214, 0x800000AA)
-
-    await Timer(2000, 'ns')
-
-    # read status
-    val = await dma_bench_rb.read_dword(0x000218)
-    tb.log.info("Status: 0x%x", val)
-    assert val == 0x800000AA
+    err = await dma_bench.dma_write(mem_base+0x1000, 0, 0x4, tag=0xAA, imm=0x44332211)
+    assert err == 0
 
     tb.log.info("%s", mem.hexdump_str(0x1000, 64))
 
@@ -797,131 +807,157 @@ async def run_test_nic(dut):
     mem[src_offset:src_offset+region_len] = bytearray([x % 256 for x in range(region_len)])
 
     # disable interrupts
-    await dma_bench_rb.write_dword(0x00C, 0)
-
-    # configure operation (read)
-    # DMA base address
-    await dma_bench_rb.write_dword(0x380, (mem_base+src_offset) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x384, (mem_base+src_offset >> 32) & 0xffffffff)
-    # DMA offset address
-    await dma_bench_rb.write_dword(0x388, 0)
-    await dma_bench_rb.write_dword(0x38c, 0)
-    # DMA offset mask
-    await dma_bench_rb.write_dword(0x390, region_len-1)
-    await dma_bench_rb.write_dword(0x394, 0)
-    # DMA stride
-    await dma_bench_rb.write_dword(0x398, block_stride)
-    await dma_bench_rb.write_dword(0x39c, 0)
-    # RAM base address
-    await dma_bench_rb.write_dword(0x3c0, 0)
-    await dma_bench_rb.write_dword(0x3c4, 0)
-    # RAM offset address
-    await dma_bench_rb.write_dword(0x3c8, 0)
-    await dma_bench_rb.write_dword(0x3cc, 0)
-    # RAM offset mask
-    await dma_bench_rb.write_dword(0x3d0, region_len-1)
-    await dma_bench_rb.write_dword(0x3d4, 0)
-    # RAM stride
-    await dma_bench_rb.write_dword(0x3d8, block_stride)
-    await dma_bench_rb.write_dword(0x3dc, 0)
-    # clear cycle count
-    await dma_bench_rb.write_dword(0x308, 0)
-    await dma_bench_rb.write_dword(0x30c, 0)
-    # block length
-    await dma_bench_rb.write_dword(0x310, block_size)
-    # block count
-    await dma_bench_rb.write_dword(0x318, block_count)
-    await dma_bench_rb.write_dword(0x31c, 0)
-    # start
-    await dma_bench_rb.write_dword(0x300, 1)
-
-    for k in range(10):
-        cnt = await dma_bench_rb.read_dword(0x318)
-        await Timer(1000, 'ns')
-        if cnt == 0:
-            break
-
-    # configure operation (write)
-    # DMA base address
-    await dma_bench_rb.write_dword(0x480, (mem_base+dest_offset) & 0xffffffff)
-    await dma_bench_rb.write_dword(0x484, (mem_base+dest_offset >> 32) & 0xffffffff)
-    # DMA offset address
-    await dma_bench_rb.write_dword(0x488, 0)
-    await dma_bench_rb.write_dword(0x48c, 0)
-    # DMA offset mask
-    await dma_bench_rb.write_dword(0x490, region_len-1)
-    await dma_bench_rb.write_dword(0x494, 0)
-    # DMA stride
-    await dma_bench_rb.write_dword(0x498, block_stride)
-    await dma_bench_rb.write_dword(0x49c, 0)
-    # RAM base address
-    await dma_bench_rb.write_dword(0x4c0, 0)
-    await dma_bench_rb.write_dword(0x4c4, 0)
-    # RAM offset address
-    await dma_bench_rb.write_dword(0x4c8, 0)
-    await dma_bench_rb.write_dword(0x4cc, 0)
-    # RAM offset mask
-    await dma_bench_rb.write_dword(0x4d0, region_len-1)
-    await dma_bench_rb.write_dword(0x4d4, 0)
-    # RAM stride
-    await dma_bench_rb.write_dword(0x4d8, block_stride)
-    await dma_bench_rb.write_dword(0x4dc, 0)
-    # clear cycle count
-    await dma_bench_rb.write_dword(0x408, 0)
-    await dma_bench_rb.write_dword(0x40c, 0)
-    # block length
-    await dma_bench_rb.write_dword(0x410, block_size)
-    # block count
-    await dma_bench_rb.write_dword(0x418, block_count)
-    await dma_bench_rb.write_dword(0x41c, 0)
-    # start
-    await dma_bench_rb.write_dword(0x400, 1)
-
-    for k in range(10):
-        cnt = await dma_bench_rb.read_dword(0x418)
-        await Timer(1000, 'ns')
-        if cnt == 0:
-            break
+    await dma_bench.set_interrupts(False, False)
+
+    cycles = await dma_bench.run_block(mem_base+src_offset, block_size, block_count, write=False,
+        dma_offset_mask=region_len-1, dma_stride=block_stride,
+        ram_offset_mask=region_len-1, ram_stride=block_stride)
+    tb.log.info("Block read: %d bytes in %d cycles", block_size*block_count, cycles)
+
+    cycles = await dma_bench.run_block(mem_base+dest_offset, block_size, block_count, write=True,
+        dma_offset_mask=region_len-1, dma_stride=block_stride,
+        ram_offset_mask=region_len-1, ram_stride=block_stride)
+    tb.log.info("Block write: %d bytes in %d cycles", block_size*block_count, cycles)
 
     tb.log.info("%s", mem.hexdump_str(dest_offset, region_len))
 
     assert mem[src_offset:src_offset+region_len] == mem[dest_offset:dest_offset+region_len]
 
+    if dma_latency is not None:
+        tb.log.info("DMA latency (directed tests)")
+
+        dma_snap = dma_latency.snapshot(clear=True)
+        tlp_snap = tlp_monitor.snapshot(clear=True)
+        dma_latency.log_snapshot(dma_snap)
+        log_correlation(tb.log, correlate(dma_snap, tlp_snap))
+
+    # MPS/MRRS x size x op sweep; slow, so opt-in
+    if bool(int(os.getenv("DMA_BENCH_SWEEP", "0"))):
+        tb.log.info("DMA bandwidth sweep")
+
+        rows = await dma_bench.sweep(mem_base, region_len=0x10000,
+            block_sizes=[64, 256, 1024, 4096],
+            block_counts=[32],
+            pcie_configs=[(128, 512), (256, 512), (256, 1024)])
+
+        await dma_bench.set_pcie_config(256, 512)
+
+        fields = LINK_SWEEP_FIELDS if tb.link is not None else SWEEP_FIELDS
+
+        tb.log.info("DMA bandwidth sweep results:\n%s", format_table(rows, fields))
+
+        with open("dma_bench_sweep.csv", 'w') as f:
+            f.write(format_csv(rows, fields))
+
+        if tb.link is not None:
+            for row in rows:
+                if row['gbytes_per_sec'] >= 0.9*row['link_peak_gbytes_per_sec']:
+                    tb.log.info("%s %d B (MPS %d): PCIe-bound (%.3f of %.3f GB/s)", row['op'], row['block_size'],
+                        row['mps'], row['gbytes_per_sec'], row['link_peak_gbytes_per_sec'])
+
+            tb.link.log_stats()
+
+        if dma_latency is not None:
+            tb.log.info("DMA latency (bandwidth sweep)")
+
+            dma_snap = dma_latency.snapshot(clear=True)
+            tlp_snap = tlp_monitor.snapshot(clear=True)
+            dma_latency.log_snapshot(dma_snap)
+            log_correlation(tb.log, correlate(dma_snap, tlp_snap))
+
+    # host memory latency models x 256 KB reads; slow, so opt-in
+    if bool(int(os.getenv("HOST_MEM_BENCH", "0"))):
+        tb.log.info("Host memory latency and IOMMU")
+
+        # 64 pages against a 16 entry IOTLB, so every block misses with 4 KB
+        # pages and nearly every block hits with 2 MB pages
+        hm_region_len = 0x40000
+        hm_block_size = 4096
+        hm_block_count = 64
+
+        hm_configs = [
+            ("none", None, None),
+            ("fixed", fixed_latency(400), None),
+            ("numa", numa_latency(400, 700), None),
+            ("jitter", jittered_latency(400, 100), None),
+            ("iotlb 4K", fixed_latency(400), Iotlb(entries=16, page_size=4096, miss_ns=1000)),
+            ("iotlb 2M", fixed_latency(400), Iotlb(entries=16, page_size=2*1024*1024, miss_ns=1000)),
+        ]
+
+        hm_rows = []
+
+        for name, latency, iotlb in hm_configs:
+            tb.host_mem.configure(latency, iotlb)
+            tb.host_mem.enabled = latency is not None or iotlb is not None
+            tb.host_mem.clear_stats()
+
+            row = await dma_bench.measure(mem_base, hm_block_size, hm_block_count, write=False,
+                region_len=hm_region_len)
+            row['model'] = name
+            row['host_mem'] = tb.host_mem.get_stats()
+            hm_rows.append(row)
+
+            tb.log.info("%s: %.3f GB/s, latency %.1f ns", name, row['gbytes_per_sec'], row['latency_ns'])
+            if tb.host_mem.enabled:
+                tb.host_mem.log_stats(row['host_mem'])
+
+        tb.host_mem.enabled = False
+
+        base_row = hm_rows[0]
+        miss_row = hm_rows[4]
+        hit_row = hm_rows[5]
+
+        assert miss_row['host_mem']['iotlb']['misses'] >= hm_region_len // 4096
+        assert hit_row['host_mem']['iotlb']['misses'] <= 2
+        assert miss_row['latency_ns'] > base_row['latency_ns']
+
+        # outstanding reads needed to hold the unloaded rate across the slowest
+        # request seen, by Little's law
+        mrrs = 128 << tb.rc.max_read_request_size
+        for row in hm_rows[1:]:
+            service = row['host_mem']['rd_service_ns']['max']
+            depth = required_read_depth(base_row['gbytes_per_sec'], service, mrrs)
+            tb.log.info("%s: %.3f GB/s needs %d outstanding %d B reads to hide %.1f ns",
+                row['model'], base_row['gbytes_per_sec'], depth, mrrs, service)
+
     tb.log.info("Test DRAM channels")
 
-    index = 0
-    while True:
-        dram_test_rb = app_reg_blocks.find(0x12348102, 0x00000100, index)
-        index = index+1
+    dram_channels = await DramTestCh.find_all(app_reg_blocks, clk_period, poll_interval=1000)
 
-        if not dram_test_rb:
-            break
+    dram_rows = []
 
+    for ch in dram_channels:
         # configure FIFO
-        await dram_test_rb.write_dword(0x48, (16*2**20)-1)
-        await dram_test_rb.write_dword(0x4C, 0x00000000)
+        await ch.reset()
+        await ch.set_fifo(16*2**20)
 
-        # reset FIFO and data generator/checker
-        await dram_test_rb.write_dword(0x20, 0x00000002)
-        await dram_test_rb.write_dword(0x20, 0x00000202)
+        # enable data generation and checking
+        row = await ch.run(1024, 1024, 16*2**20)
+        tb.log.info("DRAM channel %d: %d cycles, %.3f Gbps, %d errors", ch.index,
+            row['cycles'], row['write_gbps'], row['errors'])
+        assert row['errors'] == 0
 
-        await Timer(100, 'ns')
+        await Timer(1000, 'ns')
 
-        # enable FIFO
-        await dram_test_rb.write_dword(0x20, 0x00000001)
+    # fill/drain/stream across all channels; slow, so opt-in
+    if dram_channels and bool(int(os.getenv("DRAM_BENCH", "0"))):
+        tb.log.info("DRAM channel bandwidth benchmark")
 
-        # enable data generation and checking
-        await dram_test_rb.write_dword(0x68, 1024)
-        await dram_test_rb.write_dword(0x6C, 1024)
-        await dram_test_rb.write_dword(0x24, 0x00000101)
+        fifo_size = 64*1024
+        words = fifo_size // dram_channels[0].word_bytes
 
-        # wait for transfer to complete
-        while True:
-            val = await dram_test_rb.read_dword(0x24)
-            if val == 0:
-                break
+        for ch in dram_channels:
+            await ch.reset()
+            await ch.set_fifo(fifo_size)
 
-        await Timer(1000, 'ns')
+        # fill all channels, drain all channels, then stream through all channels
+        for write_words, read_words in [(words, 0), (0, words), (words, words)]:
+            dram_rows += await run_parallel(dram_channels, write_words, read_words, fifo_size)
+
+        tb.log.info("DRAM channel bandwidth:\n%s", format_dram_table(dram_rows))
+
+        for row in dram_rows:
+            assert row['errors'] == 0
 
     tb.log.info("Read statistics counters")
 
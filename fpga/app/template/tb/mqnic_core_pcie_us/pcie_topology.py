@@ -0,0 +1 @@
+../../../../common/tb/pcie_topology.py
\ No newline at end of file
@@ -27,6 +27,8 @@ import argparse
 import asyncio
 import configparser
 import datetime
+import hashlib
+import json
 import os
 import re
 import shlex
@@ -69,6 +71,116 @@ async def run_cmd_shell_async(cmd, cwd=None):
     return None
 
 
+def parse_makefile_files(makefile):
+    # collect file lists (SYN_FILES, XDC_FILES, etc.) from a design Makefile
+    files = []
+
+    with open(makefile, 'r') as f:
+        text = f.read().replace("\\\n", " ")
+
+    for line in text.splitlines():
+        m = re.match(r"\s*([A-Z_]+_FILES)\s*[+:]?=\s*(.*)$", line)
+        if not m:
+            continue
+        for p in m.group(2).split('#', 1)[0].split():
+            if '$' in p:
+                continue
+            files.append(p)
+
+    return files
+
+
+def get_mem_total():
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    return None
+
+
+def get_proc_tree_rss(pid):
+    # total resident set size of a process and all of its descendants
+    children = {}
+    rss = {}
+    page_size = os.sysconf('SC_PAGE_SIZE')
+
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/stat", 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            ppid = int(fields[1])
+            rss[int(d)] = int(fields[21])*page_size
+            children.setdefault(ppid, []).append(int(d))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    total = 0
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        total += rss.get(p, 0)
+        stack.extend(children.get(p, []))
+
+    return total
+
+
+class MemoryPool:
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.count = 0
+        self.cond = asyncio.Condition()
+
+    async def acquire(self, amount):
+        async with self.cond:
+            # always admit one job, even if its estimate exceeds the limit
+            await self.cond.wait_for(lambda: self.count == 0 or self.used + amount <= self.limit)
+            self.used += amount
+            self.count += 1
+
+    async def release(self, amount):
+        async with self.cond:
+            self.used -= amount
+            self.count -= 1
+            self.cond.notify_all()
+
+
+class BuildState:
+    def __init__(self, filename):
+        self.filename = filename
+        self.designs = {}
+
+    def load(self):
+        if not self.filename or not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as f:
+                self.designs = json.load(f).get('designs', {})
+        except (OSError, ValueError):
+            print(f"Failed to read state file {self.filename}, starting fresh")
+            self.designs = {}
+
+    def save(self):
+        if not self.filename:
+            return
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'designs': self.designs}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+    def get(self, key):
+        return self.designs.get(key, {})
+
+    def update(self, key, **kwargs):
+        self.designs.setdefault(key, {}).update(kwargs)
+        self.save()
+
+
 class Build:
     def __init__(self, design, build_dir, prefix, output):
         self.design = design
@@ -92,8 +204,110 @@ class Build:
         self.wns = None
         self.tns = None
 
+        self.version_cmd = None
+        self.source_hash = None
+        self.mem_estimate = None
+        self.mem_peak = 0
+
+        self.mem_pool = None
+        self.state = None
+
         self.phase = "Idle"
 
+    @property
+    def key(self):
+        return f"{type(self).__name__}:{'/'.join(self.design)}"
+
+    def get_source_files(self):
+        files = [os.path.join(self.build_dir, "Makefile")]
+
+        common_dir = os.path.join(self.build_dir, "..", "common")
+        if os.path.isdir(common_dir):
+            files.extend(os.path.join(common_dir, f) for f in os.listdir(common_dir) if f.endswith(".mk"))
+
+        config_mk = os.path.join(self.build_dir, "..", "config.mk")
+        if os.path.isfile(config_mk):
+            files.append(config_mk)
+
+        for p in parse_makefile_files(os.path.join(self.build_dir, "Makefile")):
+            # same rule as *_FILES_REL in the tool makefiles
+            if p.startswith('/') or p.startswith('./'):
+                files.append(os.path.join(self.build_dir, p))
+            else:
+                files.append(os.path.join(self.build_dir, "..", p))
+
+        return sorted(set(os.path.normpath(f) for f in files))
+
+    def compute_hash(self, tool_version, revision=""):
+        h = hashlib.sha256()
+        h.update(tool_version.encode('utf-8'))
+        h.update(self.build_cmd.encode('utf-8'))
+        # the git hash and tag are embedded in the bitstream by config.tcl,
+        # so a cached output is only valid for the same revision
+        h.update(revision.encode('utf-8'))
+
+        for fn in self.get_source_files():
+            h.update(os.path.relpath(fn, self.build_dir).encode('utf-8'))
+            try:
+                with open(fn, 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+            except OSError:
+                h.update(b"missing")
+
+        self.source_hash = h.hexdigest()
+        return self.source_hash
+
+    async def get_tool_version(self):
+        if not self.version_cmd:
+            return ""
+
+        cmd = self.version_cmd
+        if self.settings_file:
+            cmd = f"source {self.settings_file}; {cmd}"
+
+        ver = await run_cmd_shell_async("bash -c " + shlex.quote(cmd))
+        return f"{self.settings_file}\n{ver or ''}"
+
+    @property
+    def history_duration(self):
+        if self.state is None:
+            return None
+        return self.state.get(self.key).get('duration')
+
+    async def check_cache(self):
+        # skip the build if the sources, tool version and git revision match
+        # the last successful build and its output is still around
+        rec = self.state.get(self.key)
+
+        if rec.get('hash') != self.source_hash or rec.get('status') != "done":
+            return False
+
+        dest = os.path.abspath(os.path.join(self.output, self.outname+self.output_ext))
+
+        if os.path.isfile(dest):
+            pass
+        elif rec.get('output') and os.path.isfile(rec['output']):
+            await run_cmd_async("cp", "-p", rec['output'], dest)
+            await run_cmd_async("zip", self.outname+".zip", self.outname+self.output_ext, cwd=self.output)
+        elif os.path.isfile(self.output_file):
+            await run_cmd_async("cp", "-p", self.output_file, dest)
+            await run_cmd_async("zip", self.outname+".zip", self.outname+self.output_ext, cwd=self.output)
+        else:
+            return False
+
+        self.state.update(self.key, output=dest)
+
+        self.wns = rec.get('wns')
+        self.tns = rec.get('tns')
+        self.phase = "Cached"
+        self.elapsed_time = datetime.timedelta(0)
+        return True
+
+    async def monitor_mem(self, pid):
+        while True:
+            self.mem_peak = max(self.mem_peak, get_proc_tree_rss(pid))
+            await asyncio.sleep(5)
+
     def get_status(self):
         s = f"{'/'.join(self.design)}: {self.phase}"
 
@@ -117,14 +331,29 @@ class Build:
             self.build_sem.release()
             self.build_sem = None
 
-    async def run(self, build_sem, synth_sem):
+    async def mem_done(self):
+        if self.mem_pool is not None:
+            await self.mem_pool.release(self.mem_estimate)
+            self.mem_pool = None
+
+    async def run(self, build_sem, synth_sem, mem_pool=None, state=None):
         self.build_sem = build_sem
         self.synth_sem = synth_sem
+        self.state = state
+
+        if self.state is not None and self.source_hash is not None:
+            if await self.check_cache():
+                return
 
         self.phase = "Waiting (build)"
         if self.build_sem is not None:
             await self.build_sem.acquire()
 
+        self.phase = "Waiting (memory)"
+        if mem_pool is not None:
+            await mem_pool.acquire(self.mem_estimate)
+            self.mem_pool = mem_pool
+
         self.phase = "Waiting (synth)"
         if self.synth_sem is not None:
             await self.synth_sem.acquire()
@@ -144,25 +373,50 @@ class Build:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE)
 
+        if self.state is not None:
+            self.state.update(self.key, status="running", hash=self.source_hash)
+
+        mem_task = asyncio.create_task(self.monitor_mem(proc.pid))
+
         await asyncio.gather(
             self.process_stream(proc.stdout),
             self.process_stream(proc.stderr),
         )
 
+        await proc.wait()
+        mem_task.cancel()
+
         self.synth_done()
+        await self.mem_done()
         self.build_done()
 
-        if os.path.isfile(self.output_file):
+        if proc.returncode == 0 and os.path.isfile(self.output_file):
+            dest = os.path.abspath(os.path.join(self.output, self.outname+self.output_ext))
             self.phase = "Copying output file"
-            await run_cmd_async("cp", "-p", self.output_file, os.path.join(self.output, self.outname+self.output_ext))
+            await run_cmd_async("cp", "-p", self.output_file, dest)
             self.phase = "Zipping output file"
             await run_cmd_async("zip", self.outname+".zip", self.outname+self.output_ext, cwd=self.output)
             self.phase = "Done"
         else:
+            dest = None
             self.phase = "Failed"
 
         self.elapsed_time = datetime.datetime.now() - self.start_time
 
+        if self.state is not None:
+            rec = {
+                'status': "done" if dest else "failed",
+                'hash': self.source_hash,
+                'output': dest,
+                'wns': self.wns,
+                'tns': self.tns,
+            }
+            if dest:
+                rec['duration'] = self.elapsed_time.total_seconds()
+            if self.mem_peak:
+                rec['mem_peak'] = self.mem_peak
+            self.state.update(self.key, **rec)
+
     async def process_stream(self, stream):
         while True:
             line = await stream.readline()
@@ -182,6 +436,7 @@ class VivadoBuild(Build):
 
         self.settings_file = config['vivado'].get('settings_file')
         self.build_cmd = "make"
+        self.version_cmd = "vivado -version"
 
         self.output_ext = ".bit"
         self.output_file = os.path.join(self.build_dir, "fpga"+self.output_ext)
@@ -222,6 +477,7 @@ class IseBuild(Build):
 
         self.settings_file = config['ise'].get('settings_file')
         self.build_cmd = "make"
+        self.version_cmd = "xst -help | head -n 1"
 
         self.output_ext = ".bit"
         self.output_file = os.path.join(self.build_dir, "fpga"+self.output_ext)
@@ -248,6 +504,7 @@ class QuartusBuild(Build):
 
         self.settings_file = config['quartus'].get('settings_file')
         self.build_cmd = "make"
+        self.version_cmd = "quartus_sh --version"
 
         self.output_ext = ".sof"
         self.output_file = os.path.join(self.build_dir, "fpga"+self.output_ext)
@@ -310,6 +567,10 @@ async def main():
     parser.add_argument('--clean', action='store_true', help="Clean")
     parser.add_argument('--parallel', type=int, default=config['general'].getint('parallel', 8), help="Parallel build runs")
     parser.add_argument('--synth_parallel', type=int, default=config['general'].getint('synth_parallel', 8), help="Parallel synthesis runs")
+    parser.add_argument('--mem_limit', type=float, default=config['general'].getfloat('mem_limit', 0), help="Memory budget for concurrent builds (GB, default 90% of RAM)")
+    parser.add_argument('--mem_per_build', type=float, default=config['general'].getfloat('mem_per_build', 16), help="Memory estimate for builds without history (GB)")
+    parser.add_argument('--state', type=str, default=config['general'].get('state_file', 'build_images_state.json'), help="Build state file")
+    parser.add_argument('--force', action='store_true', help="Rebuild designs even if unchanged")
 
     args = parser.parse_args()
 
@@ -378,6 +639,62 @@ async def main():
 
     print(f"Found {len(jobs)} design variants")
 
+    state = None
+
+    if not args.clean:
+        state = BuildState(os.path.abspath(args.state))
+        state.load()
+
+        if args.force:
+            # keep history for scheduling, drop cached results
+            for rec in state.designs.values():
+                rec.pop('hash', None)
+                rec.pop('status', None)
+
+        print("Hashing sources...")
+
+        # same values config.tcl embeds as GIT_HASH and RELEASE_INFO
+        revision = run_cmd(["git", "rev-parse", "--short=8", "HEAD"]) + "\n" + \
+            run_cmd(["git", "describe", "--tags", "HEAD"])
+
+        tool_versions = {}
+
+        for job in jobs:
+            cls = type(job)
+            if cls not in tool_versions:
+                tool_versions[cls] = await job.get_tool_version()
+            job.compute_hash(tool_versions[cls], revision)
+
+        mem_default = int(args.mem_per_build*2**30)
+
+        for job in jobs:
+            job.state = state
+            rec = state.get(job.key)
+            if rec.get('mem_peak'):
+                job.mem_estimate = int(rec['mem_peak']*1.1)
+            else:
+                job.mem_estimate = mem_default
+
+        # longest first; designs without history go first as they may be long
+        jobs.sort(key=lambda job: -job.history_duration if job.history_duration is not None else float('-inf'))
+
+        done = sum(1 for job in jobs if state.get(job.key).get('hash') == job.source_hash and state.get(job.key).get('status') == "done")
+        print(f"{done} of {len(jobs)} designs unchanged since last successful build")
+
+    mem_pool = None
+
+    if not args.clean:
+        if args.mem_limit:
+            mem_limit = int(args.mem_limit*2**30)
+        else:
+            mem_limit = get_mem_total()
+            if mem_limit:
+                mem_limit = int(mem_limit*0.9)
+
+        if mem_limit:
+            print(f"Memory budget: {mem_limit/2**30:.1f} GB")
+            mem_pool = MemoryPool(mem_limit)
+
     print("Building...")
 
     os.makedirs(output_dir, exist_ok=True)
@@ -391,7 +708,7 @@ async def main():
         if args.clean:
             job.build_cmd = "make clean"
 
-        job_coros.append(asyncio.create_task(job.run(build_sem, synth_sem)))
+        job_coros.append(asyncio.create_task(job.run(build_sem, synth_sem, mem_pool, state)))
 
     status = asyncio.create_task(monitor_status(jobs))
 
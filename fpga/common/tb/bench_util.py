@@ -0,0 +1,50 @@
+# SPDX-License-Identifier: BSD-2-Clause-Views
+# Copyright (c) 2021-2023 The Regents of the University of California
+
+import csv
+import io
+
+
+async def read_qword(rb, addr):
+    lo = await rb.read_dword(addr)
+    hi = await rb.read_dword(addr+4)
+    return lo | (hi << 32)
+
+
+async def write_qword(rb, addr, val):
+    await rb.write_dword(addr, val & 0xffffffff)
+    await rb.write_dword(addr+4, (val >> 32) & 0xffffffff)
+
+
+async def read_counter(rb, addr):
+    # 64-bit free-running counter; read hi/lo/hi and retry if the low
+    # half carried between the reads
+    hi = await rb.read_dword(addr+4)
+    while True:
+        lo = await rb.read_dword(addr)
+        hi2 = await rb.read_dword(addr+4)
+        if hi2 == hi:
+            return lo | (hi << 32)
+        hi = hi2
+
+
+def format_table(rows, fields, width=14):
+    lines = [" ".join(f"{f:>{width}}" for f in fields)]
+    for row in rows:
+        vals = []
+        for f in fields:
+            v = row.get(f)
+            if isinstance(v, float):
+                vals.append(f"{v:>{width}.3f}")
+            else:
+                vals.append(f"{str(v):>{width}}")
+        lines.append(" ".join(vals))
+    return "\n".join(lines)
+
+
+def format_csv(rows, fields):
+    f = io.StringIO()
+    w = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore', lineterminator='\n')
+    w.writeheader()
+    w.writerows(rows)
+    return f.getvalue()
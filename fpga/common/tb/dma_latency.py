@@ -0,0 +1,255 @@
+# SPDX-License-Identifier: BSD-2-Clause-Views
+# Copyright (c) 2021-2023 The Regents of the University of California
+
+import cocotb
+from cocotb.log import SimLog
+from cocotb.triggers import RisingEdge
+from cocotb.utils import get_sim_time
+
+from cocotbext.pcie.core.tlp import TlpType
+
+
+# stats_dma_latency instances in stats_dma_if_pcie
+DMA_LATENCY_CHANNELS = {
+    'rd_op': "stats_dma_latency_rd_op_inst",
+    'rd_req': "stats_dma_latency_rd_req_inst",
+    'wr_op': "stats_dma_latency_wr_op_inst",
+    'wr_req': "stats_dma_latency_wr_req_inst",
+}
+
+TLP_MEM_READ = {TlpType.MEM_READ, TlpType.MEM_READ_64}
+TLP_MEM_WRITE = {TlpType.MEM_WRITE, TlpType.MEM_WRITE_64}
+TLP_CPL = {TlpType.CPL, TlpType.CPL_DATA, TlpType.CPL_LOCKED, TlpType.CPL_LOCKED_DATA}
+
+
+def percentile(sorted_values, p):
+    # nearest rank
+    if not sorted_values:
+        return 0
+    k = max(int(-(-p*len(sorted_values) // 100))-1, 0)
+    return sorted_values[min(k, len(sorted_values)-1)]
+
+
+def latency_summary(values, scale=1.0):
+    v = sorted(values)
+    return {
+        'count': len(v),
+        'mean': sum(v)/len(v)*scale if v else 0.0,
+        'p50': percentile(v, 50)*scale,
+        'p99': percentile(v, 99)*scale,
+        'p99.9': percentile(v, 99.9)*scale,
+        'max': (v[-1] if v else 0)*scale,
+    }
+
+
+def histogram(values, bin_width):
+    bins = {}
+    for v in values:
+        b = (v // bin_width)*bin_width
+        bins[b] = bins.get(b, 0)+1
+    return sorted(bins.items())
+
+
+class DmaLatencyCollector:
+    def __init__(self, inst, clk, clk_period=4.0):
+        self.log = SimLog("cocotb.dma_latency")
+        self.clk = clk
+        self.clk_period = clk_period
+
+        self.channels = {name: getattr(inst, path) for name, path in DMA_LATENCY_CHANNELS.items()}
+        self.samples = {name: [] for name in self.channels}
+
+        self._run_cr = None
+
+    def start(self):
+        if self._run_cr is None:
+            self._run_cr = cocotb.start_soon(self._run())
+
+    def stop(self):
+        if self._run_cr is not None:
+            self._run_cr.kill()
+            self._run_cr = None
+
+    def clear(self):
+        for s in self.samples.values():
+            s.clear()
+
+    async def _run(self):
+        chs = list(self.channels.items())
+        while True:
+            await RisingEdge(self.clk)
+            for name, ch in chs:
+                if ch.out_valid.value.integer:
+                    self.samples[name].append((ch.out_latency.value.integer, ch.out_len.value.integer,
+                        ch.out_status.value.integer, get_sim_time('ns'), ch.out_tag.value.integer))
+
+    def snapshot(self, clear=False):
+        snap = {}
+        for name, samples in self.samples.items():
+            lat = [s[0] for s in samples]
+            snap[name] = {
+                'cycles': latency_summary(lat),
+                'ns': latency_summary(lat, self.clk_period),
+                'bytes': sum(s[1] for s in samples),
+                'errors': sum(1 for s in samples if s[2]),
+                # (tag, latency ns, finish time ns) for pairing with host-side samples
+                'samples': [(s[4], s[0]*self.clk_period, s[3]) for s in samples],
+            }
+        if clear:
+            self.clear()
+        return snap
+
+    def histogram(self, name, bin_cycles=16):
+        return histogram([s[0] for s in self.samples[name]], bin_cycles)
+
+    def log_snapshot(self, snap):
+        self.log.info("%-7s %8s %10s %10s %10s %10s %10s %8s", "channel", "count",
+            "mean ns", "p50 ns", "p99 ns", "p99.9 ns", "max ns", "errors")
+        for name, st in snap.items():
+            ns = st['ns']
+            self.log.info("%-7s %8d %10.1f %10.1f %10.1f %10.1f %10.1f %8d", name, ns['count'],
+                ns['mean'], ns['p50'], ns['p99'], ns['p99.9'], ns['max'], st['errors'])
+
+
+class RcTlpMonitor:
+    def __init__(self, rc):
+        self.log = SimLog("cocotb.dma_latency")
+        self.rc = rc
+
+        self.clear()
+
+        # requests from the device arrive through the RX TLP handlers,
+        # completions to the device go out through send()
+        for fmt_type in list(rc.rx_tlp_handler):
+            rc.rx_tlp_handler[fmt_type] = self._wrap_rx(rc.rx_tlp_handler[fmt_type])
+
+        self._send = rc.send
+        rc.send = self._tx
+
+    def clear(self):
+        self.mem_rd = 0
+        self.mem_rd_dw = 0
+        self.mem_wr = 0
+        self.mem_wr_dw = 0
+        self.cpl = 0
+        self.cpl_dw = 0
+        self.rd_service = []
+        self._pending = {}
+
+    def _wrap_rx(self, handler):
+        async def wrapper(tlp):
+            if tlp.fmt_type in TLP_MEM_READ:
+                self.mem_rd += 1
+                self.mem_rd_dw += tlp.length
+                self._pending[(tlp.requester_id, tlp.tag)] = [get_sim_time('ns'), tlp.get_be_byte_count()]
+            elif tlp.fmt_type in TLP_MEM_WRITE:
+                self.mem_wr += 1
+                self.mem_wr_dw += tlp.length
+            await handler(tlp)
+        return wrapper
+
+    async def _tx(self, tlp):
+        await self._send(tlp)
+        if tlp.fmt_type in TLP_CPL:
+            self.cpl += 1
+            self.cpl_dw += tlp.length
+            key = (tlp.requester_id, tlp.tag)
+            if key in self._pending:
+                pending = self._pending[key]
+                if tlp.fmt_type in (TlpType.CPL_DATA, TlpType.CPL_LOCKED_DATA):
+                    # byte count is what remains including this completion,
+                    # the first DW may start partway through
+                    pending[1] = tlp.byte_count - min(tlp.byte_count, tlp.length*4 - (tlp.lower_address & 3))
+                else:
+                    # completion without data ends the request
+                    pending[1] = 0
+                if pending[1] <= 0:
+                    t = get_sim_time('ns')
+                    self.rd_service.append((tlp.requester_id, tlp.tag, t, t - pending[0]))
+                    del self._pending[key]
+
+    def snapshot(self, clear=False):
+        snap = {
+            'mem_rd': self.mem_rd,
+            'mem_rd_bytes': self.mem_rd_dw*4,
+            'mem_wr': self.mem_wr,
+            'mem_wr_bytes': self.mem_wr_dw*4,
+            'cpl': self.cpl,
+            'cpl_bytes': self.cpl_dw*4,
+            'rd_service_ns': latency_summary([s[3] for s in self.rd_service]),
+            'rd_service': list(self.rd_service),
+        }
+        if clear:
+            self.clear()
+        return snap
+
+
+def pair_rd_req(dev_samples, host_samples, requester_id=None):
+    """Pair device-side read request samples with host-side service times
+
+    Both sides see the same PCIe tag, and a tag is only reused once its
+    request has completed, so the n-th device sample for a tag goes with
+    the n-th host sample for that tag.  Returns (tag, device ns, host ns)
+    tuples and the number of device samples left unpaired.
+    """
+    host = {}
+    for rid, tag, t, service in host_samples:
+        if requester_id is None or rid == requester_id:
+            host.setdefault(tag, []).append((t, service))
+
+    pairs = []
+    unpaired = 0
+    idx = {}
+
+    for tag, latency, t in sorted(dev_samples, key=lambda s: s[2]):
+        q = host.get(tag, [])
+        k = idx.get(tag, 0)
+        # the host finishes a request before the device sees it complete
+        if k < len(q) and q[k][0] <= t:
+            pairs.append((tag, latency, q[k][1]))
+            idx[tag] = k+1
+        else:
+            unpaired += 1
+
+    return pairs, unpaired
+
+
+def correlate(dma_snap, tlp_snap, requester_id=None):
+    # relate device-side DMA latency to the TLP traffic seen at the root complex
+    rd_op = dma_snap['rd_op']['ns']['count']
+    rd_req = dma_snap['rd_req']['ns']['count']
+    wr_op = dma_snap['wr_op']['ns']['count']
+
+    res = {
+        'rd_req_per_op': tlp_snap['mem_rd']/rd_op if rd_op else 0.0,
+        'cpl_per_rd_req': tlp_snap['cpl']/tlp_snap['mem_rd'] if tlp_snap['mem_rd'] else 0.0,
+        'rd_req_bytes': tlp_snap['mem_rd_bytes']/tlp_snap['mem_rd'] if tlp_snap['mem_rd'] else 0.0,
+        'wr_tlp_per_op': tlp_snap['mem_wr']/wr_op if wr_op else 0.0,
+        'wr_tlp_bytes': tlp_snap['mem_wr_bytes']/tlp_snap['mem_wr'] if tlp_snap['mem_wr'] else 0.0,
+        'rd_req_unmatched': tlp_snap['mem_rd']-rd_req,
+    }
+
+    # whatever the host does not account for is spent in the link and the
+    # PCIe IP on the way out and back; take it per request, as the two
+    # distributions need not line up rank for rank
+    pairs, unpaired = pair_rd_req(dma_snap['rd_req']['samples'], tlp_snap['rd_service'], requester_id)
+
+    res['rd_req_paired'] = len(pairs)
+    res['rd_req_unpaired'] = unpaired
+    res['rd_req_dev_ns'] = dma_snap['rd_req']['ns']
+    res['rd_req_host_ns'] = tlp_snap['rd_service_ns']
+    res['rd_req_link_ns'] = latency_summary([dev - host for tag, dev, host in pairs])
+
+    return res
+
+
+def log_correlation(log, res):
+    log.info("Read requests per op: %.2f, completions per request: %.2f, bytes per request: %.1f",
+        res['rd_req_per_op'], res['cpl_per_rd_req'], res['rd_req_bytes'])
+    log.info("Write TLPs per op: %.2f, bytes per write TLP: %.1f",
+        res['wr_tlp_per_op'], res['wr_tlp_bytes'])
+    log.info("Read requests paired by tag: %d, unpaired: %d", res['rd_req_paired'], res['rd_req_unpaired'])
+    log.info("%-12s %10s %10s %10s %10s", "read req", "p50 ns", "p99 ns", "p99.9 ns", "max ns")
+    for name, key in (("device", 'rd_req_dev_ns'), ("host", 'rd_req_host_ns'), ("outside host", 'rd_req_link_ns')):
+        st = res[key]
+        log.info("%-12s %10.1f %10.1f %10.1f %10.1f", name, st['p50'], st['p99'], st['p99.9'], st['max'])
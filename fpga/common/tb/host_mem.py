@@ -0,0 +1,209 @@
+# SPDX-License-Identifier: BSD-2-Clause-Views
+# Copyright (c) 2021-2023 The Regents of the University of California
+
+import math
+import random
+from collections import OrderedDict
+
+import cocotb
+from cocotb.log import SimLog
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from cocotbext.pcie.core.tlp import TlpType
+
+try:
+    from dma_latency import latency_summary
+except ImportError:
+    from .dma_latency import latency_summary
+
+
+# latency distributions, called with the request address, return ns
+
+def fixed_latency(latency_ns):
+    return lambda addr: latency_ns
+
+
+def numa_latency(local_ns, remote_ns, node_count=2, local_node=0, interleave=4096):
+    # memory interleaved across nodes, only one of which is local to the device
+    return lambda addr: local_ns if (addr // interleave) % node_count == local_node else remote_ns
+
+
+def jittered_latency(base_ns, jitter_ns, seed=1):
+    # fixed base with an exponential tail
+    rng = random.Random(seed)
+    return lambda addr: base_ns + rng.expovariate(1/jitter_ns)
+
+
+def required_read_depth(gbytes_per_sec, latency_ns, request_size):
+    # outstanding read requests needed to sustain a rate over a latency
+    return math.ceil(gbytes_per_sec*latency_ns/request_size)
+
+
+class Iotlb:
+    """IOTLB with LRU replacement
+
+    Entries become valid when their page walk completes, so requests that
+    miss on a page with a walk in flight wait for that walk.
+    """
+    def __init__(self, entries=64, page_size=4096, hit_ns=0, miss_ns=500):
+        self.entries = entries
+        self.page_size = page_size
+        self.hit_ns = hit_ns
+        self.miss_ns = miss_ns
+
+        self.tlb = OrderedDict()
+
+        self.clear_stats()
+
+    def flush(self):
+        self.tlb.clear()
+
+    def clear_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.walk_waits = 0
+
+    def translate(self, addr, length, now):
+        # returns the translation cost in ns; pages are looked up in parallel
+        cost = 0
+        page = addr // self.page_size
+        last = (addr+max(length, 1)-1) // self.page_size
+
+        while page <= last:
+            ready = self.tlb.get(page)
+            if ready is None:
+                self.misses += 1
+                ready = now+self.miss_ns
+                self.tlb[page] = ready
+                if len(self.tlb) > self.entries:
+                    self.tlb.popitem(last=False)
+            else:
+                self.tlb.move_to_end(page)
+                if ready > now:
+                    self.walk_waits += 1
+                else:
+                    self.hits += 1
+            cost = max(cost, ready-now, self.hit_ns)
+            page += 1
+
+        return cost
+
+    def get_stats(self):
+        total = self.hits+self.misses+self.walk_waits
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'walk_waits': self.walk_waits,
+            'miss_rate': self.misses/total if total else 0.0,
+        }
+
+
+class HostMemModel:
+    """Latency and address translation for DMA to the root complex memory pool
+
+    Reads are delayed by the memory latency plus the translation cost,
+    writes by the translation cost only.  Writes complete in order, and
+    reads do not pass earlier writes.
+    """
+    def __init__(self, rc, latency=None, iotlb=None, pool=None):
+        self.log = SimLog("cocotb.host_mem")
+
+        self.rc = rc
+        self.pool = pool or rc.mem_pool
+        self.base = self.pool.get_absolute_address(0)
+        self.size = self.pool.size
+
+        self.latency = latency
+        self.iotlb = iotlb
+        self.enabled = True
+
+        self._last_write = None
+
+        self.clear_stats()
+
+        for fmt_type in (TlpType.MEM_READ, TlpType.MEM_READ_64):
+            rc.rx_tlp_handler[fmt_type] = self._wrap_read(rc.rx_tlp_handler[fmt_type])
+        for fmt_type in (TlpType.MEM_WRITE, TlpType.MEM_WRITE_64):
+            rc.rx_tlp_handler[fmt_type] = self._wrap_write(rc.rx_tlp_handler[fmt_type])
+
+    def configure(self, latency=None, iotlb=None):
+        self.latency = latency
+        self.iotlb = iotlb
+
+    def clear_stats(self):
+        self.rd_delay = []
+        self.rd_service = []
+        self.wr_delay = []
+        if self.iotlb:
+            self.iotlb.clear_stats()
+
+    def _active(self, tlp):
+        return self.enabled and self.base <= tlp.address < self.base+self.size
+
+    def _delay(self, tlp, read):
+        addr = tlp.address
+        delay = 0
+        if self.iotlb:
+            delay += self.iotlb.translate(addr, tlp.length*4, get_sim_time('ns'))
+        if read and self.latency:
+            delay += self.latency(addr)
+        return int(round(delay))
+
+    def _wrap_read(self, handler):
+        async def wrapper(tlp):
+            if not self._active(tlp):
+                await handler(tlp)
+                return
+            cocotb.start_soon(self._read(handler, tlp, self._last_write))
+        return wrapper
+
+    def _wrap_write(self, handler):
+        async def wrapper(tlp):
+            if not self._active(tlp):
+                await handler(tlp)
+                return
+            self._last_write = cocotb.start_soon(self._write(handler, tlp, self._last_write))
+        return wrapper
+
+    async def _read(self, handler, tlp, prev):
+        start = get_sim_time('ns')
+        delay = self._delay(tlp, True)
+        if delay:
+            await Timer(delay, 'ns')
+        if prev is not None and not prev.done():
+            await prev
+        await handler(tlp)
+        self.rd_delay.append(delay)
+        self.rd_service.append(get_sim_time('ns')-start)
+
+    async def _write(self, handler, tlp, prev):
+        delay = self._delay(tlp, False)
+        if delay:
+            await Timer(delay, 'ns')
+        if prev is not None and not prev.done():
+            await prev
+        await handler(tlp)
+        self.wr_delay.append(delay)
+
+    def get_stats(self):
+        stats = {
+            'rd_delay_ns': latency_summary(self.rd_delay),
+            'rd_service_ns': latency_summary(self.rd_service),
+            'wr_delay_ns': latency_summary(self.wr_delay),
+        }
+        if self.iotlb:
+            stats['iotlb'] = self.iotlb.get_stats()
+        return stats
+
+    def log_stats(self, stats=None):
+        if stats is None:
+            stats = self.get_stats()
+        for name in ('rd_delay_ns', 'rd_service_ns', 'wr_delay_ns'):
+            st = stats[name]
+            self.log.info("%-13s %6d requests, mean %.1f ns, p50 %.1f ns, p99 %.1f ns, max %.1f ns",
+                name, st['count'], st['mean'], st['p50'], st['p99'], st['max'])
+        if 'iotlb' in stats:
+            st = stats['iotlb']
+            self.log.info("IOTLB: %d hits, %d misses, %d walk waits (miss rate %.3f)",
+                st['hits'], st['misses'], st['walk_waits'], st['miss_rate'])
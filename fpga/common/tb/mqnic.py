@@ -8,8 +8,10 @@ import cocotb
 from cocotb.log import SimLog
 from cocotb.queue import Queue
 from cocotb.triggers import Event, Edge, RisingEdge
+from cocotb.utils import get_sim_time
 
 from cocotbext.axi import Window
+from cocotbext.pcie.core.caps import PciCapId
 
 import struct
 
@@ -17,6 +19,15 @@ MQNIC_MAX_EQ   = 1
 MQNIC_MAX_TXQ  = 32
 MQNIC_MAX_RXQ  = 8
 MQNIC_MAX_CQ   = MQNIC_MAX_TXQ*2
+MQNIC_MAX_IRQ  = 32
+
+# MSI-X table entries
+MSIX_ENTRY_SIZE       = 16
+MSIX_ENTRY_ADDR_LO    = 0x00
+MSIX_ENTRY_ADDR_HI    = 0x04
+MSIX_ENTRY_DATA       = 0x08
+MSIX_ENTRY_CTRL       = 0x0C
+MSIX_ENTRY_CTRL_MASK  = 0x00000001
 
 # Register blocks
 MQNIC_RB_REG_TYPE      = 0x00
@@ -252,6 +263,12 @@ MQNIC_RB_SCHED_RR_REG_CH_STRIDE  = 0x14
 MQNIC_RB_SCHED_RR_REG_CTRL       = 0x18
 MQNIC_RB_SCHED_RR_REG_DEST       = 0x1C
 
+MQNIC_SCHED_RR_QUEUE_EN         = (1 << 0)
+MQNIC_SCHED_RR_QUEUE_GLOBAL_EN  = (1 << 1)
+MQNIC_SCHED_RR_QUEUE_SCHED_EN   = (1 << 2)
+MQNIC_SCHED_RR_QUEUE_ACTIVE     = (1 << 16)
+MQNIC_SCHED_RR_QUEUE_SCHEDULED  = (1 << 24)
+
 MQNIC_RB_SCHED_CTRL_TDMA_TYPE           = 0x0000C050
 MQNIC_RB_SCHED_CTRL_TDMA_VER            = 0x00000100
 MQNIC_RB_SCHED_CTRL_TDMA_REG_OFFSET     = 0x0C
@@ -282,6 +299,10 @@ MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_NS     = 0x54
 MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_SEC_L  = 0x58
 MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_SEC_H  = 0x5C
 
+MQNIC_TDMA_SCH_CTRL_EN        = (1 << 0)
+MQNIC_TDMA_SCH_STATUS_LOCKED  = (1 << 0)
+MQNIC_TDMA_SCH_STATUS_ERROR   = (1 << 1)
+
 MQNIC_RB_APP_INFO_TYPE    = 0x0000C005
 MQNIC_RB_APP_INFO_VER     = 0x00000200
 MQNIC_RB_APP_INFO_REG_ID  = 0x0C
@@ -447,7 +468,21 @@ class Packet:
         return bytes(self.data)
 
 
-class Eq:
+class BaseRing:
+    # EQ, CQ, and TX/RX queue blocks share the control register and command
+    # encoding, so the ring pointers are set the same way for all of them
+
+    async def set_ptrs(self, prod_ptr, cons_ptr):
+        self.prod_ptr = prod_ptr
+        self.cons_ptr = cons_ptr
+
+        await self.hw_regs.write_dword(MQNIC_QUEUE_CTRL_STATUS_REG, MQNIC_QUEUE_CMD_SET_ENABLE | 0)
+        await self.hw_regs.write_dword(MQNIC_QUEUE_CTRL_STATUS_REG, MQNIC_QUEUE_CMD_SET_PROD_PTR | (self.prod_ptr & MQNIC_QUEUE_PTR_MASK))
+        await self.hw_regs.write_dword(MQNIC_QUEUE_CTRL_STATUS_REG, MQNIC_QUEUE_CMD_SET_CONS_PTR | (self.cons_ptr & MQNIC_QUEUE_PTR_MASK))
+        await self.hw_regs.write_dword(MQNIC_QUEUE_CTRL_STATUS_REG, MQNIC_QUEUE_CMD_SET_ENABLE | int(self.enabled))
+
+
+class Eq(BaseRing):
     def __init__(self, interface):
         self.interface = interface
         self.log = interface.log
@@ -497,6 +532,7 @@ class Eq:
         self.cons_ptr = 0
 
         self.irq = irq
+        self.driver.irq_eq.setdefault(irq, []).append(self)
 
         self.cq_table = {}
 
@@ -521,6 +557,7 @@ class Eq:
 
         # TODO free buffer
 
+        self.driver.irq_eq[self.irq].remove(self)
         self.irq = None
 
         self.enabled = False
@@ -549,6 +586,9 @@ class Eq:
 
         await self.hw_regs.write_dword(MQNIC_EQ_CTRL_STATUS_REG, MQNIC_EQ_CMD_SET_ARM | 1)
 
+        if self.driver.msix:
+            self.driver.msix.arm(self.irq)
+
     async def process_eq(self):
         if not self.interface.port_up:
             return
@@ -580,7 +620,7 @@ class Eq:
         await self.write_cons_ptr()
 
 
-class Cq:
+class Cq(BaseRing):
     def __init__(self, interface):
         self.interface = interface
         self.log = interface.log
@@ -678,7 +718,7 @@ class Cq:
         await self.hw_regs.write_dword(MQNIC_CQ_CTRL_STATUS_REG, MQNIC_CQ_CMD_SET_ARM | 1)
 
 
-class Txq:
+class Txq(BaseRing):
     def __init__(self, interface):
         self.interface = interface
         self.log = interface.log
@@ -860,7 +900,7 @@ class Txq:
         ring.clean_event.set()
 
 
-class Rxq:
+class Rxq(BaseRing):
     def __init__(self, interface):
         self.interface = interface
         self.log = interface.log
@@ -1102,19 +1142,363 @@ class SchedulerRoundRobin(BaseScheduler):
     def __init__(self, port, index, rb):
         super().__init__(port, index, rb)
 
+        self.ch_count = None
+        self.ch_stride = None
+
     async def init(self):
         offset = await self.rb.read_dword(MQNIC_RB_SCHED_RR_REG_OFFSET)
         self.hw_regs = self.rb.parent.create_window(offset)
 
+        self.ch_count = await self.rb.read_dword(MQNIC_RB_SCHED_RR_REG_CH_COUNT)
+        self.ch_stride = await self.rb.read_dword(MQNIC_RB_SCHED_RR_REG_CH_STRIDE)
+
+    async def enable(self):
+        await self.rb.write_dword(MQNIC_RB_SCHED_RR_REG_CTRL, 0x00000001)
+
+    async def disable(self):
+        await self.rb.write_dword(MQNIC_RB_SCHED_RR_REG_CTRL, 0x00000000)
+
+    async def is_enabled(self):
+        return bool(await self.rb.read_dword(MQNIC_RB_SCHED_RR_REG_CTRL) & 1)
+
+    async def set_dest(self, dest):
+        await self.rb.write_dword(MQNIC_RB_SCHED_RR_REG_DEST, dest)
+
+    async def get_queue_ctrl(self, queue):
+        return await self.hw_regs.read_dword(queue*self.ch_stride)
+
+    async def set_queue_ctrl(self, queue, val):
+        await self.hw_regs.write_dword(queue*self.ch_stride, val)
+
+    async def enable_queue(self, queue, global_enable=True):
+        val = MQNIC_SCHED_RR_QUEUE_EN
+        if global_enable:
+            val |= MQNIC_SCHED_RR_QUEUE_GLOBAL_EN
+        await self.set_queue_ctrl(queue, val)
+
+    async def disable_queue(self, queue):
+        await self.set_queue_ctrl(queue, 0)
+
+    async def pause_queue(self, queue):
+        # clearing the enable bit stops service but keeps the active
+        # state, so doorbells rung while paused are not lost
+        val = await self.get_queue_ctrl(queue)
+        await self.set_queue_ctrl(queue, val & MQNIC_SCHED_RR_QUEUE_GLOBAL_EN)
+
+    async def resume_queue(self, queue):
+        val = await self.get_queue_ctrl(queue)
+        await self.set_queue_ctrl(queue, (val & MQNIC_SCHED_RR_QUEUE_GLOBAL_EN) | MQNIC_SCHED_RR_QUEUE_EN)
+
+    async def get_queue_status(self, queue):
+        val = await self.get_queue_ctrl(queue)
+        return {
+            'enabled': bool(val & MQNIC_SCHED_RR_QUEUE_EN),
+            'global_enable': bool(val & MQNIC_SCHED_RR_QUEUE_GLOBAL_EN),
+            'sched_enable': bool(val & MQNIC_SCHED_RR_QUEUE_SCHED_EN),
+            'active': bool(val & MQNIC_SCHED_RR_QUEUE_ACTIVE),
+            'scheduled': bool(val & MQNIC_SCHED_RR_QUEUE_SCHEDULED),
+        }
+
 
 class SchedulerControlTdma(BaseScheduler):
     def __init__(self, port, index, rb):
         super().__init__(port, index, rb)
 
+        self.ch_count = None
+        self.ch_stride = None
+        self.ts_count = None
+
     async def init(self):
         offset = await self.rb.read_dword(MQNIC_RB_SCHED_CTRL_TDMA_REG_OFFSET)
         self.hw_regs = self.rb.parent.create_window(offset)
 
+        self.ch_count = await self.rb.read_dword(MQNIC_RB_SCHED_CTRL_TDMA_REG_CH_COUNT)
+        self.ch_stride = await self.rb.read_dword(MQNIC_RB_SCHED_CTRL_TDMA_REG_CH_STRIDE)
+        self.ts_count = await self.rb.read_dword(MQNIC_RB_SCHED_CTRL_TDMA_REG_TS_COUNT)
+
+    async def get_queue_timeslots(self, queue):
+        mask = 0
+        for k in range(self.ch_stride // 4):
+            mask |= await self.hw_regs.read_dword(queue*self.ch_stride + k*4) << (k*32)
+        return [ts for ts in range(self.ts_count) if mask & (1 << ts)]
+
+    async def set_queue_timeslots(self, queue, timeslots):
+        mask = 0
+        for ts in timeslots:
+            assert 0 <= ts < self.ts_count
+            mask |= 1 << ts
+        for k in range(self.ch_stride // 4):
+            await self.hw_regs.write_dword(queue*self.ch_stride + k*4, (mask >> (k*32)) & 0xffffffff)
+
+    async def set_queue_weights(self, weights, ts_count=None):
+        # tx_scheduler_rr has no weight registers; approximate weights
+        # by giving each queue a proportional share of the timeslots
+        if ts_count is None:
+            ts_count = self.ts_count
+        slots = SchedulerModel.allocate_timeslots(weights, ts_count)
+        for q in range(len(weights)):
+            await self.set_queue_timeslots(q, slots[q])
+        return slots
+
+
+class TdmaScheduler:
+    def __init__(self, block, rb):
+        self.block = block
+        self.log = block.log
+        self.rb = rb
+
+        self.ts_count = None
+
+    async def init(self):
+        self.ts_count = await self.rb.read_dword(MQNIC_RB_TDMA_SCH_REG_TS_COUNT)
+
+    async def enable(self):
+        await self.rb.write_dword(MQNIC_RB_TDMA_SCH_REG_CTRL, MQNIC_TDMA_SCH_CTRL_EN)
+
+    async def disable(self):
+        await self.rb.write_dword(MQNIC_RB_TDMA_SCH_REG_CTRL, 0)
+
+    async def get_status(self):
+        return await self.rb.read_dword(MQNIC_RB_TDMA_SCH_REG_STATUS)
+
+    async def is_locked(self):
+        return bool(await self.get_status() & MQNIC_TDMA_SCH_STATUS_LOCKED)
+
+    async def _write_time(self, reg, ns, fns=0):
+        sec = ns // 1000000000
+        await self.rb.write_dword(reg+0x0, fns & 0xffff)
+        await self.rb.write_dword(reg+0x4, ns % 1000000000)
+        await self.rb.write_dword(reg+0x8, sec & 0xffffffff)
+        await self.rb.write_dword(reg+0xC, (sec >> 32) & 0xffff)
+
+    async def set_schedule_start(self, ns, fns=0):
+        await self._write_time(MQNIC_RB_TDMA_SCH_REG_SCH_START_FNS, ns, fns)
+
+    async def set_schedule_period(self, ns, fns=0):
+        await self._write_time(MQNIC_RB_TDMA_SCH_REG_SCH_PERIOD_FNS, ns, fns)
+
+    async def set_timeslot_period(self, ns, fns=0):
+        await self._write_time(MQNIC_RB_TDMA_SCH_REG_TS_PERIOD_FNS, ns, fns)
+
+    async def set_active_period(self, ns, fns=0):
+        await self._write_time(MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_FNS, ns, fns)
+
+    async def configure(self, timeslot_period, active_period, timeslot_count, start=None):
+        await self.set_schedule_period(timeslot_period*timeslot_count)
+        await self.set_timeslot_period(timeslot_period)
+        await self.set_active_period(active_period)
+        if start is not None:
+            await self.set_schedule_start(start)
+        await self.enable()
+
+
+class SchedulerModel:
+    # tx_scheduler_rr serves one transmit request per eligible queue per
+    # round; the only other control is TDMA timeslot gating
+    def __init__(self, queue_count):
+        self.queue_count = queue_count
+        self.enabled = [False]*queue_count
+        self.timeslots = None
+        self.active_fraction = 1.0
+
+    @classmethod
+    async def from_block(cls, block, active_fraction=1.0):
+        # build the model from the queue enables and timeslot masks
+        # currently programmed in a scheduler block
+        model = cls(len(block.interface.txq))
+
+        rr = block.schedulers[0]
+        for q in range(min(model.queue_count, rr.ch_count)):
+            if await rr.get_queue_ctrl(q) & MQNIC_SCHED_RR_QUEUE_EN:
+                model.enable_queue(q)
+
+        for sched in block.schedulers[1:]:
+            if isinstance(sched, SchedulerControlTdma):
+                slots = [[] for q in range(model.queue_count)]
+                for q in range(min(model.queue_count, sched.ch_count)):
+                    slots[q] = await sched.get_queue_timeslots(q)
+                model.set_timeslots(slots, active_fraction)
+                break
+
+        return model
+
+    def enable_queue(self, queue):
+        self.enabled[queue] = True
+
+    def disable_queue(self, queue):
+        self.enabled[queue] = False
+
+    def set_timeslots(self, timeslots, active_fraction=1.0):
+        self.timeslots = timeslots
+        self.active_fraction = active_fraction
+
+    @staticmethod
+    def allocate_timeslots(weights, ts_count):
+        total = sum(weights)
+        assert total > 0 and ts_count >= len([w for w in weights if w])
+
+        # largest remainder allocation, at least one slot per weighted queue
+        share = [w*ts_count/total for w in weights]
+        count = [max(int(s), 1) if w else 0 for s, w in zip(share, weights)]
+        order = sorted(range(len(weights)), key=lambda q: share[q]-int(share[q]), reverse=True)
+        k = 0
+        while sum(count) < ts_count:
+            if weights[order[k % len(order)]]:
+                count[order[k % len(order)]] += 1
+            k += 1
+        while sum(count) > ts_count:
+            q = max((q for q in range(len(count)) if count[q] > 1), key=lambda q: count[q]-share[q])
+            count[q] -= 1
+
+        # interleave slots so each queue's share is spread across the schedule
+        slots = [[] for w in weights]
+        credit = [0.0]*len(weights)
+        for ts in range(ts_count):
+            for q in range(len(weights)):
+                credit[q] += count[q]
+            q = max(range(len(weights)), key=lambda q: credit[q])
+            credit[q] -= ts_count
+            slots[q].append(ts)
+        return slots
+
+    def expected_share(self, backlogged=None):
+        if backlogged is None:
+            backlogged = range(self.queue_count)
+        queues = [q for q in backlogged if self.enabled[q]]
+
+        if self.timeslots is None:
+            # round robin: equal share between backlogged queues
+            return {q: 1/len(queues) for q in queues}
+
+        # TDMA gating: queues share their own slots, plus round robin
+        # between queues that hold the same slot
+        ts_count = max((max(s) for s in self.timeslots if s), default=-1)+1
+        service = {q: 0.0 for q in queues}
+        for ts in range(ts_count):
+            owners = [q for q in queues if ts in self.timeslots[q]]
+            for q in owners:
+                service[q] += self.active_fraction/len(owners)
+        total = sum(service.values())
+        if not total:
+            return {q: 0.0 for q in queues}
+        return {q: service[q]/total for q in queues}
+
+    def service_order(self, backlog):
+        # expected transmit order for a set of per-queue backlogs, given as
+        # a dict mapping queue index to packet count
+        backlog = {q: n for q, n in backlog.items() if self.enabled[q] and n}
+        order = []
+        while backlog:
+            for q in sorted(backlog):
+                order.append(q)
+                backlog[q] -= 1
+            backlog = {q: n for q, n in backlog.items() if n}
+        return order
+
+    @staticmethod
+    def jain_index(values):
+        values = list(values)
+        if not values:
+            return 1.0
+        s = sum(values)
+        s2 = sum(x*x for x in values)
+        if not s2:
+            return 1.0
+        return s*s/(len(values)*s2)
+
+
+class SchedulerBenchmark:
+    def __init__(self, interface, queues, scheduler=None, model=None):
+        self.interface = interface
+        self.log = interface.log
+        self.queues = list(queues)
+        self.scheduler = scheduler or interface.sched_blocks[0].schedulers[0]
+        self.model = model
+
+        if self.model is None:
+            self.model = SchedulerModel(len(interface.txq))
+            for q in self.queues:
+                self.model.enable_queue(q)
+
+        self.results = None
+
+    async def run(self, count, size=256):
+        # hold off the scheduler while the backlog is posted so that
+        # every queue is backlogged when service starts
+        await self.scheduler.disable()
+
+        post_time = {}
+        for k in range(count):
+            for q in self.queues:
+                data = bytearray([(x+k) % 256 for x in range(size)])
+                struct.pack_into('>HL', data, 14, q, k)
+                post_time[(q, k)] = get_sim_time('ns')
+                await self.interface.start_xmit(data, q)
+
+        await self.interface.driver.hw_regs.read_dword(0)
+        start_time = get_sim_time('ns')
+        await self.scheduler.enable()
+
+        rx = []
+        for k in range(count*len(self.queues)):
+            pkt = await self.interface.recv()
+            q, seq = struct.unpack_from('>HL', pkt.data, 14)
+            rx.append((q, seq, len(pkt.data), get_sim_time('ns')))
+
+        self.results = self.analyze(rx, post_time, start_time)
+        self.log_results()
+        return self.results
+
+    def analyze(self, rx, post_time, start_time):
+        # only the window where every queue is still backlogged says
+        # anything about fairness
+        last = {}
+        for k, (q, seq, length, t) in enumerate(rx):
+            last[q] = k
+        window = min(last.values())+1 if last else 0
+
+        stats = {q: {'packets': 0, 'bytes': 0, 'hol_latency': []} for q in self.queues}
+        prev = {}
+        for k, (q, seq, length, t) in enumerate(rx):
+            st = stats[q]
+            if k < window:
+                st['packets'] += 1
+                st['bytes'] += length
+            # time spent at the head of its queue before being sent
+            head = max(post_time[(q, seq)], start_time, prev.get(q, start_time))
+            st['hol_latency'].append(t-head)
+            prev[q] = t
+
+        total = sum(st['bytes'] for st in stats.values())
+        duration = rx[window-1][3]-start_time if window else 0
+        expected = self.model.expected_share(self.queues)
+
+        for q, st in stats.items():
+            lat = st['hol_latency']
+            st['share'] = st['bytes']/total if total else 0.0
+            st['expected_share'] = expected.get(q, 0.0)
+            st['gbps'] = st['bytes']*8/duration if duration else 0.0
+            st['hol_latency_mean'] = sum(lat)/len(lat) if lat else 0.0
+            st['hol_latency_max'] = max(lat) if lat else 0.0
+
+        return {
+            'queues': stats,
+            'window': window,
+            'duration': duration,
+            'gbps': total*8/duration if duration else 0.0,
+            'jain': SchedulerModel.jain_index(st['bytes']/expected[q] if expected.get(q) else 0.0 for q, st in stats.items()),
+            'order': [q for q, seq, length, t in rx],
+        }
+
+    def log_results(self):
+        res = self.results
+        self.log.info("Scheduler benchmark: %d queues, %d packets in fair window, %.3f Gbps aggregate, Jain index %.4f",
+            len(self.queues), res['window'], res['gbps'], res['jain'])
+        self.log.info("%5s %8s %8s %8s %10s %12s %12s", "queue", "packets", "share", "expect", "Gbps", "HOL mean ns", "HOL max ns")
+        for q, st in res['queues'].items():
+            self.log.info("%5d %8d %8.4f %8.4f %10.3f %12.1f %12.1f", q, st['packets'], st['share'],
+                st['expected_share'], st['gbps'], st['hol_latency_mean'], st['hol_latency_max'])
+
 
 class SchedulerBlock:
     def __init__(self, interface, index, rb):
@@ -1129,6 +1513,7 @@ class SchedulerBlock:
         self.sched_count = None
 
         self.schedulers = []
+        self.tdma_sch = None
 
     async def init(self):
         # Read ID registers
@@ -1137,6 +1522,7 @@ class SchedulerBlock:
         await self.reg_blocks.enumerate_reg_blocks(self.block_rb.parent, offset)
 
         self.schedulers = []
+        self.tdma_sch = None
 
         self.sched_count = 0
         for rb in self.reg_blocks:
@@ -1152,6 +1538,9 @@ class SchedulerBlock:
                 self.schedulers.append(s)
 
                 self.sched_count += 1
+            elif rb.type == MQNIC_RB_TDMA_SCH_TYPE and rb.version == MQNIC_RB_TDMA_SCH_VER:
+                self.tdma_sch = TdmaScheduler(self, rb)
+                await self.tdma_sch.init()
 
         self.log.info("Scheduler count: %d", self.sched_count)
 
@@ -1314,7 +1703,7 @@ class Interface:
         self.log.info("EQ count: %d", count)
         self.log.info("EQ stride: 0x%08x", stride)
 
-        count = min(count, MQNIC_MAX_EQ)
+        count = min(count, self.driver.max_eq)
 
         self.eq_res = Resource(count, self.hw_regs.create_window(offset), stride)
 
@@ -1411,7 +1800,7 @@ class Interface:
         self.eq = []
         for k in range(self.eq_res.get_count()):
             eq = Eq(self)
-            await eq.open(self.index, 1024)
+            await eq.open(self.driver.get_eq_irq(self, k), 1024)
             self.eq.append(eq)
             await eq.arm()
 
@@ -1581,11 +1970,166 @@ class Interface:
             await self.pkt_rx_sync.wait()
 
 
+class Checkpoint:
+    # host side state of one Driver; the RTL state is not captured, so a
+    # checkpoint is only valid for the driver and simulation run it came from
+    def __init__(self, driver):
+        self.driver = driver
+        self.sim_time = None
+        self.host_mem = []
+        self.queues = []
+        self.free_packets = []
+        self.port_up = []
+
+
+class MsixTable:
+    """MSI-X table and PBA of a device, with per-vector interrupt accounting"""
+    def __init__(self, dev):
+        self.dev = dev
+        self.log = SimLog("cocotb.mqnic")
+
+        self.table_size = 0
+        self.table_regs = None
+        self.pba_regs = None
+
+        self.affinity = {}
+
+        self.clear_stats()
+
+    async def init(self):
+        msg_ctrl = await self.dev.capability_read_dword(PciCapId.MSIX, 0)
+        table_offset = await self.dev.capability_read_dword(PciCapId.MSIX, 4)
+        pba_offset = await self.dev.capability_read_dword(PciCapId.MSIX, 8)
+
+        self.table_size = ((msg_ctrl >> 16) & 0x7ff) + 1
+
+        self.table_regs = self.dev.bar_window[table_offset & 0x7].create_window(
+            table_offset & ~0x7, self.table_size*MSIX_ENTRY_SIZE)
+        self.pba_regs = self.dev.bar_window[pba_offset & 0x7].create_window(
+            pba_offset & ~0x7, (self.table_size+63)//64*8)
+
+        self.log.info("MSI-X table size: %d", self.table_size)
+
+    async def read_entry(self, vec):
+        base = vec*MSIX_ENTRY_SIZE
+        addr = await self.table_regs.read_dword(base+MSIX_ENTRY_ADDR_LO)
+        addr |= await self.table_regs.read_dword(base+MSIX_ENTRY_ADDR_HI) << 32
+        data = await self.table_regs.read_dword(base+MSIX_ENTRY_DATA)
+        ctrl = await self.table_regs.read_dword(base+MSIX_ENTRY_CTRL)
+        return addr, data, ctrl
+
+    async def set_mask(self, vec, mask=True):
+        base = vec*MSIX_ENTRY_SIZE
+        ctrl = await self.table_regs.read_dword(base+MSIX_ENTRY_CTRL)
+        if mask:
+            ctrl |= MSIX_ENTRY_CTRL_MASK
+        else:
+            ctrl &= ~MSIX_ENTRY_CTRL_MASK
+        self.unmask_time[vec] = None if mask else get_sim_time('ns')
+        await self.table_regs.write_dword(base+MSIX_ENTRY_CTRL, ctrl)
+        # flush
+        await self.table_regs.read_dword(base+MSIX_ENTRY_CTRL)
+
+    async def mask(self, vec):
+        await self.set_mask(vec, True)
+
+    async def unmask(self, vec):
+        await self.set_mask(vec, False)
+
+    async def is_masked(self, vec):
+        ctrl = await self.table_regs.read_dword(vec*MSIX_ENTRY_SIZE+MSIX_ENTRY_CTRL)
+        return bool(ctrl & MSIX_ENTRY_CTRL_MASK)
+
+    async def set_function_mask(self, mask=True):
+        msg_ctrl = await self.dev.capability_read_dword(PciCapId.MSIX, 0)
+        if mask:
+            msg_ctrl |= 1 << 30
+        else:
+            msg_ctrl &= ~(1 << 30)
+        await self.dev.capability_write_dword(PciCapId.MSIX, 0, msg_ctrl)
+
+    async def read_pba(self):
+        val = 0
+        for k in range(self.pba_regs.size // 4):
+            val |= await self.pba_regs.read_dword(k*4) << (k*32)
+        return val
+
+    async def is_pending(self, vec):
+        val = await self.pba_regs.read_dword((vec // 32)*4)
+        return bool(val & (1 << (vec % 32)))
+
+    def set_affinity(self, vec, cpu):
+        self.affinity[vec] = cpu
+
+    def clear_stats(self):
+        self.irq_time = {}
+        self.service_time = {}
+        self.arm_latency = {}
+        self.unmask_latency = {}
+        self.arm_time = {}
+        self.unmask_time = {}
+        self.stats_start = get_sim_time('ns')
+
+    def arm(self, vec):
+        self.arm_time[vec] = get_sim_time('ns')
+
+    def record(self, vec, irq_time):
+        # irq_time is when the MSI-X write arrived, now is when the handler ran
+        now = get_sim_time('ns')
+        self.irq_time.setdefault(vec, []).append(irq_time)
+        self.service_time.setdefault(vec, []).append(now-irq_time)
+
+        t = self.arm_time.pop(vec, None)
+        if t is not None and t <= irq_time:
+            self.arm_latency.setdefault(vec, []).append(irq_time-t)
+
+        t = self.unmask_time.get(vec)
+        if t is not None and t <= irq_time:
+            self.unmask_latency.setdefault(vec, []).append(irq_time-t)
+            self.unmask_time[vec] = None
+
+    def get_vector_stats(self, vec):
+        times = self.irq_time.get(vec, [])
+        elapsed = get_sim_time('ns')-self.stats_start
+        gaps = [b-a for a, b in zip(times, times[1:])]
+        arm = self.arm_latency.get(vec, [])
+        service = self.service_time.get(vec, [])
+        return {
+            'count': len(times),
+            'rate_mhz': len(times)*1e3/elapsed if elapsed else 0.0,
+            'min_gap_ns': min(gaps) if gaps else None,
+            'mean_gap_ns': sum(gaps)/len(gaps) if gaps else None,
+            'mean_arm_latency_ns': sum(arm)/len(arm) if arm else None,
+            'max_arm_latency_ns': max(arm) if arm else None,
+            'mean_service_ns': sum(service)/len(service) if service else None,
+            'unmask_latency_ns': list(self.unmask_latency.get(vec, [])),
+            'cpu': self.affinity.get(vec, 0),
+        }
+
+    def get_stats(self):
+        return {vec: self.get_vector_stats(vec) for vec in sorted(self.irq_time)}
+
+    def get_cpu_stats(self):
+        cpus = {}
+        for vec, times in self.irq_time.items():
+            cpu = self.affinity.get(vec, 0)
+            cpus[cpu] = cpus.get(cpu, 0)+len(times)
+        return cpus
+
+    def log_stats(self, stats=None):
+        if stats is None:
+            stats = self.get_stats()
+        for vec, st in stats.items():
+            self.log.info("MSI-X vector %d (CPU %d): %d interrupts, %.3f MHz, min gap %s ns, mean arm latency %s ns",
+                vec, st['cpu'], st['count'], st['rate_mhz'], st['min_gap_ns'], st['mean_arm_latency_ns'])
+
+
 class Interrupt:
     def __init__(self, index, handler=None):
         self.index = index
         self.queue = Queue()
         self.handler = handler
+        self.irq_time = None
 
         cocotb.start_soon(self._run())
 
@@ -1597,11 +2141,11 @@ class Interrupt:
         return obj
 
     async def interrupt(self):
-        self.queue.put_nowait(None)
+        self.queue.put_nowait(get_sim_time('ns'))
 
     async def _run(self):
         while True:
-            await self.queue.get()
+            self.irq_time = await self.queue.get()
             if self.handler:
                 await self.handler(self.index)
 
@@ -1624,6 +2168,11 @@ class Driver:
 
         self.irq_sig = None
         self.irq_list = []
+        self.irq_count = 0
+        self.irq_eq = {}
+        self.msix = None
+
+        self.max_eq = MQNIC_MAX_EQ
 
         self.reg_blocks = RegBlockList()
         self.fw_id_rb = None
@@ -1657,24 +2206,28 @@ class Driver:
         self.allocated_packets = []
         self.free_packets = deque()
 
-    async def init_pcie_dev(self, dev):
+    async def init_pcie_dev(self, dev, pool=None):
         assert not self.initialized
         self.initialized = True
 
         self.dev = dev
 
-        self.pool = self.dev.rc.mem_pool
+        self.pool = pool or self.dev.rc.mem_pool
 
         await self.dev.enable_device()
         await self.dev.set_master()
-        await self.dev.alloc_irq_vectors(1, MQNIC_MAX_EQ)
+        self.irq_count = await self.dev.alloc_irq_vectors(1, MQNIC_MAX_IRQ)
 
         self.hw_regs = self.dev.bar_window[0]
         self.app_hw_regs = self.dev.bar_window[2]
         self.ram_hw_regs = self.dev.bar_window[4]
 
+        if self.dev.msix_enabled:
+            self.msix = MsixTable(self.dev)
+            await self.msix.init()
+
         # set up MSI
-        for index in range(32):
+        for index in range(self.irq_count):
             irq = Interrupt(index, self.interrupt_handler)
             self.dev.request_irq(index, irq.interrupt)
             self.irq_list.append(irq)
@@ -1692,6 +2245,7 @@ class Driver:
 
         # set up edge-triggered interrupts
         if irq:
+            self.irq_count = len(irq)
             for index in range(len(irq)):
                 self.irq_list.append(Interrupt(index, self.interrupt_handler))
             cocotb.start_soon(self._run_edge_interrupts(irq))
@@ -1768,15 +2322,88 @@ class Driver:
             for index in (x for x in range(count) if edge & (1 << x)):
                 await self.irq_list[index].interrupt()
 
+    def get_eq_irq(self, interface, index):
+        # one vector per EQ, wrapping around if there are more EQs than vectors
+        k = sum(i.eq_res.get_count() for i in self.interfaces if i.index < interface.index) + index
+        return k % max(self.irq_count, 1)
+
     async def interrupt_handler(self, index):
         self.log.info("Interrupt handler start (IRQ %d)", index)
-        for i in self.interfaces:
-            for eq in i.eq:
-                if eq.irq == index:
-                    await eq.process_eq()
-                    await eq.arm()
+        if self.msix:
+            self.msix.record(index, self.irq_list[index].irq_time)
+        for eq in list(self.irq_eq.get(index, [])):
+            await eq.process_eq()
+            await eq.arm()
         self.log.info("Interrupt handler end (IRQ %d)", index)
 
+    async def save_checkpoint(self):
+        # wait for all writes to complete
+        await self.hw_regs.read_dword(0)
+
+        cp = Checkpoint(self)
+        cp.sim_time = get_sim_time('ns')
+
+        for base, size, offset, region in self.pool.regions:
+            cp.host_mem.append((region, bytes(region[0:region.size])))
+
+        for i in self.interfaces:
+            cp.port_up.append(i.port_up)
+
+            for q in i.eq + [q.cq for q in i.txq + i.rxq]:
+                cp.queues.append((q, q.prod_ptr, q.cons_ptr, None))
+            for q in i.txq:
+                cp.queues.append((q, q.prod_ptr, q.cons_ptr, list(q.tx_info)))
+            for q in i.rxq:
+                cp.queues.append((q, q.prod_ptr, q.cons_ptr, list(q.rx_info)))
+
+        cp.free_packets = list(self.free_packets)
+
+        self.log.info("Saved checkpoint at %d ns (%d host memory regions, %d queues)",
+            cp.sim_time, len(cp.host_mem), len(cp.queues))
+
+        return cp
+
+    async def restore_checkpoint(self, cp):
+        if cp.driver is not self:
+            raise Exception("Checkpoint was saved by a different driver instance")
+
+        self.log.info("Restore checkpoint from %d ns", cp.sim_time)
+
+        for i in self.interfaces:
+            i.port_up = False
+
+        # stop queues before touching host memory
+        for q, prod_ptr, cons_ptr, info in cp.queues:
+            if not q.hw_regs:
+                raise Exception("Queue closed after checkpoint")
+            if info is not None:
+                await q.hw_regs.write_dword(MQNIC_QUEUE_CTRL_STATUS_REG, MQNIC_QUEUE_CMD_SET_ENABLE | 0)
+
+        # wait for all writes to complete
+        await self.hw_regs.read_dword(0)
+
+        for region, data in cp.host_mem:
+            region[0:len(data)] = data
+
+        for q, prod_ptr, cons_ptr, info in cp.queues:
+            await q.set_ptrs(prod_ptr, cons_ptr)
+            if isinstance(q, Txq):
+                q.tx_info = list(info)
+                q.clean_event.set()
+            elif isinstance(q, Rxq):
+                q.rx_info = list(info)
+            else:
+                await q.arm()
+
+        self.free_packets = deque(cp.free_packets)
+
+        # wait for all writes to complete
+        await self.hw_regs.read_dword(0)
+
+        for i, port_up in zip(self.interfaces, cp.port_up):
+            i.pkt_rx_queue.clear()
+            i.port_up = port_up
+
     def alloc_pkt(self):
         if self.free_packets:
             return self.free_packets.popleft()
@@ -0,0 +1 @@
+../pcie_topology.py
\ No newline at end of file
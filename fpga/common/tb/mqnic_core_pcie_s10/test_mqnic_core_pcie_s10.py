@@ -26,19 +26,26 @@ from cocotbext.pcie.intel.s10 import S10PcieDevice, S10RxBus, S10TxBus
 
 try:
     import mqnic
+    from pcie_topology import PcieTopology, DmaTrafficDevice, DmaTrafficDriver
 except ImportError:
     # attempt import from current directory
     sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
     try:
         import mqnic
+        from pcie_topology import PcieTopology, DmaTrafficDevice, DmaTrafficDriver
     finally:
         del sys.path[0]
 
 
 class TB(object):
-    def __init__(self, dut, msix_count=32):
+    def __init__(self, dut, msix_count=32, peer_count=None, switch=None):
         self.dut = dut
 
+        if peer_count is None:
+            peer_count = int(os.getenv("PCIE_PEER_COUNT", "0"))
+        if switch is None:
+            switch = bool(int(os.getenv("PCIE_SWITCH", "0")))
+
         self.log = SimLog("cocotb.tb")
         self.log.setLevel(logging.DEBUG)
 
@@ -192,9 +199,13 @@ class TB(object):
 
         # self.dev.log.setLevel(logging.DEBUG)
 
-        self.rc.make_port().connect(self.dev)
+        # behavioural DMA endpoints sharing the root complex with the NIC
+        self.peers = [DmaTrafficDevice() for k in range(peer_count)]
+
+        self.topology = PcieTopology(self.rc, [self.dev]+self.peers, switch=switch)
 
         self.driver = mqnic.Driver()
+        self.peer_drivers = [DmaTrafficDriver() for k in range(peer_count)]
 
         self.dev.functions[0].configure_bar(0, 2**len(dut.core_pcie_inst.axil_ctrl_araddr), ext=True, prefetch=True)
         if hasattr(dut.core_pcie_inst, 'pcie_app_ctrl'):
@@ -341,7 +352,7 @@ class TB(object):
         for ram in self.ddr_axi_if + self.ddr_axi_if:
             ram.write_if.reset.setimmediatevalue(0)
 
-        await self.rc.enumerate()
+        await self.topology.enumerate()
 
     async def _run_loopback(self):
         while True:
@@ -361,7 +372,7 @@ async def run_test_nic(dut):
     await tb.init()
 
     tb.log.info("Init driver")
-    await tb.driver.init_pcie_dev(tb.rc.find_device(tb.dev.functions[0].pcie_id))
+    await tb.topology.init_driver(tb.driver, 0)
     for interface in tb.driver.interfaces:
         await interface.open()
 
@@ -664,6 +675,39 @@ async def run_test_nic(dut):
 
         tb.loopback_enable = False
 
+    if tb.peers:
+        tb.log.info("Multi-device throughput")
+
+        for k, peer_driver in enumerate(tb.peer_drivers):
+            await tb.topology.init_driver(peer_driver, k+1, 2**21)
+            await peer_driver.start(2**20, irq_interval=16)
+
+        tb.topology.clear_stats()
+        tb.loopback_enable = True
+
+        data = bytearray([x % 256 for x in range(1024)])
+
+        for k in range(32):
+            await tb.driver.interfaces[0].start_xmit(data, 0)
+
+        for k in range(32):
+            pkt = await tb.driver.interfaces[0].recv()
+            assert pkt.data == data
+
+        tb.loopback_enable = False
+
+        for peer_driver in tb.peer_drivers:
+            await peer_driver.stop()
+
+        stats = tb.topology.get_stats()
+        tb.topology.log_stats(stats)
+
+        for d in stats['devices']:
+            assert d['wr_bytes'] > 0
+
+        for peer_driver in tb.peer_drivers:
+            assert sum(peer_driver.irq_counts) > 0
+
     tb.log.info("Read statistics counters")
 
     await Timer(2000, 'ns')
@@ -0,0 +1 @@
+../dma_latency.py
\ No newline at end of file
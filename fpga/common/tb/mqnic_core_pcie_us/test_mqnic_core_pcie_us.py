@@ -26,19 +26,28 @@ from cocotbext.pcie.xilinx.us import UltraScalePlusPcieDevice
 
 try:
     import mqnic
+    from dma_latency import DmaLatencyCollector, RcTlpMonitor, correlate, log_correlation
+    from pcie_topology import PcieTopology, DmaTrafficDevice, DmaTrafficDriver
 except ImportError:
     # attempt import from current directory
     sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
     try:
         import mqnic
+        from dma_latency import DmaLatencyCollector, RcTlpMonitor, correlate, log_correlation
+        from pcie_topology import PcieTopology, DmaTrafficDevice, DmaTrafficDriver
     finally:
         del sys.path[0]
 
 
 class TB(object):
-    def __init__(self, dut, msix_count=32):
+    def __init__(self, dut, msix_count=32, peer_count=None, switch=None):
         self.dut = dut
 
+        if peer_count is None:
+            peer_count = int(os.getenv("PCIE_PEER_COUNT", "0"))
+        if switch is None:
+            switch = bool(int(os.getenv("PCIE_SWITCH", "0")))
+
         self.log = SimLog("cocotb.tb")
         self.log.setLevel(logging.DEBUG)
 
@@ -266,9 +275,13 @@ class TB(object):
 
         # self.dev.log.setLevel(logging.DEBUG)
 
-        self.rc.make_port().connect(self.dev)
+        # behavioural DMA endpoints sharing the root complex with the NIC
+        self.peers = [DmaTrafficDevice() for k in range(peer_count)]
+
+        self.topology = PcieTopology(self.rc, [self.dev]+self.peers, switch=switch)
 
         self.driver = mqnic.Driver()
+        self.peer_drivers = [DmaTrafficDriver() for k in range(peer_count)]
 
         self.dev.functions[0].configure_bar(0, 2**len(dut.core_pcie_inst.axil_ctrl_araddr), ext=True, prefetch=True)
         if hasattr(dut.core_pcie_inst, 'pcie_app_ctrl'):
@@ -415,7 +428,7 @@ class TB(object):
         for ram in self.ddr_axi_if + self.ddr_axi_if:
             ram.write_if.reset.setimmediatevalue(0)
 
-        await self.rc.enumerate()
+        await self.topology.enumerate()
 
     async def _run_loopback(self):
         while True:
@@ -434,8 +447,16 @@ async def run_test_nic(dut):
 
     await tb.init()
 
+    # per-cycle latency sampling slows the whole test, so opt-in
+    dma_latency = None
+    if bool(int(os.getenv("DMA_LATENCY", "0"))):
+        dma_latency = DmaLatencyCollector(dut.core_pcie_inst.stats_dma_if_pcie.stats_dma_if_pcie_inst,
+            dut.clk, 1e9/tb.dev.user_clk_frequency)
+        tlp_monitor = RcTlpMonitor(tb.rc)
+        dma_latency.start()
+
     tb.log.info("Init driver")
-    await tb.driver.init_pcie_dev(tb.rc.find_device(tb.dev.functions[0].pcie_id))
+    await tb.topology.init_driver(tb.driver, 0)
     for interface in tb.driver.interfaces:
         await interface.open()
 
@@ -601,6 +622,19 @@ async def run_test_nic(dut):
 
     tb.loopback_enable = False
 
+    # 8 queues x 16 packets; slow, so opt-in
+    if bool(int(os.getenv("SCHED_BENCH", "0"))):
+        tb.log.info("Scheduler fairness benchmark")
+
+        tb.loopback_enable = True
+
+        bench = mqnic.SchedulerBenchmark(tb.driver.interfaces[0], range(min(8, len(tb.driver.interfaces[0].txq))))
+        res = await bench.run(16, 256)
+
+        assert res['jain'] > 0.9
+
+        tb.loopback_enable = False
+
     tb.log.info("Multiple large packets")
 
     count = 64
@@ -738,6 +772,87 @@ async def run_test_nic(dut):
 
         tb.loopback_enable = False
 
+    tb.log.info("MSI-X masking")
+
+    data = bytearray([x % 256 for x in range(1024)])
+
+    msix = tb.driver.msix
+    vec = tb.driver.interfaces[0].eq[0].irq
+    count = msix.get_vector_stats(vec)['count']
+
+    await msix.mask(vec)
+
+    tb.loopback_enable = True
+
+    await tb.driver.interfaces[0].start_xmit(data, 0)
+
+    # interrupt is held in the PBA while the vector is masked
+    for k in range(100):
+        await Timer(100, 'ns')
+        if await msix.is_pending(vec):
+            break
+
+    assert await msix.is_pending(vec)
+    assert msix.get_vector_stats(vec)['count'] == count
+
+    await msix.unmask(vec)
+
+    pkt = await tb.driver.interfaces[0].recv()
+
+    tb.log.info("Packet: %s", pkt)
+    assert pkt.data == data
+
+    assert not await msix.is_pending(vec)
+    assert msix.get_vector_stats(vec)['count'] > count
+
+    tb.loopback_enable = False
+
+    msix.log_stats()
+
+    if tb.peers:
+        tb.log.info("Multi-device throughput")
+
+        for k, peer_driver in enumerate(tb.peer_drivers):
+            await tb.topology.init_driver(peer_driver, k+1, 2**21)
+            await peer_driver.start(2**20, irq_interval=16)
+
+        tb.topology.clear_stats()
+        tb.loopback_enable = True
+
+        for k in range(32):
+            await tb.driver.interfaces[0].start_xmit(data, 0)
+
+        for k in range(32):
+            pkt = await tb.driver.interfaces[0].recv()
+            assert pkt.data == data
+
+        tb.loopback_enable = False
+
+        for peer_driver in tb.peer_drivers:
+            await peer_driver.stop()
+
+        stats = tb.topology.get_stats()
+        tb.topology.log_stats(stats)
+
+        for d in stats['devices']:
+            assert d['wr_bytes'] > 0
+
+        for peer_driver in tb.peer_drivers:
+            assert sum(peer_driver.irq_counts) > 0
+
+    if dma_latency is not None:
+        tb.log.info("DMA latency")
+
+        dma_latency.stop()
+
+        dma_snap = dma_latency.snapshot()
+        tlp_snap = tlp_monitor.snapshot()
+        dma_latency.log_snapshot(dma_snap)
+        log_correlation(tb.log, correlate(dma_snap, tlp_snap, tb.dev.functions[0].pcie_id))
+
+        assert dma_snap['rd_op']['cycles']['count'] > 0
+        assert dma_snap['wr_op']['cycles']['count'] > 0
+
     tb.log.info("Read statistics counters")
 
     await Timer(2000, 'ns')
@@ -26,19 +26,26 @@ from cocotbext.pcie.xilinx.us import UltraScalePlusPcieDevice
 
 try:
     import mqnic
+    from pcie_topology import PcieTopology, DmaTrafficDevice, DmaTrafficDriver
 except ImportError:
     # attempt import from current directory
     sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
     try:
         import mqnic
+        from pcie_topology import PcieTopology, DmaTrafficDevice, DmaTrafficDriver
     finally:
         del sys.path[0]
 
 
 class TB(object):
-    def __init__(self, dut, msix_count=32):
+    def __init__(self, dut, msix_count=32, peer_count=None, switch=None):
         self.dut = dut
 
+        if peer_count is None:
+            peer_count = int(os.getenv("PCIE_PEER_COUNT", "0"))
+        if switch is None:
+            switch = bool(int(os.getenv("PCIE_SWITCH", "0")))
+
         self.log = SimLog("cocotb.tb")
         self.log.setLevel(logging.DEBUG)
 
@@ -266,9 +273,13 @@ class TB(object):
 
         # self.dev.log.setLevel(logging.DEBUG)
 
-        self.rc.make_port().connect(self.dev)
+        # behavioural DMA endpoints sharing the root complex with the NIC
+        self.peers = [DmaTrafficDevice() for k in range(peer_count)]
+
+        self.topology = PcieTopology(self.rc, [self.dev]+self.peers, switch=switch)
 
         self.driver = mqnic.Driver()
+        self.peer_drivers = [DmaTrafficDriver() for k in range(peer_count)]
 
         self.dev.functions[0].configure_bar(0, 2**len(dut.core_pcie_inst.axil_ctrl_araddr), ext=True, prefetch=True)
         if hasattr(dut.core_pcie_inst, 'pcie_app_ctrl'):
@@ -415,7 +426,7 @@ class TB(object):
         for ram in self.ddr_axi_if + self.ddr_axi_if:
             ram.write_if.reset.setimmediatevalue(0)
 
-        await self.rc.enumerate()
+        await self.topology.enumerate()
 
     async def _run_loopback(self):
         while True:
@@ -435,7 +446,7 @@ async def run_test_nic(dut):
     await tb.init()
 
     tb.log.info("Init driver")
-    await tb.driver.init_pcie_dev(tb.rc.find_device(tb.dev.functions[0].pcie_id))
+    await tb.topology.init_driver(tb.driver, 0)
     for interface in tb.driver.interfaces:
         await interface.open()
 
@@ -749,20 +760,8 @@ async def run_test_nic(dut):
     tb.loopback_enable = True
 
     # configure TDMA scheduler
-    tdma_sch_rb = tb.driver.interfaces[0].sched_blocks[0].reg_blocks.find(mqnic.MQNIC_RB_TDMA_SCH_TYPE, mqnic.MQNIC_RB_TDMA_SCH_VER, 0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_SCH_PERIOD_FNS,   0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_SCH_PERIOD_NS,    40000)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_SCH_PERIOD_SEC_L, 0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_SCH_PERIOD_SEC_H, 0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_TS_PERIOD_FNS,   0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_TS_PERIOD_NS,    10000)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_TS_PERIOD_SEC_L, 0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_TS_PERIOD_SEC_H, 0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_FNS,   0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_NS,    5000)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_SEC_L, 0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_ACTIVE_PERIOD_SEC_H, 0)
-    await tdma_sch_rb.write_dword(mqnic.MQNIC_RB_TDMA_SCH_REG_CTRL, 0x00000001)
+    tdma_sch = tb.driver.interfaces[0].sched_blocks[0].tdma_sch
+    await tdma_sch.configure(timeslot_period=10000, active_period=5000, timeslot_count=4)
 
     # enable queues with global enable off
     await tb.driver.interfaces[0].sched_blocks[0].schedulers[0].rb.write_dword(mqnic.MQNIC_RB_SCHED_RR_REG_CTRL, 0x00000001)
@@ -770,10 +769,8 @@ async def run_test_nic(dut):
         await tb.driver.interfaces[0].sched_blocks[0].schedulers[0].hw_regs.write_dword(4*k, 0x00000001)
 
     # configure slots
-    await tb.driver.interfaces[0].sched_blocks[0].schedulers[1].hw_regs.write_dword(8*0, 0x00000001)
-    await tb.driver.interfaces[0].sched_blocks[0].schedulers[1].hw_regs.write_dword(8*1, 0x00000002)
-    await tb.driver.interfaces[0].sched_blocks[0].schedulers[1].hw_regs.write_dword(8*2, 0x00000004)
-    await tb.driver.interfaces[0].sched_blocks[0].schedulers[1].hw_regs.write_dword(8*3, 0x00000008)
+    for k in range(4):
+        await tb.driver.interfaces[0].sched_blocks[0].schedulers[1].set_queue_timeslots(k, [k])
 
     # wait for all writes to complete
     await tb.driver.hw_regs.read_dword(0)
@@ -791,6 +788,58 @@ async def run_test_nic(dut):
 
     tb.loopback_enable = False
 
+    # slow, so opt-in
+    if bool(int(os.getenv("SCHED_BENCH", "0"))):
+        tb.log.info("TDMA weighted scheduler benchmark")
+
+        weights = [2, 1, 1]
+
+        await tb.driver.interfaces[0].sched_blocks[0].schedulers[1].set_queue_weights(weights, ts_count=4)
+        await tb.driver.interfaces[0].sched_blocks[0].schedulers[1].set_queue_timeslots(3, [])
+
+        model = await mqnic.SchedulerModel.from_block(tb.driver.interfaces[0].sched_blocks[0],
+            active_fraction=5000/10000)
+
+        tb.loopback_enable = True
+
+        bench = mqnic.SchedulerBenchmark(tb.driver.interfaces[0], range(len(weights)), model=model)
+        await bench.run(16, 512)
+
+        tb.loopback_enable = False
+
+    if tb.peers:
+        tb.log.info("Multi-device throughput")
+
+        for k, peer_driver in enumerate(tb.peer_drivers):
+            await tb.topology.init_driver(peer_driver, k+1, 2**21)
+            await peer_driver.start(2**20, irq_interval=16)
+
+        tb.topology.clear_stats()
+        tb.loopback_enable = True
+
+        data = bytearray([x % 256 for x in range(1024)])
+
+        for k in range(32):
+            await tb.driver.interfaces[0].start_xmit(data, 0)
+
+        for k in range(32):
+            pkt = await tb.driver.interfaces[0].recv()
+            assert pkt.data == data
+
+        tb.loopback_enable = False
+
+        for peer_driver in tb.peer_drivers:
+            await peer_driver.stop()
+
+        stats = tb.topology.get_stats()
+        tb.topology.log_stats(stats)
+
+        for d in stats['devices']:
+            assert d['wr_bytes'] > 0
+
+        for peer_driver in tb.peer_drivers:
+            assert sum(peer_driver.irq_counts) > 0
+
     tb.log.info("Read statistics counters")
 
     await Timer(2000, 'ns')
@@ -0,0 +1,220 @@
+# SPDX-License-Identifier: BSD-2-Clause-Views
+# Copyright (c) 2021-2023 The Regents of the University of California
+
+from cocotb.log import SimLog
+from cocotb.utils import get_sim_time
+
+from cocotbext.pcie.core.caps import PciCapId
+from cocotbext.pcie.core.dllp import Dllp, FcType
+from cocotbext.pcie.core.port import FcChannelState, PCIE_GEN_RATE, get_max_update_latency
+
+# receive buffer credits advertised by each side of the link,
+# [PH, PD, NPH, NPD, CPLH, CPLD]; zero means infinite
+# endpoints advertise infinite completion credits
+PCIE_LINK_RC_CREDITS = [64, 1024, 64, 64, 64, 1024]
+PCIE_LINK_DEV_CREDITS = [64, 1024, 64, 64, 0, 0]
+
+# sequence number, LCRC, and framing
+PCIE_LINK_TLP_OVERHEAD = 8
+
+
+async def set_mps_mrrs(dev, max_payload_size=None, max_read_request_size=None):
+    """Set MPS/MRRS (in bytes) in the device control register of an enumerated
+    device and in the root complex that issues completions to it"""
+    devctl = await dev.capability_read_dword(PciCapId.EXP, 0x8)
+
+    if max_payload_size:
+        enc = (max_payload_size // 128).bit_length()-1
+        devctl = (devctl & ~0x00e0) | (enc << 5)
+        dev.rc.max_payload_size = enc
+    if max_read_request_size:
+        enc = (max_read_request_size // 128).bit_length()-1
+        devctl = (devctl & ~0x7000) | (enc << 12)
+        dev.rc.max_read_request_size = enc
+
+    await dev.capability_write_dword(PciCapId.EXP, 0x8, devctl)
+
+
+class PcieLinkPortStats:
+    """Transmit-side accounting for one port of a link
+
+    Pacing and credit gating are done by the cocotbext-pcie port itself;
+    this only counts packets and times how long the port spends on them.
+    """
+    def __init__(self, port):
+        self.port = port
+
+        self.clear_stats()
+
+        # hook the existing port rather than replacing it; the original
+        # port coroutines are already running
+        self._send = port.send
+        self._handle_tx = port.handle_tx
+        port.send = self.send
+        port.handle_tx = self.handle_tx
+
+    def clear_stats(self):
+        self.tlp_count = 0
+        self.tlp_payload_bytes = 0
+        self.tlp_wire_bytes = 0
+        self.dllp_count = 0
+        self.dllp_wire_bytes = 0
+        self.busy_time = 0
+        self.credit_stall_count = {t: 0 for t in FcType}
+        self.credit_stall_time = {t: 0 for t in FcType}
+        self.stats_start = get_sim_time()
+
+    async def send(self, pkt):
+        fc_ch = self.port.fc_state[self.port.classify_tlp_vc(pkt)]
+
+        # only count time spent waiting on credits after FC init
+        stall = fc_ch.initialized.is_set() and not fc_ch.tx_tlp_has_credit(pkt)
+        start = get_sim_time()
+
+        await self._send(pkt)
+
+        if stall:
+            fc_type = pkt.get_fc_type()
+            self.credit_stall_count[fc_type] += 1
+            self.credit_stall_time[fc_type] += get_sim_time()-start
+
+    async def handle_tx(self, pkt):
+        size = pkt.get_wire_size()
+        if isinstance(pkt, Dllp):
+            self.dllp_count += 1
+            self.dllp_wire_bytes += size
+        else:
+            self.tlp_count += 1
+            self.tlp_payload_bytes += pkt.get_payload_size()
+            self.tlp_wire_bytes += size
+
+        # the port paces the packet at the link rate, just time it
+        start = get_sim_time()
+        await self._handle_tx(pkt)
+        self.busy_time += get_sim_time()-start
+
+    def get_stats(self):
+        elapsed = get_sim_time()-self.stats_start
+        elapsed_ns = elapsed*1e9/self.port.time_scale
+        return {
+            'elapsed_ns': elapsed_ns,
+            'tlp_count': self.tlp_count,
+            'tlp_payload_bytes': self.tlp_payload_bytes,
+            'tlp_wire_bytes': self.tlp_wire_bytes,
+            'dllp_count': self.dllp_count,
+            'dllp_wire_bytes': self.dllp_wire_bytes,
+            'utilization': self.busy_time/elapsed if elapsed else 0.0,
+            'payload_gbps': self.tlp_payload_bytes*8/elapsed_ns if elapsed_ns else 0.0,
+            'credit_stall_count': {t.name.lower(): v for t, v in self.credit_stall_count.items()},
+            'credit_stall_ns': {t.name.lower(): v*1e9/self.port.time_scale for t, v in self.credit_stall_time.items()},
+        }
+
+
+class PcieLink:
+    """Paced PCIe link with flow control between a device and a root complex
+
+    Replaces the default unpaced connection, so construct it in place of
+    rc.make_port().connect(dev).  Upstream is device to root complex.
+    """
+    def __init__(self, rc, dev, generation=3, width=16, max_payload_size=None, max_read_request_size=None,
+            rc_credits=PCIE_LINK_RC_CREDITS, dev_credits=PCIE_LINK_DEV_CREDITS, port_delay=5e-9):
+        self.log = SimLog("cocotb.pcie_link")
+
+        self.rc = rc
+        self.dev = dev
+
+        self.generation = generation
+        self.width = width
+        self.max_payload_size = max_payload_size
+        self.max_read_request_size = max_read_request_size
+
+        # configure the default ports before connecting them, as the link
+        # rate is computed when the ports are connected
+        self.dev_port = dev.upstream_port
+        self._setup_port(self.dev_port, dev_credits, port_delay)
+
+        bridge = rc.make_port()
+        self.rc_port = bridge.downstream_port
+        self._setup_port(self.rc_port, rc_credits, port_delay)
+
+        self.dev_stats = PcieLinkPortStats(self.dev_port)
+        self.rc_stats = PcieLinkPortStats(self.rc_port)
+        bridge.downstream_tx_handler = self.rc_port.send
+
+        bridge.connect(dev)
+
+        self.log.info("PCIe link model: gen %d x%d (%.2f Gbps raw per direction)",
+            self.dev_port.cur_link_speed, self.dev_port.cur_link_width, self.link_gbps)
+
+    def _setup_port(self, port, credits, port_delay):
+        port.max_link_speed = self.generation
+        port.max_link_width = self.width
+        port.port_delay = port_delay
+        port.fc_state = [FcChannelState(credits, port.start_fc_update_timer) for k in range(8)]
+        port.fc_state[0].active = True
+        if self.max_payload_size:
+            port.max_payload_size = self.max_payload_size
+
+    @staticmethod
+    def _set_port_max_payload_size(port, max_payload_size):
+        port.max_payload_size = max_payload_size
+        if port.cur_link_speed and port.cur_link_width:
+            port.max_latency_timer_steps = int(get_max_update_latency(max_payload_size,
+                port.cur_link_width, port.cur_link_speed) * 8 / PCIE_GEN_RATE[port.cur_link_speed] * port.time_scale)
+
+    @property
+    def link_gbps(self):
+        return PCIE_GEN_RATE[self.dev_port.cur_link_speed]*self.dev_port.cur_link_width/1e9
+
+    def peak_payload_gbps(self, payload_size, header_size=16):
+        # best-case payload throughput with back-to-back TLPs of a given size
+        return self.link_gbps*payload_size/(payload_size+header_size+PCIE_LINK_TLP_OVERHEAD)
+
+    def peak_dma_gbps(self, write=False, max_payload_size=None):
+        # DMA writes go upstream as memory writes (4 DW header), DMA read data
+        # comes back downstream as completions (3 DW header)
+        mps = max_payload_size or self.max_payload_size or self.dev_port.max_payload_size
+        if write:
+            return self.peak_payload_gbps(mps, 16)
+        else:
+            return self.peak_payload_gbps(mps, 12)
+
+    async def configure(self, max_payload_size=None, max_read_request_size=None):
+        # apply MPS/MRRS (in bytes) once the device has been enumerated
+        mps = max_payload_size or self.max_payload_size
+        mrrs = max_read_request_size or self.max_read_request_size
+
+        dev = self.rc.find_device(self.dev.functions[0].pcie_id)
+        if dev is None:
+            raise Exception("Device not enumerated")
+
+        await set_mps_mrrs(dev, mps, mrrs)
+
+        if mps:
+            self._set_port_max_payload_size(self.dev_port, mps)
+            self._set_port_max_payload_size(self.rc_port, mps)
+            self.max_payload_size = mps
+        if mrrs:
+            self.max_read_request_size = mrrs
+
+    def clear_stats(self):
+        self.dev_stats.clear_stats()
+        self.rc_stats.clear_stats()
+
+    def get_stats(self):
+        return {
+            'upstream': self.dev_stats.get_stats(),
+            'downstream': self.rc_stats.get_stats(),
+        }
+
+    def log_stats(self, stats=None):
+        if stats is None:
+            stats = self.get_stats()
+        for direction, st in stats.items():
+            self.log.info("%-10s %6d TLPs %10d B payload %10d B wire, util %5.1f%%, %.2f Gbps payload",
+                direction, st['tlp_count'], st['tlp_payload_bytes'], st['tlp_wire_bytes'],
+                st['utilization']*100, st['payload_gbps'])
+            self.log.info("%-10s credit stalls: P %d (%.1f ns) NP %d (%.1f ns) CPL %d (%.1f ns)", direction,
+                st['credit_stall_count']['p'], st['credit_stall_ns']['p'],
+                st['credit_stall_count']['np'], st['credit_stall_ns']['np'],
+                st['credit_stall_count']['cpl'], st['credit_stall_ns']['cpl'])
@@ -0,0 +1,301 @@
+# SPDX-License-Identifier: BSD-2-Clause-Views
+# Copyright (c) 2021-2023 The Regents of the University of California
+
+import struct
+
+import cocotb
+from cocotb.log import SimLog
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from cocotbext.axi.address_space import Pool
+from cocotbext.pcie.core import Device, MemoryEndpoint, Switch
+from cocotbext.pcie.core.caps import MsiCapability
+from cocotbext.pcie.core.tlp import TlpType
+
+
+# DmaTrafficDevice register map (BAR 0)
+DMA_TRAFFIC_REG_CTRL         = 0x00  # bit 0 write, bit 1 read; 0 stops
+DMA_TRAFFIC_REG_ADDR         = 0x08  # 64 bit
+DMA_TRAFFIC_REG_SIZE         = 0x10
+DMA_TRAFFIC_REG_XFER_SIZE    = 0x14
+DMA_TRAFFIC_REG_RATE         = 0x18  # Mbps
+DMA_TRAFFIC_REG_IRQ_INTERVAL = 0x1C  # transfers per MSI, 0 disables
+DMA_TRAFFIC_REG_WR_BYTES     = 0x20  # 64 bit
+DMA_TRAFFIC_REG_RD_BYTES     = 0x28  # 64 bit
+
+DMA_TRAFFIC_CTRL_WRITE = 0x00000001
+DMA_TRAFFIC_CTRL_READ  = 0x00000002
+
+DMA_TRAFFIC_BAR_SIZE = 4096
+
+
+class DmaTrafficDevice(Device):
+    """Behavioural endpoint that streams DMA to host memory
+
+    Loads the root port or switch links shared with the device under test.
+    Programmed through a register BAR by DmaTrafficDriver, and signals
+    progress with MSI.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        fn = MemoryEndpoint()
+
+        fn.msi_cap = MsiCapability()
+        fn.msi_cap.msi_64bit_address_capable = 1
+        fn.register_capability(fn.msi_cap)
+
+        self.regs = bytearray(DMA_TRAFFIC_BAR_SIZE)
+        fn.add_mem_region(DMA_TRAFFIC_BAR_SIZE, read=self._read_regs, write=self._write_regs)
+
+        self.append_function(fn)
+
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.irq_count = 0
+
+        self._run_cr = None
+
+    async def _read_regs(self, addr, length):
+        struct.pack_into('<QQ', self.regs, DMA_TRAFFIC_REG_WR_BYTES, self.bytes_written, self.bytes_read)
+        return self.regs[addr:addr+length]
+
+    async def _write_regs(self, addr, data):
+        self.regs[addr:addr+len(data)] = data
+
+        if addr <= DMA_TRAFFIC_REG_CTRL < addr+len(data):
+            ctrl, = struct.unpack_from('<L', self.regs, DMA_TRAFFIC_REG_CTRL)
+            size, transfer_size, rate = struct.unpack_from('<LLL', self.regs, DMA_TRAFFIC_REG_SIZE)
+            self._stop()
+            # a zero rate, buffer size or transfer size leaves the device idle
+            if ctrl & (DMA_TRAFFIC_CTRL_WRITE | DMA_TRAFFIC_CTRL_READ) and size and transfer_size and rate:
+                self._run_cr = cocotb.start_soon(self._run())
+
+    def _stop(self):
+        if self._run_cr is not None:
+            self._run_cr.kill()
+            self._run_cr = None
+
+    async def _run(self):
+        fn = self.functions[0]
+
+        ctrl, = struct.unpack_from('<L', self.regs, DMA_TRAFFIC_REG_CTRL)
+        addr, = struct.unpack_from('<Q', self.regs, DMA_TRAFFIC_REG_ADDR)
+        size, transfer_size, rate, irq_interval = struct.unpack_from('<LLLL', self.regs, DMA_TRAFFIC_REG_SIZE)
+
+        write = bool(ctrl & DMA_TRAFFIC_CTRL_WRITE)
+        read = bool(ctrl & DMA_TRAFFIC_CTRL_READ)
+        data = bytes(transfer_size)
+        period = transfer_size*8000/rate
+        offset = 0
+        count = 0
+
+        while True:
+            if write:
+                await fn.mem_write(addr+offset, data)
+                self.bytes_written += transfer_size
+            if read:
+                await fn.mem_read(addr+offset, transfer_size, timeout=100000)
+                self.bytes_read += transfer_size
+            offset = (offset + transfer_size) % size
+            count += 1
+            if irq_interval and count % irq_interval == 0 and fn.msi_cap.msi_enable:
+                await fn.msi_cap.issue_msi_interrupt(0)
+                self.irq_count += 1
+            # pace the stream, otherwise posted writes complete in zero time
+            await Timer(period, 'ns')
+
+
+class DmaTrafficDriver:
+    """Host driver for a DmaTrafficDevice
+
+    Mirrors mqnic.Driver bring-up: MSI vectors come from alloc_irq_vectors
+    and the DMA buffer from the pool handed to init_pcie_dev, so each peer
+    has its own interrupt routing and host memory.
+    """
+    def __init__(self):
+        self.log = SimLog("cocotb.dma_traffic")
+
+        self.dev = None
+        self.pool = None
+        self.hw_regs = None
+        self.buf = None
+
+        self.irq_count = 0
+        self.irq_counts = []
+
+    async def init_pcie_dev(self, dev, pool=None):
+        self.dev = dev
+        self.pool = pool or self.dev.rc.mem_pool
+
+        await self.dev.enable_device()
+        await self.dev.set_master()
+        self.irq_count = await self.dev.alloc_irq_vectors(1, 32)
+
+        self.hw_regs = self.dev.bar_window[0]
+
+        self.irq_counts = [0]*self.irq_count
+        for index in range(self.irq_count):
+            self.dev.request_irq(index, self._irq_handler(index))
+
+        self.log.info("%s: %d MSI vectors", self.dev.pcie_id, self.irq_count)
+
+    def _irq_handler(self, index):
+        async def handler():
+            self.irq_counts[index] += 1
+        return handler
+
+    async def start(self, size=2**20, transfer_size=256, write=True, read=False, gbps=32, irq_interval=64):
+        rate = int(gbps*1000)
+        if rate <= 0:
+            raise ValueError(f"Rate must be at least 1 Mbps, got {gbps} Gbps")
+
+        if self.buf is None or self.buf.size < size:
+            self.buf = self.pool.alloc_region(size)
+
+        ctrl = 0
+        if write:
+            ctrl |= DMA_TRAFFIC_CTRL_WRITE
+        if read:
+            ctrl |= DMA_TRAFFIC_CTRL_READ
+
+        addr = self.buf.get_absolute_address(0)
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_ADDR, addr & 0xffffffff)
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_ADDR+4, (addr >> 32) & 0xffffffff)
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_SIZE, size)
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_XFER_SIZE, transfer_size)
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_RATE, rate)
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_IRQ_INTERVAL, irq_interval)
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_CTRL, ctrl)
+
+        # wait for all writes to complete
+        await self.hw_regs.read_dword(DMA_TRAFFIC_REG_CTRL)
+
+    async def stop(self):
+        await self.hw_regs.write_dword(DMA_TRAFFIC_REG_CTRL, 0)
+
+        # wait for all writes to complete
+        await self.hw_regs.read_dword(DMA_TRAFFIC_REG_CTRL)
+
+    async def get_counts(self):
+        wr_bytes = await self.hw_regs.read_qword(DMA_TRAFFIC_REG_WR_BYTES)
+        rd_bytes = await self.hw_regs.read_qword(DMA_TRAFFIC_REG_RD_BYTES)
+        return wr_bytes, rd_bytes
+
+
+class PcieTopology:
+    """Several endpoints attached to one root complex, optionally behind a switch
+
+    Construct in place of rc.make_port().connect(dev); all devices are
+    brought up with a single enumeration pass, then each device gets its
+    own driver instance through init_driver.  With peers, each device also
+    gets a private host memory pool and its DMA traffic is counted at the
+    root complex; a single device uses the default memory pool and the
+    root complex handlers are left as they are.
+    """
+    def __init__(self, rc, devices, switch=False):
+        self.log = SimLog("cocotb.pcie_topology")
+
+        self.rc = rc
+        self.devices = list(devices)
+        self.switch = None
+        self.functions = []
+        self.pools = []
+
+        if switch:
+            self.switch = Switch()
+            self.rc.make_port().connect(self.switch)
+            for dev in self.devices:
+                self.switch.make_port().connect(dev)
+        else:
+            for dev in self.devices:
+                self.rc.make_port().connect(dev)
+
+        self._req_map = {}
+        self.clear_stats()
+
+        # per-requester accounting of DMA traffic arriving at the root complex
+        if self.peers:
+            for fmt_type in (TlpType.MEM_READ, TlpType.MEM_READ_64, TlpType.MEM_WRITE, TlpType.MEM_WRITE_64):
+                self.rc.rx_tlp_handler[fmt_type] = self._wrap_rx(self.rc.rx_tlp_handler[fmt_type])
+
+    @property
+    def peers(self):
+        return self.devices[1:]
+
+    async def enumerate(self):
+        await self.rc.enumerate()
+
+        self.functions = [self.rc.find_device(dev.functions[0].pcie_id) for dev in self.devices]
+        self._req_map = {dev.functions[0].pcie_id: k for k, dev in enumerate(self.devices)}
+
+        for k, dev in enumerate(self.devices):
+            self.log.info("Device %d: %s", k, dev.functions[0].pcie_id)
+
+        return self.functions
+
+    def alloc_pool(self, size):
+        # carve a private pool out of the root complex memory pool, so
+        # each device gets its own buffers and checkpoints stay separate
+        base = self.rc.mem_pool.allocator.alloc(size)
+        pool = Pool(self.rc.mem_pool, base, size)
+        self.rc.mem_pool.register_region(pool, base, size)
+        self.pools.append(pool)
+        return pool
+
+    async def init_driver(self, driver, index, pool_size=2**28):
+        pool = None
+        if self.peers:
+            pool = self.alloc_pool(pool_size)
+        await driver.init_pcie_dev(self.functions[index], pool=pool)
+        return driver
+
+    def _wrap_rx(self, handler):
+        async def wrapper(tlp):
+            k = self._req_map.get(tlp.requester_id)
+            if k is not None:
+                if tlp.fmt_type in {TlpType.MEM_WRITE, TlpType.MEM_WRITE_64}:
+                    self.wr_bytes[k] += tlp.length*4
+                    self.wr_tlps[k] += 1
+                else:
+                    self.rd_bytes[k] += tlp.length*4
+                    self.rd_tlps[k] += 1
+            await handler(tlp)
+        return wrapper
+
+    def clear_stats(self):
+        n = len(self.devices)
+        self.wr_bytes = [0]*n
+        self.wr_tlps = [0]*n
+        self.rd_bytes = [0]*n
+        self.rd_tlps = [0]*n
+        self.stats_start = get_sim_time('ns')
+
+    def get_stats(self):
+        elapsed = get_sim_time('ns') - self.stats_start
+        devs = []
+        for k in range(len(self.devices)):
+            devs.append({
+                'wr_bytes': self.wr_bytes[k],
+                'rd_bytes': self.rd_bytes[k],
+                'wr_tlps': self.wr_tlps[k],
+                'rd_tlps': self.rd_tlps[k],
+                'wr_gbps': self.wr_bytes[k]*8/elapsed if elapsed else 0.0,
+                'rd_gbps': self.rd_bytes[k]*8/elapsed if elapsed else 0.0,
+            })
+        return {
+            'elapsed_ns': elapsed,
+            'devices': devs,
+            'wr_gbps': sum(d['wr_gbps'] for d in devs),
+            'rd_gbps': sum(d['rd_gbps'] for d in devs),
+        }
+
+    def log_stats(self, stats=None):
+        if stats is None:
+            stats = self.get_stats()
+        for k, d in enumerate(stats['devices']):
+            self.log.info("Device %d: write %.3f Gbps (%d TLPs), read %.3f Gbps (%d TLPs)",
+                k, d['wr_gbps'], d['wr_tlps'], d['rd_gbps'], d['rd_tlps'])
+        self.log.info("Aggregate: write %.3f Gbps, read %.3f Gbps over %.1f ns",
+            stats['wr_gbps'], stats['rd_gbps'], stats['elapsed_ns'])
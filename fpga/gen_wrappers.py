@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Generate a batch of RTL wrappers in parallel with the *_wrap.py scripts
+
+Wrappers are specified as generator:ports[:output], for example
+lib/axi/rtl/axi_crossbar_wrap.py:4x2, or listed in a JSON file of
+{"generator": ..., "ports": ..., "name": ..., "output": ...} objects.
+Specs are spread across worker processes, each worker compiles a given
+template only once, and outputs are only rewritten when their content
+changes.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import importlib.util
+import io
+import json
+import os
+import tempfile
+
+
+def parse_spec(spec):
+    # generator:N[:output] or generator:MxN[:output]
+    parts = spec.split(':')
+    if len(parts) not in (2, 3):
+        raise Exception(f"Invalid wrapper spec '{spec}'")
+
+    ports = [int(p) for p in parts[1].split('x')]
+    if len(ports) == 1:
+        # single port count generators take an int
+        ports = ports[0]
+
+    return {
+        'generator': parts[0],
+        'ports': ports,
+        'output': parts[2] if len(parts) == 3 else None,
+    }
+
+
+def load_specs(file_name):
+    with open(file_name, 'r') as f:
+        specs = json.load(f)
+
+    # paths are relative to the spec file
+    base = os.path.dirname(os.path.abspath(file_name))
+
+    for spec in specs:
+        spec['generator'] = os.path.join(base, spec['generator'])
+        if spec.get('output'):
+            spec['output'] = os.path.join(base, spec['output'])
+
+    return specs
+
+
+@functools.lru_cache(maxsize=None)
+def load_generator(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    mod_spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(mod_spec)
+    mod_spec.loader.exec_module(mod)
+
+    # the generators build a Template from a constant string on every call;
+    # compile each one once per worker instead
+    mod.Template = functools.lru_cache(maxsize=None)(mod.Template)
+
+    return mod
+
+
+def read_file(name):
+    try:
+        with open(name, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def render(spec, out_dir):
+    # runs in a worker; the generator writes into a scratch directory and
+    # the result only replaces the target when it differs
+    mod = load_generator(spec['generator'])
+    cwd = os.getcwd()
+    log = io.StringIO()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(log):
+                mod.generate(spec['ports'], spec.get('name'),
+                    os.path.basename(spec['output']) if spec.get('output') else None)
+        finally:
+            os.chdir(cwd)
+
+        # wrappers without an explicit output keep the generator's default name
+        file_name = os.listdir(tmp)[0]
+        output = spec.get('output') or os.path.join(out_dir, file_name)
+
+        with open(os.path.join(tmp, file_name), 'rb') as f:
+            data = f.read()
+
+    if read_file(output) == data:
+        return spec, output, False, log.getvalue()
+
+    with open(output, 'wb') as f:
+        f.write(data)
+
+    return spec, output, True, log.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('specs', type=str, nargs='*', help="wrapper specs (generator:N[:output] or generator:MxN[:output])")
+    parser.add_argument('-f', '--file', type=str, action='append', default=[], help="JSON spec file")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="parallel workers")
+    parser.add_argument('-d', '--dir', type=str, help="output directory for specs without an output")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show generator output")
+
+    args = parser.parse_args()
+
+    specs = [parse_spec(s) for s in args.specs]
+    for file_name in args.file:
+        specs.extend(load_specs(file_name))
+
+    if not specs:
+        parser.error("no wrappers specified")
+
+    generators = set()
+
+    for spec in specs:
+        spec['generator'] = os.path.abspath(spec['generator'])
+        if not os.path.isfile(spec['generator']):
+            raise Exception(f"Generator '{spec['generator']}' not found")
+        generators.add(spec['generator'])
+
+        if spec.get('output'):
+            spec['output'] = os.path.abspath(spec['output'])
+
+    out_dir = os.getcwd()
+    if args.dir:
+        out_dir = os.path.abspath(args.dir)
+        os.makedirs(out_dir, exist_ok=True)
+
+    written = 0
+    unchanged = 0
+
+    # one task per wrapper, so a generator with many variants is spread
+    # across all workers; chunks of the same generator keep each worker's
+    # template cache warm
+    specs.sort(key=lambda spec: spec['generator'])
+    jobs = max(1, min(args.jobs, len(specs)))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        for spec, output, w, log in executor.map(render, specs, [out_dir]*len(specs),
+                chunksize=max(1, len(specs) // (jobs*4))):
+            if args.verbose:
+                print(log, end='')
+            if w:
+                written += 1
+                print(f"Wrote {os.path.relpath(output)}")
+            else:
+                unchanged += 1
+
+    print(f"{len(specs)} wrappers from {len(generators)} generators: {written} written, {unchanged} unchanged")
+
+
+if __name__ == "__main__":
+    main()
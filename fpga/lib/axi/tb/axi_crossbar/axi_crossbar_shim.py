@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Generates a port-splitting shim around the raw axi_crossbar module
+
+Unlike the generated wrapper, the shim keeps the raw module's parameter
+interface (packed S_THREADS, M_ISSUE, etc.) and only splits the packed
+per-port vectors into individually named ports, so the testbench can
+attach one AXI model per port.  Parameters and ports are taken from
+the RTL, so the shim tracks changes to axi_crossbar.v.
+"""
+
+import argparse
+import os
+import re
+
+rtl_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rtl'))
+
+PORT_RE = re.compile(r'^\s*(input|output)\s+wire\s+\[([SM])_COUNT(?:\*(\w+))?-1:0\]\s+(\w+)')
+
+
+def parse_rtl(file_name):
+    with open(file_name, 'r') as f:
+        text = f.read()
+
+    head = text[text.index('module axi_crossbar #'):]
+    params = head[head.index('(')+1:head.index('\n)\n')]
+    ports = []
+
+    for line in head[head.index('\n)\n(')+4:head.index('\n);\n')].splitlines():
+        m = PORT_RE.match(line)
+        if m:
+            ports.append((m.group(1), m.group(2).lower(), m.group(3), m.group(4)))
+
+    return params, ports
+
+
+def generate(ports=4, name=None, output=None):
+    if type(ports) is int:
+        m = n = ports
+    elif len(ports) == 1:
+        m = n = ports[0]
+    else:
+        m, n = ports
+
+    if name is None:
+        name = f"axi_crossbar_shim_{m}x{n}"
+
+    if output is None:
+        output = name + ".v"
+
+    print(f"Generating {m}x{n} port AXI crossbar shim {name}...")
+
+    params, port_list = parse_rtl(os.path.join(rtl_dir, "axi_crossbar.v"))
+    counts = {'s': m, 'm': n}
+
+    params = re.sub(r'parameter S_COUNT = \d+', f'parameter S_COUNT = {m}', params)
+    params = re.sub(r'parameter M_COUNT = \d+', f'parameter M_COUNT = {n}', params)
+    param_names = re.findall(r'parameter (\w+) =', params)
+
+    lines = []
+    lines.append("// Generated by axi_crossbar_shim.py, do not edit")
+    lines.append("")
+    lines.append("`resetall")
+    lines.append("`timescale 1ns / 1ps")
+    lines.append("`default_nettype none")
+    lines.append("")
+    lines.append(f"module {name} #")
+    lines.append("(" + params + "\n)")
+    lines.append("(")
+    lines.append("    input  wire clk,")
+    lines.append("    input  wire rst,")
+
+    decl = []
+    for direction, side, width, sig in port_list:
+        rng = f"[{width}-1:0] " if width else ""
+        for k in range(counts[side]):
+            decl.append(f"    {direction:<6} wire {rng}{side}{k:02d}{sig[1:]}")
+    lines.append(",\n".join(decl))
+    lines.append(");")
+    lines.append("")
+
+    lines.append("axi_crossbar #(")
+    lines.append(",\n".join(f"    .{p}({p})" for p in param_names))
+    lines.append(")")
+    lines.append("axi_crossbar_inst (")
+    conn = ["    .clk(clk)", "    .rst(rst)"]
+    for direction, side, width, sig in port_list:
+        parts = ", ".join(f"{side}{k:02d}{sig[1:]}" for k in range(counts[side]-1, -1, -1))
+        conn.append(f"    .{sig}({{ {parts} }})")
+    lines.append(",\n".join(conn))
+    lines.append(");")
+    lines.append("")
+    lines.append("endmodule")
+    lines.append("")
+    lines.append("`resetall")
+    lines.append("")
+
+    print(f"Writing file '{output}'...")
+
+    with open(output, 'w') as f:
+        f.write("\n".join(lines))
+        f.flush()
+
+    print("Done")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-p', '--ports',  type=int, default=[4], nargs='+', help="number of ports")
+    parser.add_argument('-n', '--name',   type=str, help="module name")
+    parser.add_argument('-o', '--output', type=str, help="output file name")
+
+    args = parser.parse_args()
+
+    try:
+        generate(**args.__dict__)
+    except IOError as ex:
+        print(ex)
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,7 @@ THE SOFTWARE.
 
 """
 
+import csv
 import itertools
 import logging
 import os
@@ -35,24 +36,34 @@ import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge, Timer
 from cocotb.regression import TestFactory
+from cocotb.utils import get_sim_time
 
 from cocotbext.axi import AxiBus, AxiMaster, AxiRam
 
 
+def crossbar(dut):
+    # toplevel is either the generated wrapper or the raw module shim
+    return dut.axi_crossbar_inst
+
+
 class TB(object):
-    def __init__(self, dut):
+    def __init__(self, dut, ram_size=2**16):
         self.dut = dut
 
-        s_count = len(dut.axi_crossbar_inst.s_axi_awvalid)
-        m_count = len(dut.axi_crossbar_inst.m_axi_awvalid)
+        self.xbar = crossbar(dut)
+
+        s_count = len(self.xbar.s_axi_awvalid)
+        m_count = len(self.xbar.m_axi_awvalid)
 
         self.log = logging.getLogger("cocotb.tb")
         self.log.setLevel(logging.DEBUG)
 
-        cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
+        self.clk_period = 10
+
+        cocotb.start_soon(Clock(dut.clk, self.clk_period, units="ns").start())
 
         self.axi_master = [AxiMaster(AxiBus.from_prefix(dut, f"s{k:02d}_axi"), dut.clk, dut.rst) for k in range(s_count)]
-        self.axi_ram = [AxiRam(AxiBus.from_prefix(dut, f"m{k:02d}_axi"), dut.clk, dut.rst, size=2**16) for k in range(m_count)]
+        self.axi_ram = [AxiRam(AxiBus.from_prefix(dut, f"m{k:02d}_axi"), dut.clk, dut.rst, size=ram_size) for k in range(m_count)]
 
         for ram in self.axi_ram:
             # prevent X propagation from screwing things up - "anything but X!"
@@ -80,6 +91,9 @@ class TB(object):
                 ram.write_if.w_channel.set_pause_generator(generator())
                 ram.read_if.ar_channel.set_pause_generator(generator())
 
+    def cycle(self):
+        return get_sim_time('ns') / self.clk_period
+
     async def cycle_reset(self):
         self.dut.rst.setimmediatevalue(0)
         await RisingEdge(self.dut.clk)
@@ -197,16 +211,201 @@ async def run_stress_test(dut, idle_inserter=None, backpressure_inserter=None):
     await RisingEdge(dut.clk)
 
 
+BENCH_FIELDS = ['pattern', 'burst_len', 'outstanding', 'id_count', 's', 'm', 'reads', 'writes',
+    'rd_bytes_per_cycle', 'wr_bytes_per_cycle', 'rd_utilization', 'wr_utilization',
+    'rd_lat_mean', 'rd_lat_p50', 'rd_lat_p99', 'rd_lat_max',
+    'wr_lat_mean', 'wr_lat_p50', 'wr_lat_p99', 'wr_lat_max', 'fairness']
+
+# burst lengths (beats) drawn from when burst_len is None
+BURST_MIX = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+def traffic_matrix(pattern, s_count, m_count, hot_fraction=0.5):
+    # weight of each destination, per source
+    if pattern == "uniform":
+        return [[1/m_count]*m_count for s in range(s_count)]
+    elif pattern == "hotspot":
+        # hot_fraction of every source goes to port 0, rest spread uniformly
+        row = [(1-hot_fraction)/m_count]*m_count
+        row[0] += hot_fraction
+        return [list(row) for s in range(s_count)]
+    elif pattern == "incast":
+        return [[1.0]+[0.0]*(m_count-1) for s in range(s_count)]
+    elif pattern == "permutation":
+        # each source has a single destination, spread over the outputs
+        return [[1.0 if m == s % m_count else 0.0 for m in range(m_count)] for s in range(s_count)]
+    raise Exception(f"Unknown traffic pattern {pattern}")
+
+
+def jain_index(values):
+    values = list(values)
+    if not values or not any(values):
+        return 1.0
+    return sum(values)**2/(len(values)*sum(v*v for v in values))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values)*p/100), len(sorted_values)-1)]
+
+
+def latency_fields(prefix, values):
+    values = sorted(values)
+    return {
+        f'{prefix}_lat_mean': sum(values)/len(values) if values else 0.0,
+        f'{prefix}_lat_p50': percentile(values, 50),
+        f'{prefix}_lat_p99': percentile(values, 99),
+        f'{prefix}_lat_max': values[-1] if values else 0,
+    }
+
+
+async def run_bench_crossbar(dut, pattern="uniform", outstanding=4, burst_len=None, id_count=None,
+        read_fraction=0.5, duration=5000, warmup=500, seed=1):
+
+    xbar = crossbar(dut)
+    s_count = len(xbar.s_axi_awvalid)
+    m_count = len(xbar.m_axi_awvalid)
+    byte_lanes = len(xbar.s_axi_wstrb) // s_count
+
+    # every (source, worker) pair owns one slot in each RAM, so reads can
+    # be checked against the last write from the same worker
+    max_len = min((burst_len or BURST_MIX[-1])*byte_lanes, 4096)
+    slot = 1 << (max_len-1).bit_length()
+    ram_size = max(2**16, 1 << (s_count*outstanding*slot-1).bit_length())
+
+    tb = TB(dut, ram_size=ram_size)
+
+    await tb.cycle_reset()
+
+    matrix = traffic_matrix(pattern, s_count, m_count)
+
+    expected = {}
+    for s in range(s_count):
+        for w in range(outstanding):
+            base = (s*outstanding+w)*slot
+            for m in range(m_count):
+                data = bytearray(random.Random(seed+base+m).randbytes(slot))
+                tb.axi_ram[m].write(base, data)
+                expected[(s, w, m)] = data
+
+    rd_lat = [[list() for m in range(m_count)] for s in range(s_count)]
+    wr_lat = [[list() for m in range(m_count)] for s in range(s_count)]
+    rd_bytes = [[0]*m_count for s in range(s_count)]
+    wr_bytes = [[0]*m_count for s in range(s_count)]
+
+    start = tb.cycle()+warmup
+    stop = start+duration
+    running = True
+
+    async def worker(s, w):
+        # closed loop, one operation in flight per worker
+        rng = random.Random(seed*1000+s*outstanding+w)
+        master = tb.axi_master[s]
+        base = (s*outstanding+w)*slot
+        # id_count limits the IDs in use per source, so workers share them
+        tag = w % id_count if id_count else None
+
+        while running:
+            m = rng.choices(range(m_count), weights=matrix[s])[0]
+            length = min((burst_len or rng.choice(BURST_MIX))*byte_lanes, max_len)
+            addr = base + m*0x1000000
+            data = expected[(s, w, m)]
+
+            t0 = tb.cycle()
+            if rng.random() < read_fraction:
+                resp = await master.read(addr, length, arid=tag)
+                assert resp.data == data[:length]
+                lat, count = rd_lat, rd_bytes
+            else:
+                data[:length] = rng.randbytes(length)
+                await master.write(addr, data[:length], awid=tag)
+                lat, count = wr_lat, wr_bytes
+            t1 = tb.cycle()
+
+            if start <= t0 and t1 <= stop:
+                lat[s][m].append(t1-t0)
+                count[s][m] += length
+
+    workers = [cocotb.start_soon(worker(s, w)) for s in range(s_count) for w in range(outstanding)]
+
+    await Timer(int((stop-tb.cycle())*tb.clk_period), 'ns')
+    running = False
+
+    # every operation in flight must complete
+    for w in workers:
+        await w.join()
+
+    for s in range(s_count):
+        for w in range(outstanding):
+            for m in range(m_count):
+                data = expected[(s, w, m)]
+                assert tb.axi_ram[m].read((s*outstanding+w)*slot, slot) == data
+
+    tag = f"{pattern}_{burst_len or 'mixed'}_{id_count or 'all'}"
+    common = {'pattern': pattern, 'burst_len': burst_len or "mixed", 'outstanding': outstanding,
+        'id_count': id_count or "all"}
+    rows = []
+
+    for s in range(s_count):
+        row = dict(common, s=s, m="all")
+        row['reads'] = sum(len(rd_lat[s][m]) for m in range(m_count))
+        row['writes'] = sum(len(wr_lat[s][m]) for m in range(m_count))
+        row['rd_bytes_per_cycle'] = sum(rd_bytes[s])/duration
+        row['wr_bytes_per_cycle'] = sum(wr_bytes[s])/duration
+        row['rd_utilization'] = row['rd_bytes_per_cycle']/byte_lanes
+        row['wr_utilization'] = row['wr_bytes_per_cycle']/byte_lanes
+        row.update(latency_fields('rd', [v for m in range(m_count) for v in rd_lat[s][m]]))
+        row.update(latency_fields('wr', [v for m in range(m_count) for v in wr_lat[s][m]]))
+        rows.append(row)
+
+        tb.log.info("%s s%d: rd %.3f B/cycle (p50 %.0f p99 %.0f cycles), wr %.3f B/cycle (p50 %.0f p99 %.0f cycles)",
+            tag, s, row['rd_bytes_per_cycle'], row['rd_lat_p50'], row['rd_lat_p99'],
+            row['wr_bytes_per_cycle'], row['wr_lat_p50'], row['wr_lat_p99'])
+
+    for m in range(m_count):
+        sources = [s for s in range(s_count) if matrix[s][m]]
+        # share of each source normalised by how much of its traffic targets this port
+        shares = [(rd_bytes[s][m]+wr_bytes[s][m])/matrix[s][m] for s in sources]
+
+        row = dict(common, s="all", m=m)
+        row['reads'] = sum(len(rd_lat[s][m]) for s in range(s_count))
+        row['writes'] = sum(len(wr_lat[s][m]) for s in range(s_count))
+        row['rd_bytes_per_cycle'] = sum(rd_bytes[s][m] for s in range(s_count))/duration
+        row['wr_bytes_per_cycle'] = sum(wr_bytes[s][m] for s in range(s_count))/duration
+        row['rd_utilization'] = row['rd_bytes_per_cycle']/byte_lanes
+        row['wr_utilization'] = row['wr_bytes_per_cycle']/byte_lanes
+        row.update(latency_fields('rd', [v for s in range(s_count) for v in rd_lat[s][m]]))
+        row.update(latency_fields('wr', [v for s in range(s_count) for v in wr_lat[s][m]]))
+        row['fairness'] = jain_index(shares)
+        rows.append(row)
+
+        tb.log.info("%s m%d: rd %.1f%%, wr %.1f%% of line rate, fairness %.3f over %d sources",
+            tag, m, row['rd_utilization']*100, row['wr_utilization']*100, row['fairness'], len(sources))
+
+        if pattern == "incast" and len(sources) > 1:
+            # equal closed-loop sources on one output are arbitrated round robin
+            assert row['fairness'] >= 0.9
+
+    with open(f"axi_crossbar_bench_{tag}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=BENCH_FIELDS, lineterminator='\n')
+        w.writeheader()
+        w.writerows(rows)
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
 def cycle_pause():
     return itertools.cycle([1, 1, 1, 0])
 
 
 if cocotb.SIM_NAME:
 
-    s_count = len(cocotb.top.axi_crossbar_inst.s_axi_awvalid)
-    m_count = len(cocotb.top.axi_crossbar_inst.m_axi_awvalid)
+    s_count = len(crossbar(cocotb.top).s_axi_awvalid)
+    m_count = len(crossbar(cocotb.top).m_axi_awvalid)
 
-    data_width = len(cocotb.top.s00_axi_wdata)
+    data_width = len(crossbar(cocotb.top).s_axi_wdata) // s_count
     byte_lanes = data_width // 8
     max_burst_size = (byte_lanes-1).bit_length()
 
@@ -223,6 +422,13 @@ if cocotb.SIM_NAME:
     factory = TestFactory(run_stress_test)
     factory.generate_tests()
 
+    # slow, so opt-in
+    if bool(int(os.getenv("AXI_CROSSBAR_BENCH", "0"))):
+        factory = TestFactory(run_bench_crossbar)
+        factory.add_option("pattern", ["uniform", "hotspot", "incast", "permutation"])
+        factory.add_option("id_count", [None, 1])
+        factory.generate_tests()
+
 
 # cocotb-test
 
@@ -233,17 +439,23 @@ rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
 @pytest.mark.parametrize("data_width", [8, 16, 32])
 @pytest.mark.parametrize("m_count", [1, 4])
 @pytest.mark.parametrize("s_count", [1, 4])
-def test_axi_crossbar(request, s_count, m_count, data_width):
+def test_axi_crossbar(request, s_count, m_count, data_width, raw=False):
     dut = "axi_crossbar"
     wrapper = f"{dut}_wrap_{s_count}x{m_count}"
     module = os.path.splitext(os.path.basename(__file__))[0]
+    if raw:
+        # raw module parameters, ports split by a thin shim
+        wrapper = f"{dut}_shim_{s_count}x{m_count}"
+        generator = os.path.join(tests_dir, f"{dut}_shim.py")
+    else:
+        generator = os.path.join(rtl_dir, f"{dut}_wrap.py")
     toplevel = wrapper
 
     # generate wrapper
     wrapper_file = os.path.join(tests_dir, f"{wrapper}.v")
     if not os.path.exists(wrapper_file):
         subprocess.Popen(
-            [os.path.join(rtl_dir, f"{dut}_wrap.py"), "-p", f"{s_count}", f"{m_count}"],
+            [generator, "-p", f"{s_count}", f"{m_count}"],
             cwd=tests_dir
         ).wait()
 
@@ -295,3 +507,8 @@ def test_axi_crossbar(request, s_count, m_count, data_width):
         sim_build=sim_build,
         extra_env=extra_env,
     )
+
+
+def test_axi_crossbar_raw(request):
+    # raw module parameter interface via axi_crossbar_shim.py
+    test_axi_crossbar(request, 4, 4, 32, raw=True)
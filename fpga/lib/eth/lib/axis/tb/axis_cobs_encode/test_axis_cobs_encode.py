@@ -26,6 +26,7 @@ THE SOFTWARE.
 import itertools
 import logging
 import os
+import random
 
 import cocotb_test.simulator
 import pytest
@@ -39,63 +40,57 @@ from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStre
 
 
 def cobs_encode(block):
-    block = bytearray(block)
+    # split on zeros rather than walking the block byte by byte
+    block = bytes(block)
     enc = bytearray()
 
-    seg = bytearray()
-    code = 1
+    segs = block.split(b'\x00')
 
-    new_data = True
-
-    for b in block:
-        if b == 0:
-            enc.append(code)
-            enc.extend(seg)
-            code = 1
-            seg = bytearray()
-            new_data = True
-        else:
-            code += 1
-            seg.append(b)
-            new_data = True
-            if code == 255:
-                enc.append(code)
-                enc.extend(seg)
-                code = 1
-                seg = bytearray()
-                new_data = False
-
-    if new_data:
-        enc.append(code)
-        enc.extend(seg)
+    for k, seg in enumerate(segs):
+        i = 0
+        # runs of 254 non-zero bytes get code 255 and no implied zero
+        while len(seg)-i >= 254:
+            enc.append(255)
+            enc += seg[i:i+254]
+            i += 254
+        # a trailing full-length run needs no final code byte
+        if i < len(seg) or i == 0 or k < len(segs)-1:
+            enc.append(len(seg)-i+1)
+            enc += seg[i:]
 
     return bytes(enc)
 
 
 def cobs_decode(block):
-    block = bytearray(block)
+    block = bytes(block)
     dec = bytearray()
 
-    code = 0
+    if b'\x00' in block:
+        return None
 
     i = 0
 
-    if 0 in block:
-        return None
-
     while i < len(block):
         code = block[i]
-        i += 1
-        if i+code-1 > len(block):
+        j = i+code
+        if j > len(block):
             return None
-        dec.extend(block[i:i+code-1])
-        i += code-1
-        if code < 255 and i < len(block):
+        dec += block[i+1:j]
+        if code < 255 and j < len(block):
             dec.append(0)
+        i = j
 
     return bytes(dec)
 
 
+def cobs_encode_frames(frames):
+    return [cobs_encode(f) for f in frames]
+
+
+def cobs_decode_frames(frames):
+    return [cobs_decode(f) for f in frames]
+
+
 def prbs31(state=0x7fffffff):
     while True:
         for i in range(8):
@@ -172,6 +167,65 @@ async def run_test(dut, payload_lengths=None, payload_data=None, idle_inserter=N
     await RisingEdge(dut.clk)
 
 
+def stress_frames(total_bytes, max_len, seed=1):
+    rng = random.Random(seed)
+    frames = []
+    count = 0
+    while count < total_bytes:
+        length = rng.choice([rng.randint(1, 64), rng.randint(1, max_len)])
+        mode = rng.randrange(3)
+        if mode == 0:
+            # sparse zeros
+            data = rng.randbytes(length)
+        elif mode == 1:
+            # dense zeros
+            data = bytes(rng.choices(b'\x00\x01\x02\x03', k=length))
+        else:
+            # long non-zero runs
+            data = (bytes(range(1, 256))*(length // 255 + 1))[:length]
+        frames.append(data)
+        count += length
+    return frames
+
+
+async def run_stress_test(dut, total_bytes=2**21, max_len=32768, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    append_zero = int(os.getenv("PARAM_APPEND_ZERO"))
+
+    await tb.reset()
+
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    test_frames = stress_frames(total_bytes, max_len)
+
+    tb.log.info("Sending %d frames, %d bytes", len(test_frames), sum(len(f) for f in test_frames))
+
+    for test_data in test_frames:
+        await tb.source.send(AxiStreamFrame(test_data))
+
+    rx_frames = []
+
+    for test_data in test_frames:
+        rx_frame = await tb.sink.recv()
+        assert not rx_frame.tuser
+
+        if append_zero:
+            assert rx_frame.tdata[-1:] == b'\x00'
+            rx_frames.append(bytes(rx_frame.tdata[:-1]))
+        else:
+            rx_frames.append(bytes(rx_frame.tdata))
+
+    assert rx_frames == cobs_encode_frames(test_frames)
+    assert cobs_decode_frames(rx_frames) == test_frames
+
+    assert tb.sink.empty()
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
 def cycle_pause():
     return itertools.cycle([1, 1, 1, 0])
 
@@ -210,6 +264,12 @@ if cocotb.SIM_NAME:
     factory.add_option("backpressure_inserter", [None, cycle_pause])
     factory.generate_tests()
 
+    # slow, so opt-in
+    if bool(int(os.getenv("COBS_STRESS", "0"))):
+        factory = TestFactory(run_stress_test)
+        factory.add_option("backpressure_inserter", [None, cycle_pause])
+        factory.generate_tests()
+
 
 # cocotb-test
 
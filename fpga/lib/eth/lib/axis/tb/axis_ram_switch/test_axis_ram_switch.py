@@ -23,6 +23,7 @@ THE SOFTWARE.
 
 """
 
+import csv
 import itertools
 import logging
 import os
@@ -34,7 +35,7 @@ import pytest
 
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, Event
+from cocotb.triggers import RisingEdge, ClockCycles, Event
 from cocotb.regression import TestFactory
 
 from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStreamSink
@@ -273,6 +274,214 @@ async def run_stress_test(dut, idle_inserter=None, backpressure_inserter=None):
     await RisingEdge(dut.clk)
 
 
+BENCH_FIELDS = ['pattern', 'load', 's', 'm', 'frames', 'offered_bytes_per_cycle', 'bytes_per_cycle',
+    'line_fraction', 'fairness', 'backpressure_cycles', 'drops']
+
+
+def traffic_matrix(pattern, s_count, m_count, hot_fraction=0.5):
+    # weight of each destination, per source
+    if pattern == "uniform":
+        return [[1/m_count]*m_count for s in range(s_count)]
+    elif pattern == "hotspot":
+        # hot_fraction of every source goes to port 0, rest spread uniformly
+        row = [(1-hot_fraction)/m_count]*m_count
+        row[0] += hot_fraction
+        return [list(row) for s in range(s_count)]
+    elif pattern == "incast":
+        return [[1.0]+[0.0]*(m_count-1) for s in range(s_count)]
+    raise Exception(f"Unknown traffic pattern {pattern}")
+
+
+def jain_index(values):
+    values = list(values)
+    if not values or not any(values):
+        return 1.0
+    return sum(values)**2/(len(values)*sum(v*v for v in values))
+
+
+async def run_bench_switch(dut, pattern="uniform", loads=(0.25, 0.5, 0.75, 1.0), duration=4000,
+        warmup=500, occupancy_interval=50, frame_len=None, seed=1):
+
+    tb = TB(dut)
+
+    switch = dut.axis_ram_switch_inst
+    s_count = len(tb.source)
+    m_count = len(tb.sink)
+
+    s_lanes = tb.source[0].byte_lanes
+    m_lanes = tb.sink[0].byte_lanes
+    id_width = len(tb.source[0].bus.tid)
+    fifo_depth = int(os.getenv("PARAM_FIFO_DEPTH", "4096"))
+
+    if frame_len is None:
+        frame_len = max(s_lanes, m_lanes)*16
+    frame_cycles = -(-frame_len // s_lanes)
+
+    matrix = traffic_matrix(pattern, s_count, m_count)
+    test_data = bytearray(itertools.islice(itertools.cycle(range(256)), frame_len))
+
+    rows = []
+    occupancy_rows = []
+
+    for load in loads:
+        rng = random.Random(seed)
+
+        await tb.reset()
+
+        sent = [[list() for m in range(m_count)] for s in range(s_count)]
+        rx_bytes = [[0]*m_count for s in range(s_count)]
+        bp_cycles = [0]*s_count
+        drops = [0]*s_count
+        measuring = False
+
+        async def drive(s):
+            # open loop: frames are queued on schedule whether or not the
+            # switch accepts them, so backpressure shows up as queueing
+            cur_id = 0
+            t = 0.0
+            while True:
+                m = rng.choices(range(m_count), weights=matrix[s])[0]
+                frame = AxiStreamFrame(test_data, tid=cur_id, tdest=m)
+                sent[s][m].append(frame)
+                tb.source[s].send_nowait(frame)
+                cur_id = (cur_id + 1) % 2**id_width
+
+                t += frame_cycles/load
+                if int(t):
+                    await ClockCycles(dut.clk, int(t))
+                    t -= int(t)
+
+        async def receive(m):
+            # frames from one source to one output stay in order
+            while True:
+                frame = await tb.sink[m].recv()
+                s = frame.tid >> id_width
+                test_frame = sent[s][m].pop(0)
+                assert frame.tdata == test_frame.tdata
+                assert (frame.tid & (2**id_width-1)) == test_frame.tid
+                assert not frame.tuser
+                if measuring:
+                    rx_bytes[s][m] += len(frame.tdata)
+
+        async def watch():
+            # occupancy from the ports: bytes accepted from each source minus
+            # bytes of that source's frames sent out on any output
+            in_bytes = [0]*s_count
+            out_bytes = [0]*s_count
+            cycle = 0
+            while True:
+                await RisingEdge(dut.clk)
+                for s in range(s_count):
+                    if tb.source[s].bus.tvalid.value and tb.source[s].bus.tready.value:
+                        in_bytes[s] += s_lanes
+                for m in range(m_count):
+                    if tb.sink[m].bus.tvalid.value and tb.sink[m].bus.tready.value:
+                        out_bytes[tb.sink[m].bus.tid.value.integer >> id_width] += m_lanes
+                if not measuring:
+                    continue
+                valid = switch.s_axis_tvalid.value.integer
+                ready = switch.s_axis_tready.value.integer
+                overflow = switch.status_overflow.value.integer | switch.status_bad_frame.value.integer
+                for s in range(s_count):
+                    if (valid >> s) & 1 and not (ready >> s) & 1:
+                        bp_cycles[s] += 1
+                    if (overflow >> s) & 1:
+                        drops[s] += 1
+                if cycle % occupancy_interval == 0:
+                    row = {'load': load, 'cycle': cycle}
+                    for s in range(s_count):
+                        row[f"s{s}"] = (in_bytes[s] - out_bytes[s])/fifo_depth
+                    occupancy_rows.append(row)
+                cycle += 1
+
+        drivers = [cocotb.start_soon(drive(s)) for s in range(s_count)]
+        receivers = [cocotb.start_soon(receive(m)) for m in range(m_count)]
+        watcher = cocotb.start_soon(watch())
+
+        await ClockCycles(dut.clk, warmup)
+        measuring = True
+        await ClockCycles(dut.clk, duration)
+        measuring = False
+
+        for d in drivers:
+            d.kill()
+        watcher.kill()
+
+        # drain, every queued frame must come out
+        pending = sum(len(lst) for lst_a in sent for lst in lst_a)
+        for k in range(pending*frame_len*2 // m_lanes + 10000):
+            if not any(any(lst) for lst in sent):
+                break
+            await RisingEdge(dut.clk)
+
+        for rx in receivers:
+            rx.kill()
+
+        assert not any(any(lst) for lst in sent)
+
+        for m in range(m_count):
+            shares = []
+            for s in range(s_count):
+                offered = load*s_lanes*matrix[s][m]
+                achieved = rx_bytes[s][m]/duration
+                if offered:
+                    shares.append(achieved/offered)
+                rows.append({
+                    'pattern': pattern,
+                    'load': load,
+                    's': s,
+                    'm': m,
+                    'frames': rx_bytes[s][m]//frame_len,
+                    'offered_bytes_per_cycle': offered,
+                    'bytes_per_cycle': achieved,
+                    'line_fraction': achieved/m_lanes,
+                    'backpressure_cycles': bp_cycles[s],
+                    'drops': drops[s],
+                })
+
+            demand = sum(load*s_lanes*matrix[s][m] for s in range(s_count))
+            achieved = sum(rx_bytes[s][m] for s in range(s_count))/duration
+            fairness = jain_index(shares)
+            rows.append({
+                'pattern': pattern,
+                'load': load,
+                's': "all",
+                'm': m,
+                'frames': sum(rx_bytes[s][m] for s in range(s_count))//frame_len,
+                'offered_bytes_per_cycle': demand,
+                'bytes_per_cycle': achieved,
+                'line_fraction': achieved/m_lanes,
+                'fairness': fairness,
+                'backpressure_cycles': sum(bp_cycles),
+                'drops': sum(drops),
+            })
+
+            tb.log.info("%s load %.2f: m%d %.3f of %.3f B/cycle offered (%.1f%% of line rate), fairness %.3f",
+                pattern, load, m, achieved, demand, achieved/m_lanes*100, fairness)
+
+            if demand <= 0.8*m_lanes:
+                # uncongested output keeps up with the offered load
+                assert achieved >= 0.9*demand
+            else:
+                # congested output is shared round robin between equal frames
+                assert fairness >= 0.9
+
+        tb.log.info("%s load %.2f: backpressure cycles %s, drops %s", pattern, load, bp_cycles, drops)
+
+    with open(f"axis_ram_switch_bench_{pattern}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=BENCH_FIELDS, lineterminator='\n')
+        w.writeheader()
+        w.writerows(rows)
+
+    with open(f"axis_ram_switch_occupancy_{pattern}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=['load', 'cycle']+[f"s{s}" for s in range(s_count)], lineterminator='\n')
+        w.writeheader()
+        w.writerows(occupancy_rows)
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
 def cycle_pause():
     return itertools.cycle([1, 1, 1, 0])
 
@@ -316,6 +525,12 @@ if cocotb.SIM_NAME:
     factory.add_option("backpressure_inserter", [None, cycle_pause])
     factory.generate_tests()
 
+    # slow, so opt-in
+    if bool(int(os.getenv("AXIS_RAM_SWITCH_BENCH", "0"))):
+        factory = TestFactory(run_bench_switch)
+        factory.add_option("pattern", ["uniform", "hotspot", "incast"])
+        factory.generate_tests()
+
 
 # cocotb-test
 
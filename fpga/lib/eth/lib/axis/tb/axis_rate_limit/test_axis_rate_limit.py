@@ -23,16 +23,18 @@ THE SOFTWARE.
 
 """
 
+import csv
 import itertools
 import logging
 import os
+import random
 
 import cocotb_test.simulator
 import pytest
 
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge
+from cocotb.triggers import RisingEdge, ReadOnly
 from cocotb.regression import TestFactory
 
 from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStreamSink
@@ -138,6 +140,155 @@ async def run_test_tuser_assert(dut):
     await RisingEdge(dut.clk)
 
 
+BENCH_FIELDS = ['mix', 'rate_by_frame', 'rate_num', 'rate_denom', 'target', 'cycles', 'beats', 'frames',
+    'rate', 'error', 'max_run', 'window_excess', 'gap_min', 'gap_mean', 'gap_max']
+
+
+def frame_mix(mix, byte_lanes, rng):
+    # returns a frame length generator, in bytes
+    if mix == "small":
+        return lambda: byte_lanes
+    elif mix == "large":
+        return lambda: byte_lanes*64
+    elif mix == "imix":
+        return lambda: rng.choices([64, 576, 1500], weights=[7, 4, 1])[0]
+    elif mix == "random":
+        return lambda: rng.randint(1, byte_lanes*32)
+    raise Exception(f"Unknown frame mix {mix}")
+
+
+async def run_bench_rate(dut, mix="small", rate_by_frame=0, duration=8000, warmup=200,
+        rates=((1, 1), (1, 2), (2, 3), (3, 7), (1, 10), (7, 8), (1, 255), (254, 255)), seed=1):
+
+    tb = TB(dut)
+
+    byte_lanes = tb.source.byte_lanes
+    rng = random.Random(seed)
+    next_len = frame_mix(mix, byte_lanes, rng)
+
+    rows = []
+    gap_rows = []
+
+    for num, denom in rates:
+        await tb.reset()
+
+        dut.rate_num.value = num
+        dut.rate_denom.value = denom
+        dut.rate_by_frame.value = rate_by_frame
+        await RisingEdge(dut.clk)
+
+        max_words = 0
+
+        async def feed():
+            # keep the source backlogged so the limiter alone sets the rate
+            nonlocal max_words
+            while True:
+                while tb.source.count() < 4:
+                    length = next_len()
+                    max_words = max(max_words, -(-length // byte_lanes))
+                    await tb.source.send(AxiStreamFrame(incrementing_payload(length)))
+                await RisingEdge(dut.clk)
+
+        async def drain():
+            while True:
+                await tb.sink.recv()
+
+        feed_cr = cocotb.start_soon(feed())
+        drain_cr = cocotb.start_soon(drain())
+
+        for k in range(warmup):
+            await RisingEdge(dut.clk)
+
+        # per-cycle output beats, and gaps from end of frame to start of next
+        beats = []
+        gaps = []
+        last_end = None
+        in_frame = False
+        frames = 0
+
+        for k in range(duration):
+            await RisingEdge(dut.clk)
+            await ReadOnly()
+            beat = bool(dut.m_axis_tvalid.value.integer and dut.m_axis_tready.value.integer)
+            beats.append(int(beat))
+            if beat:
+                if not in_frame and last_end is not None:
+                    gaps.append(k-last_end-1)
+                in_frame = True
+                if dut.m_axis_tlast.value.integer:
+                    in_frame = False
+                    last_end = k
+                    frames += 1
+
+        await RisingEdge(dut.clk)
+
+        # queued frames are flushed by the reset at the start of the next rate
+        feed_cr.kill()
+        drain_cr.kill()
+
+        target = min(num/denom, 1.0)
+        total = sum(beats)
+        rate = total/duration
+
+        # longest back-to-back run, and worst excess over the target in any
+        # window of denom cycles
+        max_run = 0
+        run = 0
+        for b in beats:
+            run = run+1 if b else 0
+            max_run = max(max_run, run)
+
+        prefix = list(itertools.accumulate(beats, initial=0))
+        window_excess = max(prefix[k+denom]-prefix[k] for k in range(len(beats)-denom+1))-target*denom
+
+        rows.append({
+            'mix': mix,
+            'rate_by_frame': rate_by_frame,
+            'rate_num': num,
+            'rate_denom': denom,
+            'target': target,
+            'cycles': duration,
+            'beats': total,
+            'frames': frames,
+            'rate': rate,
+            'error': rate/target-1,
+            'max_run': max_run,
+            'window_excess': window_excess,
+            'gap_min': min(gaps) if gaps else 0,
+            'gap_mean': sum(gaps)/len(gaps) if gaps else 0.0,
+            'gap_max': max(gaps) if gaps else 0,
+        })
+
+        for gap in sorted(set(gaps)):
+            gap_rows.append({'rate_by_frame': rate_by_frame, 'rate_num': num, 'rate_denom': denom,
+                'gap': gap, 'count': gaps.count(gap)})
+
+        tb.log.info("%s %d/%d by_frame %d: rate %.4f (target %.4f, error %+.2f%%), max run %d, window excess %.2f",
+            mix, num, denom, rate_by_frame, rate, target, (rate/target-1)*100, max_run, window_excess)
+
+        # the accumulator tracks the ratio exactly, so the long-run deficit is
+        # bounded by one accumulator period, plus one frame when pausing
+        # only on frame boundaries
+        slack = denom+2
+        if rate_by_frame:
+            slack += max_words
+        assert abs(total-target*duration) <= slack
+
+        if not rate_by_frame:
+            assert window_excess <= 2
+
+    with open(f"axis_rate_limit_bench_{mix}_{rate_by_frame}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=BENCH_FIELDS, lineterminator='\n')
+        w.writeheader()
+        w.writerows(rows)
+
+    with open(f"axis_rate_limit_gaps_{mix}_{rate_by_frame}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=['rate_by_frame', 'rate_num', 'rate_denom', 'gap', 'count'],
+            lineterminator='\n')
+        w.writeheader()
+        w.writerows(gap_rows)
+
+
 def cycle_pause():
     return itertools.cycle([1, 1, 1, 0])
 
@@ -166,6 +317,13 @@ if cocotb.SIM_NAME:
         factory = TestFactory(test)
         factory.generate_tests()
 
+    # slow, so opt-in
+    if bool(int(os.getenv("AXIS_RATE_LIMIT_BENCH", "0"))):
+        factory = TestFactory(run_bench_rate)
+        factory.add_option("mix", ["small", "large", "imix", "random"])
+        factory.add_option("rate_by_frame", [0, 1])
+        factory.generate_tests()
+
 
 # cocotb-test
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Compare wall time of MyHDL testbenches against their cocotb ports
+"""
+
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import time
+
+# legacy MyHDL testbenches that have a cocotb port, mapped to the pytest
+# node of the port; the MyHDL benches stay in tb/ until the ports are validated
+PORTED = {
+    'ip_eth_rx': 'tb/ip_eth_rx/test_ip_eth_rx.py::test_ip_eth_rx[ip_eth_rx]',
+    'ip_eth_rx_64': 'tb/ip_eth_rx/test_ip_eth_rx.py::test_ip_eth_rx[ip_eth_rx_64]',
+    'ip_eth_tx': 'tb/ip_eth_tx/test_ip_eth_tx.py::test_ip_eth_tx[ip_eth_tx]',
+    'ip_eth_tx_64': 'tb/ip_eth_tx/test_ip_eth_tx.py::test_ip_eth_tx[ip_eth_tx_64]',
+    'udp_ip_rx': 'tb/udp_ip_rx/test_udp_ip_rx.py::test_udp_ip_rx[udp_ip_rx]',
+    'udp_ip_rx_64': 'tb/udp_ip_rx/test_udp_ip_rx.py::test_udp_ip_rx[udp_ip_rx_64]',
+    'udp_ip_tx': 'tb/udp_ip_tx/test_udp_ip_tx.py::test_udp_ip_tx[udp_ip_tx]',
+    'udp_ip_tx_64': 'tb/udp_ip_tx/test_udp_ip_tx.py::test_udp_ip_tx[udp_ip_tx_64]',
+}
+
+FIELDS = ['test', 'myhdl_s', 'myhdl_ok', 'cocotb_s', 'cocotb_ok', 'delta_s', 'speedup']
+
+
+def run(cmd, cwd):
+    start = time.monotonic()
+    ret = subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.monotonic()-start, ret.returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('tests', help="Tests to compare (default all ported)", nargs='*')
+    parser.add_argument('--csv', help="Write results to CSV file")
+
+    args = parser.parse_args()
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    tb_dir = os.path.join(root, 'tb')
+
+    rows = []
+
+    for name in args.tests or PORTED:
+        myhdl_s, myhdl_ok = run([sys.executable, f'test_{name}.py'], tb_dir)
+        cocotb_s, cocotb_ok = run([sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider',
+            PORTED[name]], root)
+
+        row = {
+            'test': name,
+            'myhdl_s': myhdl_s,
+            'myhdl_ok': myhdl_ok,
+            'cocotb_s': cocotb_s,
+            'cocotb_ok': cocotb_ok,
+            'delta_s': cocotb_s-myhdl_s,
+            'speedup': myhdl_s/cocotb_s if cocotb_s else 0.0,
+        }
+        rows.append(row)
+
+        print(f"{name:<20} MyHDL {myhdl_s:8.1f} s{'' if myhdl_ok else ' (FAIL)':7} "
+            f"cocotb {cocotb_s:8.1f} s{'' if cocotb_ok else ' (FAIL)':7} "
+            f"delta {row['delta_s']:+8.1f} s  x{row['speedup']:.2f}")
+
+    myhdl_total = sum(r['myhdl_s'] for r in rows)
+    cocotb_total = sum(r['cocotb_s'] for r in rows)
+    print(f"{'total':<20} MyHDL {myhdl_total:8.1f} s        cocotb {cocotb_total:8.1f} s        "
+        f"delta {cocotb_total-myhdl_total:+8.1f} s")
+
+    if args.csv:
+        with open(args.csv, 'w') as f:
+            w = csv.DictWriter(f, fieldnames=FIELDS, lineterminator='\n')
+            w.writeheader()
+            w.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
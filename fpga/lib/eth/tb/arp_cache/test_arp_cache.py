@@ -23,10 +23,15 @@ THE SOFTWARE.
 
 """
 
+import csv
+import itertools
 import logging
 import os
+import random
+import zlib
 
 import cocotb_test.simulator
+import pytest
 
 import cocotb
 from cocotb.clock import Clock
@@ -42,6 +47,56 @@ CacheOpBus, CacheOpTransaction, CacheOpSource, CacheOpSink, CacheOpMonitor = def
 )
 
 
+def arp_hash(ip):
+    # CRC32 LFSR over the address without the final inversion, as arp_cache.v
+    return ~zlib.crc32(ip.to_bytes(4, 'little')) & 0xffffffff
+
+
+class ArpCacheModel:
+    """Direct mapped, indexed by the low bits of the hash, new entries replace old"""
+    def __init__(self, addr_width):
+        self.size = 2**addr_width
+        self.mask = self.size-1
+
+        self.entries = [None]*self.size
+        self.known = set()
+
+        self.clear_stats()
+
+    def clear(self):
+        self.entries = [None]*self.size
+
+    def clear_stats(self):
+        self.writes = 0
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.conflict_misses = 0
+
+    def index(self, ip):
+        return arp_hash(ip) & self.mask
+
+    def write(self, ip, mac):
+        idx = self.index(ip)
+        old = self.entries[idx]
+        if old is not None and old[0] != ip:
+            self.evictions += 1
+        self.entries[idx] = (ip, mac)
+        self.known.add(ip)
+        self.writes += 1
+
+    def query(self, ip):
+        entry = self.entries[self.index(ip)]
+        if entry is not None and entry[0] == ip:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if ip in self.known:
+            # was written, but evicted by a colliding address
+            self.conflict_misses += 1
+        return None
+
+
 class TB:
     def __init__(self, dut):
         self.dut = dut
@@ -209,10 +264,158 @@ async def run_test(dut):
     await RisingEdge(dut.clk)
 
 
+BENCH_FIELDS = ['pattern', 'round', 'writes', 'evictions', 'queries', 'hits', 'misses', 'conflict_misses',
+    'hit_rate', 'lat_mean', 'lat_p50', 'lat_p99', 'lat_max', 'mismatches']
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values)*p/100), len(sorted_values)-1)]
+
+
+def lookup_pattern(pattern, population, count, rng, offset=0):
+    if pattern == "uniform":
+        return [rng.choice(population) for k in range(count)]
+    elif pattern == "zipf":
+        # a few hot neighbours take most of the lookups
+        weights = [1/(k+1) for k in range(len(population))]
+        return rng.choices(population, weights=weights, k=count)
+    elif pattern == "scan":
+        return [population[(offset+k) % len(population)] for k in range(count)]
+    raise Exception(f"Unknown lookup pattern {pattern}")
+
+
+async def run_bench_cache(dut, pattern="uniform", population=None, rounds=8, churn=None, queries=None,
+        backpressure_inserter=None, seed=1):
+
+    tb = TB(dut)
+
+    addr_width = int(os.getenv("PARAM_CACHE_ADDR_WIDTH"))
+    model = ArpCacheModel(addr_width)
+    rng = random.Random(seed)
+
+    if population is None:
+        population = model.size*8
+    if churn is None:
+        churn = max(model.size // 2, 1)
+    if queries is None:
+        queries = model.size*2
+
+    neighbours = [0x0a000000 + k for k in range(population)]
+
+    await tb.reset()
+
+    if backpressure_inserter:
+        tb.query_response_sink.set_pause_generator(backpressure_inserter())
+
+    # wait for the clear after reset to finish
+    await RisingEdge(dut.write_request_ready)
+
+    # lookup latency in cycles, from request to response handshake
+    req_cycles = []
+    latencies = []
+    cycle = 0
+
+    async def watch():
+        nonlocal cycle
+        while True:
+            await RisingEdge(dut.clk)
+            if dut.query_request_valid.value.integer and dut.query_request_ready.value.integer:
+                req_cycles.append(cycle)
+            if dut.query_response_valid.value.integer and dut.query_response_ready.value.integer:
+                latencies.append(cycle-req_cycles.pop(0))
+            cycle += 1
+
+    watcher = cocotb.start_soon(watch())
+
+    rows = []
+
+    for rnd in range(rounds):
+        model.clear_stats()
+        latencies.clear()
+
+        # churn: neighbours (re)learned with fresh MACs
+        for ip in rng.sample(neighbours, min(churn, population)):
+            mac = rng.getrandbits(48)
+            model.write(ip, mac)
+            await tb.write_request_source.send(CacheOpTransaction(ip=ip, mac=mac))
+
+        await tb.write_request_source.wait()
+        # writes land in the table two cycles after the handshake
+        for k in range(3):
+            await RisingEdge(dut.clk)
+
+        lookups = lookup_pattern(pattern, neighbours, queries, rng, rnd*queries)
+
+        for ip in lookups:
+            await tb.query_request_source.send(CacheOpTransaction(ip=ip))
+
+        mismatches = 0
+
+        for ip in lookups:
+            expected = model.query(ip)
+            resp = await tb.query_response_sink.recv()
+            if expected is None:
+                if not resp.error:
+                    mismatches += 1
+            elif resp.error or int(resp.mac) != expected:
+                mismatches += 1
+
+        lat = sorted(latencies)
+
+        row = {
+            'pattern': pattern,
+            'round': rnd,
+            'writes': model.writes,
+            'evictions': model.evictions,
+            'queries': len(lookups),
+            'hits': model.hits,
+            'misses': model.misses,
+            'conflict_misses': model.conflict_misses,
+            'hit_rate': model.hits/len(lookups),
+            'lat_mean': sum(lat)/len(lat) if lat else 0.0,
+            'lat_p50': percentile(lat, 50),
+            'lat_p99': percentile(lat, 99),
+            'lat_max': lat[-1] if lat else 0,
+            'mismatches': mismatches,
+        }
+        rows.append(row)
+
+        tb.log.info("%s round %d: hit rate %.3f (%d conflict misses), %d evictions, latency p50 %d p99 %d max %d, %d mismatches",
+            pattern, rnd, row['hit_rate'], row['conflict_misses'], row['evictions'],
+            row['lat_p50'], row['lat_p99'], row['lat_max'], mismatches)
+
+        assert mismatches == 0
+
+    watcher.kill()
+
+    with open(f"arp_cache_bench_{pattern}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=BENCH_FIELDS, lineterminator='\n')
+        w.writeheader()
+        w.writerows(rows)
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+def cycle_pause():
+    return itertools.cycle([1, 1, 1, 0])
+
+
 if cocotb.SIM_NAME:
 
-    factory = TestFactory(run_test)
-    factory.generate_tests()
+    # the directed test relies on hash collisions in a 4 entry cache
+    if int(os.getenv("PARAM_CACHE_ADDR_WIDTH")) == 2:
+        factory = TestFactory(run_test)
+        factory.generate_tests()
+
+    # slow, so opt-in
+    if bool(int(os.getenv("ARP_CACHE_BENCH", "0"))):
+        factory = TestFactory(run_bench_cache)
+        factory.add_option("pattern", ["uniform", "zipf", "scan"])
+        factory.add_option("backpressure_inserter", [None, cycle_pause])
+        factory.generate_tests()
 
 
 # cocotb-test
@@ -223,7 +426,8 @@ lib_dir = os.path.abspath(os.path.join(rtl_dir, '..', 'lib'))
 axis_rtl_dir = os.path.abspath(os.path.join(lib_dir, 'axis', 'rtl'))
 
 
-def test_arp_cache(request):
+@pytest.mark.parametrize("cache_addr_width", [2, 9])
+def test_arp_cache(request, cache_addr_width):
     dut = "arp_cache"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
@@ -235,7 +439,7 @@ def test_arp_cache(request):
 
     parameters = {}
 
-    parameters['CACHE_ADDR_WIDTH'] = 2
+    parameters['CACHE_ADDR_WIDTH'] = cache_addr_width
 
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
 
@@ -25,9 +25,7 @@ THE SOFTWARE.
 from myhdl import *
 
 import xgmii_ep
-
-ETH_PRE = 0x55
-ETH_SFD = 0xD5
+from eth_fcs import ETH_PRE
 
 XGMII_IDLE   = 0x07
 XGMII_LPI    = 0x06
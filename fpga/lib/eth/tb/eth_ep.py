@@ -25,10 +25,14 @@ THE SOFTWARE.
 from myhdl import *
 import axis_ep
 import struct
-import zlib
+
+import eth_fcs
 
 class EthFrame(object):
     def __init__(self, payload=b'', eth_dest_mac=0, eth_src_mac=0, eth_type=0, eth_fcs=None):
+        self._version = 0
+        self._wire = None
+        self._wire_key = None
         self._payload = axis_ep.AXIStreamFrame()
         self.eth_dest_mac = eth_dest_mac
         self.eth_src_mac = eth_src_mac
@@ -52,6 +56,12 @@ class EthFrame(object):
             self.eth_type = payload.eth_type
             self.eth_fcs = payload.eth_fcs
 
+    def __setattr__(self, name, value):
+        # any field change invalidates the cached wire image
+        if not name.startswith('_'):
+            object.__setattr__(self, '_version', self._version+1)
+        object.__setattr__(self, name, value)
+
     @property
     def payload(self):
         return self._payload
@@ -61,33 +71,45 @@ class EthFrame(object):
         self._payload = axis_ep.AXIStreamFrame(value)
 
     def calc_fcs(self):
-        frame = self.build_axis().data
-
-        return zlib.crc32(bytes(frame)) & 0xffffffff
+        return eth_fcs.crc32_chain([self.build_header(), bytes(self.payload.data)])
 
     def update_fcs(self):
         self.eth_fcs = self.calc_fcs()
 
-    def build_axis(self):
+    def build_header(self):
         data = b''
 
         data += struct.pack('>Q', self.eth_dest_mac)[2:]
         data += struct.pack('>Q', self.eth_src_mac)[2:]
         data += struct.pack('>H', self.eth_type)
 
+        return data
+
+    def build_axis(self):
+        data = self.build_header()
+
         data += self.payload.data
 
         return axis_ep.AXIStreamFrame(data)
 
     def build_axis_fcs(self):
+        return axis_ep.AXIStreamFrame(self.build_wire()[len(eth_fcs.ETH_PREAMBLE):])
+
+    def build_wire(self):
+        # preamble, SFD, frame, and FCS, cached until a field is assigned;
+        # the payload buffer is compared by identity and length, so reassign
+        # the payload after editing it in place
         if self.eth_fcs is None:
             self.update_fcs()
 
-        data = self.build_axis().data
+        data = self._payload.data
+        key = (self._version, id(data), len(data))
 
-        data += struct.pack('<L', self.eth_fcs)
+        if key != self._wire_key:
+            self._wire = eth_fcs.wire_image(self.build_header()+bytes(data), self.eth_fcs)
+            self._wire_key = key
 
-        return axis_ep.AXIStreamFrame(data)
+        return self._wire
 
     def parse_axis(self, data):
         data = axis_ep.AXIStreamFrame(data).data
@@ -0,0 +1,74 @@
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+
+import struct
+import zlib
+
+ETH_PRE = 0x55
+ETH_SFD = 0xD5
+
+ETH_PREAMBLE = bytes([ETH_PRE]*7+[ETH_SFD])
+
+# CRC over a frame including a valid FCS
+FCS_RESIDUE = 0x2144df1c
+
+
+def crc32(data, crc=0):
+    # incremental, pass the previous result to continue over chained buffers
+    return zlib.crc32(data, crc) & 0xffffffff
+
+
+def crc32_chain(buffers, crc=0):
+    for buf in buffers:
+        crc = zlib.crc32(buf, crc)
+    return crc & 0xffffffff
+
+
+def crc32_batch(frames):
+    return [zlib.crc32(f) & 0xffffffff for f in frames]
+
+
+def append_fcs(data):
+    data = bytes(data)
+    return data + struct.pack('<L', zlib.crc32(data) & 0xffffffff)
+
+
+def check_fcs(data):
+    # data includes the FCS
+    return len(data) >= 4 and zlib.crc32(data) & 0xffffffff == FCS_RESIDUE
+
+
+def check_fcs_batch(frames):
+    # frames include the FCS; a valid FCS leaves the CRC residue
+    frames = [bytes(f) for f in frames]
+    return [len(f) >= 4 and crc == FCS_RESIDUE for f, crc in zip(frames, crc32_batch(frames))]
+
+
+def wire_image(data, fcs=None):
+    # preamble, SFD, frame, FCS
+    data = bytes(data)
+    if fcs is None:
+        fcs = zlib.crc32(data) & 0xffffffff
+    return ETH_PREAMBLE + data + struct.pack('<L', fcs)
@@ -32,6 +32,8 @@ class GMIIFrame(object):
         if type(data) is GMIIFrame:
             self.data = data.data
             self.error = data.error
+        elif hasattr(data, 'build_wire'):
+            self.data = data.build_wire()
         else:
             self.data = bytearray(data)
 
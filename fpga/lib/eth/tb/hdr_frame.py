@@ -0,0 +1,299 @@
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import ipaddress
+import itertools
+import struct
+
+from scapy.layers.l2 import Ether
+from scapy.layers.inet import IP, UDP
+
+import cocotb
+from cocotb.triggers import RisingEdge
+from cocotb_bus.bus import Bus
+
+from cocotbext.axi import AxiStreamSource, AxiStreamSink, AxiStreamFrame
+from cocotbext.axi.stream import define_stream
+
+
+# header plus AXI stream payload interfaces of the Ethernet, IP and UDP modules
+
+EthHdrBus, EthHdrTransaction, EthHdrSource, EthHdrSink, EthHdrMonitor = define_stream("EthHdr",
+    signals=["hdr_valid", "hdr_ready", "dest_mac", "src_mac", "type"]
+)
+
+IpHdrBus, IpHdrTransaction, IpHdrSource, IpHdrSink, IpHdrMonitor = define_stream("IpHdr",
+    signals=["hdr_valid", "hdr_ready", "dscp", "ecn", "ttl", "source_ip", "dest_ip"],
+    optional_signals=["eth_dest_mac", "eth_src_mac", "eth_type", "version", "ihl", "length",
+        "identification", "flags", "fragment_offset", "protocol", "header_checksum"]
+)
+
+UdpHdrBus, UdpHdrTransaction, UdpHdrSource, UdpHdrSink, UdpHdrMonitor = define_stream("UdpHdr",
+    signals=["hdr_valid", "hdr_ready", "source_port", "dest_port", "length", "checksum"],
+    optional_signals=["eth_dest_mac", "eth_src_mac", "eth_type", "ip_version", "ip_ihl", "ip_dscp",
+        "ip_ecn", "ip_length", "ip_identification", "ip_flags", "ip_fragment_offset", "ip_ttl",
+        "ip_protocol", "ip_header_checksum", "ip_source_ip", "ip_dest_ip"]
+)
+
+IP_FIELDS = ["version", "ihl", "dscp", "ecn", "length", "identification", "flags", "fragment_offset",
+    "ttl", "protocol", "header_checksum", "source_ip", "dest_ip"]
+
+
+def hdr_bus(bus_cls, entity, prefix, eth_prefix=None, ip_prefix=None):
+    # the parser and framer modules carry the Ethernet and IP fields of a
+    # header port under their own prefixes, e.g. m_eth_dest_mac next to
+    # m_ip_hdr_valid, so map the field names explicitly
+    def sig(name):
+        if eth_prefix and name.startswith("eth_"):
+            return f"{eth_prefix}_{name[4:]}"
+        if ip_prefix and name.startswith("ip_"):
+            return f"{ip_prefix}_{name[3:]}"
+        return f"{prefix}_{name}"
+
+    bus = bus_cls.__new__(bus_cls)
+    Bus.__init__(bus, entity, None, {s: sig(s) for s in bus_cls._signals},
+        optional_signals={s: sig(s) for s in bus_cls._optional_signals})
+    bus._name = prefix
+    return bus
+
+
+# conversion between raw frames (Ethernet header onwards) and header transactions
+
+def _unpack_eth(raw):
+    return int.from_bytes(raw[0:6], 'big'), int.from_bytes(raw[6:12], 'big'), int.from_bytes(raw[12:14], 'big')
+
+
+def _unpack_ip(raw, offset=14):
+    vihl, tos, length, ident, ff, ttl, proto, csum, src, dst = struct.unpack_from('>BBHHHBBHII', raw, offset)
+    return [vihl >> 4, vihl & 0xf, tos >> 2, tos & 3, length, ident, ff >> 13, ff & 0x1fff,
+        ttl, proto, csum, src, dst]
+
+
+def _pack_eth(dest_mac, src_mac, eth_type):
+    return dest_mac.to_bytes(6, 'big') + src_mac.to_bytes(6, 'big') + eth_type.to_bytes(2, 'big')
+
+
+def _pack_ip(version, ihl, dscp, ecn, length, ident, flags, frag, ttl, proto, csum, src, dst):
+    return struct.pack('>BBHHHBBHII', (version << 4) | ihl, (dscp << 2) | ecn, length, ident,
+        (flags << 13) | frag, ttl, proto, csum, src, dst)
+
+
+def eth_hdr_from_bytes(raw):
+    hdr = EthHdrTransaction()
+    hdr.dest_mac, hdr.src_mac, hdr.type = _unpack_eth(raw)
+    return hdr, bytes(raw[14:])
+
+
+def eth_hdr_to_bytes(hdr, payload):
+    return _pack_eth(int(hdr.dest_mac), int(hdr.src_mac), int(hdr.type)) + bytes(payload)
+
+
+def ip_hdr_from_bytes(raw):
+    hdr = IpHdrTransaction()
+    hdr.eth_dest_mac, hdr.eth_src_mac, hdr.eth_type = _unpack_eth(raw)
+    for name, val in zip(IP_FIELDS, _unpack_ip(raw)):
+        setattr(hdr, name, val)
+    return hdr, bytes(raw[34:])
+
+
+def ip_hdr_to_bytes(hdr, payload):
+    return (_pack_eth(int(hdr.eth_dest_mac), int(hdr.eth_src_mac), int(hdr.eth_type)) +
+        _pack_ip(*[int(getattr(hdr, name)) for name in IP_FIELDS]) + bytes(payload))
+
+
+def udp_hdr_from_bytes(raw):
+    hdr = UdpHdrTransaction()
+    hdr.eth_dest_mac, hdr.eth_src_mac, hdr.eth_type = _unpack_eth(raw)
+    for name, val in zip(IP_FIELDS, _unpack_ip(raw)):
+        setattr(hdr, "ip_"+name, val)
+    hdr.source_port, hdr.dest_port, hdr.length, hdr.checksum = struct.unpack_from('>HHHH', raw, 34)
+    return hdr, bytes(raw[42:])
+
+
+def udp_hdr_to_bytes(hdr, payload):
+    return (_pack_eth(int(hdr.eth_dest_mac), int(hdr.eth_src_mac), int(hdr.eth_type)) +
+        _pack_ip(*[int(getattr(hdr, "ip_"+name)) for name in IP_FIELDS]) +
+        struct.pack('>HHHH', int(hdr.source_port), int(hdr.dest_port), int(hdr.length), int(hdr.checksum)) +
+        bytes(payload))
+
+
+HDR_KINDS = {
+    "eth": (EthHdrSource, EthHdrSink, eth_hdr_from_bytes, eth_hdr_to_bytes),
+    "ip": (IpHdrSource, IpHdrSink, ip_hdr_from_bytes, ip_hdr_to_bytes),
+    "udp": (UdpHdrSource, UdpHdrSink, udp_hdr_from_bytes, udp_hdr_to_bytes),
+}
+
+
+def last_tuser(frame):
+    tuser = frame.tuser
+    if isinstance(tuser, list):
+        return tuser[-1] if tuser else 0
+    return tuser or 0
+
+
+class HdrFrameSource:
+    """Drives a header port and its payload stream from raw frames"""
+    def __init__(self, kind, header_bus, payload_bus, clock, reset=None):
+        source_cls, _, self.from_bytes, _ = HDR_KINDS[kind]
+        self.header_source = source_cls(header_bus, clock, reset)
+        self.payload_source = AxiStreamSource(payload_bus, clock, reset)
+
+    def set_pause_generator(self, generator=None):
+        if generator:
+            self.header_source.set_pause_generator(generator())
+            self.payload_source.set_pause_generator(generator())
+
+    def payload(self, raw):
+        return self.from_bytes(raw)[1]
+
+    async def send(self, raw, tuser=0, payload=None):
+        # payload overrides the one taken from the frame, for trailing
+        # bytes and truncation
+        hdr, data = self.from_bytes(raw)
+        if payload is not None:
+            data = payload
+        await self.header_source.send(hdr)
+        await self.payload_source.send(AxiStreamFrame(data, tuser=tuser))
+
+    def empty(self):
+        return self.header_source.empty() and self.payload_source.empty()
+
+
+class HdrFrameSink:
+    """Collects a header port and its payload stream as raw frames"""
+    def __init__(self, kind, header_bus, payload_bus, clock, reset=None):
+        _, sink_cls, _, self.to_bytes = HDR_KINDS[kind]
+        self.header_sink = sink_cls(header_bus, clock, reset)
+        self.payload_sink = AxiStreamSink(payload_bus, clock, reset)
+
+    def set_pause_generator(self, generator=None):
+        if generator:
+            self.header_sink.set_pause_generator(generator())
+            self.payload_sink.set_pause_generator(generator())
+
+    async def recv(self):
+        hdr = await self.header_sink.recv()
+        frame = await self.payload_sink.recv()
+        return self.to_bytes(hdr, frame.tdata), last_tuser(frame)
+
+    def empty(self):
+        return self.header_sink.empty() and self.payload_sink.empty()
+
+
+class ErrorMonitor:
+    """Latches single cycle error strobes until cleared"""
+    def __init__(self, dut, clock, names):
+        self.clock = clock
+        self.signals = {name: getattr(dut, name) for name in names}
+        self.asserted = {}
+        self.clear()
+        cocotb.start_soon(self._run())
+
+    def clear(self):
+        self.asserted = {name: False for name in self.signals}
+
+    async def _run(self):
+        while True:
+            await RisingEdge(self.clock)
+            for name, sig in self.signals.items():
+                if sig.value.is_resolvable and sig.value.integer:
+                    self.asserted[name] = True
+
+
+# test frames
+
+def ip_test_frame(payload, dest_ip=0xc0a80165, ihl=5, header_checksum=None, protocol=0x11):
+    pkt = Ether(dst='DA:D1:D2:D3:D4:D5', src='5A:51:52:53:54:55', type=0x0800)
+    pkt /= IP(ihl=ihl, id=0, flags=2, ttl=64, proto=protocol, chksum=header_checksum,
+        src='192.168.1.100', dst=str(ipaddress.IPv4Address(dest_ip)))
+    return bytes(pkt / payload)
+
+
+def udp_test_frame(payload, dest_ip=0xc0a80165):
+    pkt = Ether(dst='DA:D1:D2:D3:D4:D5', src='5A:51:52:53:54:55', type=0x0800)
+    pkt /= IP(id=0, flags=2, ttl=64, src='192.168.1.100', dst=str(ipaddress.IPv4Address(dest_ip)))
+    pkt /= UDP(sport=1, dport=2)
+    return bytes(pkt / payload)
+
+
+def cycle_pause():
+    return itertools.cycle([1, 1, 1, 0])
+
+
+def size_list():
+    return list(range(1, 18)) + [64, 512, 1472]
+
+
+def incrementing_payload(length):
+    return bytes(itertools.islice(itertools.cycle(range(256)), length))
+
+
+# internet checksums
+
+def ones_sum(data):
+    # ones' complement sum of big endian 16 bit words; 2**16 is 1 mod 0xffff,
+    # so reducing the whole buffer as one integer folds every word at once
+    if len(data) & 1:
+        data = bytes(data) + b'\x00'
+    val = int.from_bytes(data, 'big')
+    s = val % 0xffff
+    return 0xffff if s == 0 and val else s
+
+
+def inet_checksum(data):
+    return ~ones_sum(data) & 0xffff
+
+
+def udp_pseudo_header(src_ip, dst_ip, length):
+    return struct.pack('>IIBBH', src_ip, dst_ip, 0, 17, length)
+
+
+def build_ipv4_udp(src_ip, dst_ip, src_port, dst_port, payload, ident=0, ttl=64):
+    # IPv4 + UDP packet with both checksums filled in
+    udp_len = 8+len(payload)
+    udp_hdr = struct.pack('>HHHH', src_port, dst_port, udp_len, 0)
+    csum = inet_checksum(udp_pseudo_header(src_ip, dst_ip, udp_len) + udp_hdr + payload) or 0xffff
+    udp_hdr = udp_hdr[:6] + struct.pack('>H', csum)
+
+    ip_hdr = struct.pack('>BBHHHBBHII', 0x45, 0, 20+udp_len, ident, 0x4000, ttl, 17, 0, src_ip, dst_ip)
+    ip_hdr = ip_hdr[:10] + struct.pack('>H', inet_checksum(ip_hdr)) + ip_hdr[12:]
+
+    return ip_hdr + udp_hdr + payload
+
+
+def check_ipv4_udp_batch(packets):
+    # verify IP header and UDP checksums of a list of IPv4 packets, returns
+    # the indices of the bad ones; each checksum is one bulk reduction
+    bad = []
+    for k, pkt in enumerate(packets):
+        ihl = (pkt[0] & 0xf)*4
+        if ones_sum(pkt[:ihl]) != 0xffff:
+            bad.append(k)
+            continue
+        src_ip, dst_ip = struct.unpack_from('>II', pkt, 12)
+        udp = pkt[ihl:]
+        udp_len, csum = struct.unpack_from('>HH', udp, 4)
+        if csum and ones_sum(udp_pseudo_header(src_ip, dst_ip, udp_len) + udp[:udp_len]) != 0xffff:
+            bad.append(k)
+    return bad
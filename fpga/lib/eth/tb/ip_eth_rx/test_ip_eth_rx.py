@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import logging
+import os
+import sys
+
+import cocotb_test.simulator
+import pytest
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge
+from cocotb.regression import TestFactory
+
+from cocotbext.axi import AxiStreamBus
+
+try:
+    from hdr_frame import EthHdrBus, IpHdrBus, hdr_bus, HdrFrameSource, HdrFrameSink, ErrorMonitor
+    from hdr_frame import ip_test_frame, cycle_pause, size_list, incrementing_payload
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from hdr_frame import EthHdrBus, IpHdrBus, hdr_bus, HdrFrameSource, HdrFrameSink, ErrorMonitor
+        from hdr_frame import ip_test_frame, cycle_pause, size_list, incrementing_payload
+    finally:
+        del sys.path[0]
+
+
+class TB:
+    def __init__(self, dut):
+        self.dut = dut
+
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        cocotb.start_soon(Clock(dut.clk, 8, units="ns").start())
+
+        self.source = HdrFrameSource("eth", EthHdrBus.from_prefix(dut, "s_eth"),
+            AxiStreamBus.from_prefix(dut, "s_eth_payload_axis"), dut.clk, dut.rst)
+        self.sink = HdrFrameSink("ip", hdr_bus(IpHdrBus, dut, "m_ip", eth_prefix="m_eth"),
+            AxiStreamBus.from_prefix(dut, "m_ip_payload_axis"), dut.clk, dut.rst)
+
+        self.errors = ErrorMonitor(dut, dut.clk, ["error_header_early_termination",
+            "error_payload_early_termination", "error_invalid_header", "error_invalid_checksum"])
+
+    def set_idle_generator(self, generator=None):
+        self.source.set_pause_generator(generator)
+
+    def set_backpressure_generator(self, generator=None):
+        self.sink.set_pause_generator(generator)
+
+    async def reset(self):
+        self.dut.rst.setimmediatevalue(0)
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.rst.value = 1
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.rst.value = 0
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+
+
+async def run_test(dut, payload_lengths=None, payload_data=None, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    test_frames = [ip_test_frame(payload_data(x), dest_ip=0xc0a80165+(k & 1))
+        for k, x in enumerate(payload_lengths())]
+
+    for test_frame in test_frames:
+        await tb.source.send(test_frame)
+
+    for test_frame in test_frames:
+        rx_frame, tuser = await tb.sink.recv()
+
+        assert rx_frame == test_frame
+        assert not tuser
+
+    assert tb.sink.empty()
+    assert not any(tb.errors.asserted.values())
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+async def run_test_tuser_assert(dut, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    for payload_len in range(1, 18):
+        test_frame1 = ip_test_frame(incrementing_payload(payload_len), dest_ip=0xc0a80165)
+        test_frame2 = ip_test_frame(incrementing_payload(payload_len), dest_ip=0xc0a80166)
+
+        await tb.source.send(test_frame1, tuser=1)
+        await tb.source.send(test_frame2)
+
+        rx_frame, tuser = await tb.sink.recv()
+        assert rx_frame == test_frame1
+        assert tuser
+
+        rx_frame, tuser = await tb.sink.recv()
+        assert rx_frame == test_frame2
+        assert not tuser
+
+        assert tb.sink.empty()
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+async def run_test_trailing_bytes(dut, trailing_bytes=1, tuser=False, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    for payload_len in range(1, 18):
+        test_frame1 = ip_test_frame(incrementing_payload(payload_len), dest_ip=0xc0a80165)
+        test_frame2 = ip_test_frame(incrementing_payload(payload_len), dest_ip=0xc0a80166)
+
+        # Ethernet payload longer than the IP length, the excess is dropped
+        await tb.source.send(test_frame1, tuser=int(tuser),
+            payload=tb.source.payload(test_frame1)+bytes(trailing_bytes))
+        await tb.source.send(test_frame2)
+
+        rx_frame, rx_tuser = await tb.sink.recv()
+        assert rx_frame == test_frame1
+        assert bool(rx_tuser) == tuser
+
+        rx_frame, rx_tuser = await tb.sink.recv()
+        assert rx_frame == test_frame2
+        assert not rx_tuser
+
+        assert tb.sink.empty()
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+async def run_test_truncated_payload(dut, truncate=1, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    for payload_len in range(1, 18):
+        test_frame1 = ip_test_frame(incrementing_payload(payload_len+truncate), dest_ip=0xc0a80165)
+        test_frame2 = ip_test_frame(incrementing_payload(payload_len), dest_ip=0xc0a80166)
+
+        tb.errors.clear()
+
+        await tb.source.send(test_frame1, payload=tb.source.payload(test_frame1)[:-truncate])
+        await tb.source.send(test_frame2)
+
+        rx_frame, tuser = await tb.sink.recv()
+        assert tuser
+        assert tb.errors.asserted["error_payload_early_termination"]
+
+        rx_frame, tuser = await tb.sink.recv()
+        assert rx_frame == test_frame2
+        assert not tuser
+
+        assert tb.sink.empty()
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+async def run_test_bad_header(dut, fault="ihl", idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    if fault == "ihl":
+        error = "error_invalid_header"
+        kwargs = {'ihl': 6}
+    else:
+        error = "error_invalid_checksum"
+        kwargs = {'header_checksum': 0x1234}
+
+    for payload_len in range(1, 18):
+        test_frame1 = ip_test_frame(incrementing_payload(payload_len), dest_ip=0xc0a80165, **kwargs)
+        test_frame2 = ip_test_frame(incrementing_payload(payload_len), dest_ip=0xc0a80166)
+
+        tb.errors.clear()
+
+        await tb.source.send(test_frame1)
+        await tb.source.send(test_frame2)
+
+        # bad frame is dropped
+        rx_frame, tuser = await tb.sink.recv()
+        assert tb.errors.asserted[error]
+        assert rx_frame == test_frame2
+        assert not tuser
+
+        assert tb.sink.empty()
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+async def run_test_truncated_header(dut, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    for length in range(1, 21):
+        test_frame1 = ip_test_frame(incrementing_payload(16), dest_ip=0xc0a80165)
+        test_frame2 = ip_test_frame(incrementing_payload(16), dest_ip=0xc0a80166)
+
+        tb.errors.clear()
+
+        await tb.source.send(test_frame1, payload=tb.source.payload(test_frame1)[:length])
+        await tb.source.send(test_frame2)
+
+        rx_frame, tuser = await tb.sink.recv()
+        assert tb.errors.asserted["error_header_early_termination"]
+        assert rx_frame == test_frame2
+        assert not tuser
+
+        assert tb.sink.empty()
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+if cocotb.SIM_NAME:
+
+    factory = TestFactory(run_test)
+    factory.add_option("payload_lengths", [size_list])
+    factory.add_option("payload_data", [incrementing_payload])
+    factory.add_option("idle_inserter", [None, cycle_pause])
+    factory.add_option("backpressure_inserter", [None, cycle_pause])
+    factory.generate_tests()
+
+    for test in [run_test_tuser_assert, run_test_truncated_header]:
+
+        factory = TestFactory(test)
+        factory.add_option("idle_inserter", [None, cycle_pause])
+        factory.add_option("backpressure_inserter", [None, cycle_pause])
+        factory.generate_tests()
+
+    factory = TestFactory(run_test_trailing_bytes)
+    factory.add_option("trailing_bytes", [1, 10])
+    factory.add_option("tuser", [False, True])
+    factory.add_option("idle_inserter", [None, cycle_pause])
+    factory.add_option("backpressure_inserter", [None, cycle_pause])
+    factory.generate_tests()
+
+    factory = TestFactory(run_test_truncated_payload)
+    factory.add_option("truncate", [1, 10])
+    factory.add_option("idle_inserter", [None, cycle_pause])
+    factory.add_option("backpressure_inserter", [None, cycle_pause])
+    factory.generate_tests()
+
+    factory = TestFactory(run_test_bad_header)
+    factory.add_option("fault", ["ihl", "checksum"])
+    factory.add_option("idle_inserter", [None, cycle_pause])
+    factory.add_option("backpressure_inserter", [None, cycle_pause])
+    factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.abspath(os.path.dirname(__file__))
+rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
+lib_dir = os.path.abspath(os.path.join(rtl_dir, '..', 'lib'))
+axis_rtl_dir = os.path.abspath(os.path.join(lib_dir, 'axis', 'rtl'))
+
+
+@pytest.mark.parametrize("dut", ["ip_eth_rx", "ip_eth_rx_64"])
+def test_ip_eth_rx(request, dut):
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(rtl_dir, f"{dut}.v"),
+    ]
+
+    parameters = {}
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
@@ -162,9 +162,7 @@ def bench():
             test_frame.payload = bytearray(range(payload_len))
             test_frame.update_fcs()
 
-            axis_frame = test_frame.build_axis_fcs()
-
-            xgmii_frame = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame))
+            xgmii_frame = xgmii_ep.XGMIIFrame(test_frame)
 
             source.send(xgmii_frame)
 
@@ -198,11 +196,8 @@ def bench():
             test_frame2.payload = bytearray(range(payload_len))
             test_frame2.update_fcs()
 
-            axis_frame1 = test_frame1.build_axis_fcs()
-            axis_frame2 = test_frame2.build_axis_fcs()
-
-            xgmii_frame1 = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-            xgmii_frame2 = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+            xgmii_frame1 = xgmii_ep.XGMIIFrame(test_frame1)
+            xgmii_frame2 = xgmii_ep.XGMIIFrame(test_frame2)
 
             source.send(xgmii_frame1)
             source.send(xgmii_frame2)
@@ -247,7 +242,6 @@ def bench():
             test_frame2.update_fcs()
 
             axis_frame1 = test_frame1.build_axis_fcs()
-            axis_frame2 = test_frame2.build_axis_fcs()
 
             axis_frame1.data = axis_frame1.data[:-1]
 
@@ -255,7 +249,7 @@ def bench():
             error_bad_fcs_asserted.next = 0
 
             xgmii_frame1 = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-            xgmii_frame2 = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+            xgmii_frame2 = xgmii_ep.XGMIIFrame(test_frame2)
 
             source.send(xgmii_frame1)
             source.send(xgmii_frame2)
@@ -298,14 +292,11 @@ def bench():
             test_frame2.payload = bytearray(range(payload_len))
             test_frame2.update_fcs()
 
-            axis_frame1 = test_frame1.build_axis_fcs()
-            axis_frame2 = test_frame2.build_axis_fcs()
-
             error_bad_frame_asserted.next = 0
             error_bad_fcs_asserted.next = 0
 
-            xgmii_frame1 = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-            xgmii_frame2 = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+            xgmii_frame1 = xgmii_ep.XGMIIFrame(test_frame1)
+            xgmii_frame2 = xgmii_ep.XGMIIFrame(test_frame2)
 
             xgmii_frame1.error = 1
 
@@ -346,9 +337,7 @@ def bench():
                 test_frame.payload = bytearray(range(payload_len))
                 test_frame.update_fcs()
 
-                axis_frame = test_frame.build_axis_fcs()
-
-                source.send(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame))
+                source.send(test_frame)
 
             for i in range(10):
                 yield sink.wait()
@@ -377,9 +366,7 @@ def bench():
                 test_frame.payload = bytearray(range(payload_len))
                 test_frame.update_fcs()
 
-                axis_frame = test_frame.build_axis_fcs()
-
-                source.send(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame))
+                source.send(test_frame)
 
             for i in range(10):
                 yield sink.wait()
@@ -411,9 +398,7 @@ def bench():
                 test_frame.payload = bytearray(range(payload_len))
                 test_frame.update_fcs()
 
-                axis_frame = test_frame.build_axis_fcs()
-
-                source.send(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame))
+                source.send(test_frame)
 
             for i in range(10):
                 yield sink.wait()
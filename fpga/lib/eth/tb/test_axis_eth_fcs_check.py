@@ -25,11 +25,10 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
-import struct
-import zlib
 
 import axis_ep
 import eth_ep
+import eth_fcs
 
 module = 'axis_eth_fcs_check'
 testbench = 'test_%s' % module
@@ -333,6 +332,8 @@ def bench():
 
             axis_frame1.data[-1] ^= 0xff
 
+            assert eth_fcs.check_fcs_batch([axis_frame1.data, axis_frame2.data]) == [False, True]
+
             for wait in wait_normal, wait_pause_source, wait_pause_sink:
                 error_bad_fcs_asserted.next = 0
 
@@ -370,8 +371,7 @@ def bench():
             current_test.next = 5
 
             test_frame = bytearray(range(payload_len))
-            fcs = zlib.crc32(bytes(test_frame)) & 0xffffffff
-            test_frame_fcs = test_frame + struct.pack('<L', fcs)
+            test_frame_fcs = eth_fcs.append_fcs(test_frame)
 
             for wait in wait_normal, wait_pause_source, wait_pause_sink:
                 source.send(test_frame_fcs)
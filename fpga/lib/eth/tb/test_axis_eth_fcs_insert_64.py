@@ -26,10 +26,10 @@ THE SOFTWARE.
 from myhdl import *
 import os
 import struct
-import zlib
 
 import axis_ep
 import eth_ep
+import eth_fcs
 
 module = 'axis_eth_fcs_insert_64'
 testbench = 'test_%s' % module
@@ -352,7 +352,7 @@ def bench():
 
                 payload = rx_frame.data[:-4]
                 fcs = struct.unpack('<L', rx_frame.data[-4:])[0]
-                check_fcs = zlib.crc32(bytes(payload)) & 0xffffffff
+                check_fcs = eth_fcs.crc32(bytes(payload))
 
                 print(hex(fcs))
                 print(hex(check_fcs))
@@ -184,8 +184,7 @@ def bench():
                 test_frame.payload = bytearray(range(payload_len))
                 test_frame.update_fcs()
 
-                axis_frame = test_frame.build_axis_fcs()
-                gmii_frame = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame))
+                gmii_frame = gmii_ep.GMIIFrame(test_frame)
 
                 source.send(gmii_frame)
 
@@ -219,10 +218,8 @@ def bench():
                 test_frame2.payload = bytearray(range(payload_len))
                 test_frame2.update_fcs()
 
-                axis_frame1 = test_frame1.build_axis_fcs()
-                axis_frame2 = test_frame2.build_axis_fcs()
-                gmii_frame1 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-                gmii_frame2 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+                gmii_frame1 = gmii_ep.GMIIFrame(test_frame1)
+                gmii_frame2 = gmii_ep.GMIIFrame(test_frame2)
 
                 source.send(gmii_frame1)
                 source.send(gmii_frame2)
@@ -267,7 +264,6 @@ def bench():
                 test_frame2.update_fcs()
 
                 axis_frame1 = test_frame1.build_axis_fcs()
-                axis_frame2 = test_frame2.build_axis_fcs()
 
                 axis_frame1.data = axis_frame1.data[:-1]
 
@@ -275,7 +271,7 @@ def bench():
                 error_bad_fcs_asserted.next = 0
 
                 gmii_frame1 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-                gmii_frame2 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+                gmii_frame2 = gmii_ep.GMIIFrame(test_frame2)
 
                 source.send(gmii_frame1)
                 source.send(gmii_frame2)
@@ -318,14 +314,11 @@ def bench():
                 test_frame2.payload = bytearray(range(payload_len))
                 test_frame2.update_fcs()
 
-                axis_frame1 = test_frame1.build_axis_fcs()
-                axis_frame2 = test_frame2.build_axis_fcs()
-
                 error_bad_frame_asserted.next = 0
                 error_bad_fcs_asserted.next = 0
 
-                gmii_frame1 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-                gmii_frame2 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+                gmii_frame1 = gmii_ep.GMIIFrame(test_frame1)
+                gmii_frame2 = gmii_ep.GMIIFrame(test_frame2)
 
                 gmii_frame1.error = 1
 
@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import csv
+import logging
+import os
+import random
+import struct
+import sys
+
+from scapy.layers.l2 import ARP
+
+import cocotb_test.simulator
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge, with_timeout
+from cocotb.regression import TestFactory
+from cocotb.utils import get_sim_time
+
+from cocotbext.axi import AxiStreamBus, AxiStreamSource, AxiStreamSink, AxiStreamFrame
+
+try:
+    from hdr_frame import EthHdrBus, EthHdrTransaction, EthHdrSource, EthHdrSink
+    from hdr_frame import UdpHdrBus, UdpHdrTransaction, UdpHdrSource, UdpHdrSink
+    from hdr_frame import build_ipv4_udp, check_ipv4_udp_batch
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from hdr_frame import EthHdrBus, EthHdrTransaction, EthHdrSource, EthHdrSink
+        from hdr_frame import UdpHdrBus, UdpHdrTransaction, UdpHdrSource, UdpHdrSink
+        from hdr_frame import build_ipv4_udp, check_ipv4_udp_batch
+    finally:
+        del sys.path[0]
+
+
+LOCAL_MAC = 0x020000000000
+LOCAL_IP = 0xc0a80180
+GATEWAY_IP = 0xc0a80101
+SUBNET_MASK = 0xffffff00
+
+REMOTE_MAC = 0x5a5152535455
+REMOTE_MAC_STR = '5a:51:52:53:54:55'
+REMOTE_IP = 0xc0a80164
+
+CLK_PERIOD = 6.4
+
+BENCH_FIELDS = ['direction', 'datagrams', 'payload_bytes', 'wire_bytes', 'time_ns', 'pps', 'payload_gbps',
+    'bus_utilization', 'lat_mean', 'lat_p50', 'lat_p99', 'lat_max', 'arp_ns', 'checksum_errors']
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values)*p/100), len(sorted_values)-1)]
+
+
+def mixed_sizes(count, rng):
+    # small, medium and MTU-sized datagrams, plus uniformly random lengths
+    sizes = []
+    for k in range(count):
+        r = rng.random()
+        if r < 0.4:
+            sizes.append(rng.randint(1, 64))
+        elif r < 0.6:
+            sizes.append(rng.choice([512, 1024]))
+        elif r < 0.8:
+            sizes.append(1472)
+        else:
+            sizes.append(rng.randint(1, 1472))
+    return sizes
+
+
+class TB:
+    def __init__(self, dut):
+        self.dut = dut
+
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        cocotb.start_soon(Clock(dut.clk, CLK_PERIOD, units="ns").start())
+
+        self.eth_header_source = EthHdrSource(EthHdrBus.from_prefix(dut, "s_eth"), dut.clk, dut.rst)
+        self.eth_payload_source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "s_eth_payload_axis"), dut.clk, dut.rst)
+        self.eth_header_sink = EthHdrSink(EthHdrBus.from_prefix(dut, "m_eth"), dut.clk, dut.rst)
+        self.eth_payload_sink = AxiStreamSink(AxiStreamBus.from_prefix(dut, "m_eth_payload_axis"), dut.clk, dut.rst)
+
+        self.udp_header_source = UdpHdrSource(UdpHdrBus.from_prefix(dut, "s_udp"), dut.clk, dut.rst)
+        self.udp_payload_source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "s_udp_payload_axis"), dut.clk, dut.rst)
+        self.udp_header_sink = UdpHdrSink(UdpHdrBus.from_prefix(dut, "m_udp"), dut.clk, dut.rst)
+        self.udp_payload_sink = AxiStreamSink(AxiStreamBus.from_prefix(dut, "m_udp_payload_axis"), dut.clk, dut.rst)
+
+        # raw IP interface unused
+        dut.s_ip_hdr_valid.setimmediatevalue(0)
+        dut.s_ip_dscp.setimmediatevalue(0)
+        dut.s_ip_ecn.setimmediatevalue(0)
+        dut.s_ip_length.setimmediatevalue(0)
+        dut.s_ip_ttl.setimmediatevalue(0)
+        dut.s_ip_protocol.setimmediatevalue(0)
+        dut.s_ip_source_ip.setimmediatevalue(0)
+        dut.s_ip_dest_ip.setimmediatevalue(0)
+        dut.s_ip_payload_axis_tdata.setimmediatevalue(0)
+        dut.s_ip_payload_axis_tkeep.setimmediatevalue(0)
+        dut.s_ip_payload_axis_tvalid.setimmediatevalue(0)
+        dut.s_ip_payload_axis_tlast.setimmediatevalue(0)
+        dut.s_ip_payload_axis_tuser.setimmediatevalue(0)
+        dut.m_ip_hdr_ready.setimmediatevalue(1)
+        dut.m_ip_payload_axis_tready.setimmediatevalue(1)
+
+        dut.local_mac.setimmediatevalue(LOCAL_MAC)
+        dut.local_ip.setimmediatevalue(LOCAL_IP)
+        dut.gateway_ip.setimmediatevalue(GATEWAY_IP)
+        dut.subnet_mask.setimmediatevalue(SUBNET_MASK)
+        dut.clear_arp_cache.setimmediatevalue(0)
+
+        # IPv4 packets transmitted by the stack
+        self.tx_packets = []
+        self.arp_requests = 0
+
+    async def reset(self):
+        self.dut.rst.setimmediatevalue(0)
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.rst.value = 1
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.rst.value = 0
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+
+    def send_eth_nowait(self, dest_mac, src_mac, eth_type, payload):
+        # header and payload are queued together so ARP replies cannot
+        # interleave with the RX stream
+        hdr = EthHdrTransaction()
+        hdr.dest_mac = dest_mac
+        hdr.src_mac = src_mac
+        hdr.type = eth_type
+        self.eth_header_source.send_nowait(hdr)
+        self.eth_payload_source.send_nowait(AxiStreamFrame(payload))
+
+    def send_udp_nowait(self, dest_ip, source_port, dest_port, payload):
+        hdr = UdpHdrTransaction()
+        hdr.ip_dscp = 0
+        hdr.ip_ecn = 0
+        hdr.ip_ttl = 64
+        hdr.ip_source_ip = LOCAL_IP
+        hdr.ip_dest_ip = dest_ip
+        hdr.source_port = source_port
+        hdr.dest_port = dest_port
+        hdr.length = 8+len(payload)
+        hdr.checksum = 0
+        self.udp_header_source.send_nowait(hdr)
+        self.udp_payload_source.send_nowait(AxiStreamFrame(payload))
+
+    async def eth_responder(self):
+        # answer ARP requests for the remote host, collect everything else
+        while True:
+            hdr = await self.eth_header_sink.recv()
+            payload = await self.eth_payload_sink.recv()
+            assert not payload.tuser
+
+            if hdr.type.integer == 0x0806:
+                arp = ARP(bytes(payload.tdata))
+                self.arp_requests += 1
+                self.log.info("ARP request for %s", arp.pdst)
+                if arp.op == 1 and int.from_bytes(bytes(map(int, arp.pdst.split('.'))), 'big') == REMOTE_IP:
+                    reply = ARP(op=2, hwsrc=REMOTE_MAC_STR, psrc=arp.pdst,
+                        hwdst=arp.hwsrc, pdst=arp.psrc)
+                    self.send_eth_nowait(hdr.src_mac.integer, REMOTE_MAC, 0x0806, bytes(reply))
+            else:
+                assert hdr.type.integer == 0x0800
+                assert hdr.dest_mac.integer == REMOTE_MAC
+                assert hdr.src_mac.integer == LOCAL_MAC
+                self.tx_packets.append(bytes(payload.tdata))
+
+
+async def run_bench(dut, count=256, direction="both", seed=1):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    rng = random.Random(seed)
+
+    cocotb.start_soon(tb.eth_responder())
+
+    # startup: the first datagram to the remote host triggers ARP resolution
+    t0 = get_sim_time('ns')
+    tb.send_udp_nowait(REMOTE_IP, 1234, 5678, b'\x00'*16)
+    while not tb.tx_packets:
+        await RisingEdge(dut.clk)
+    arp_ns = get_sim_time('ns')-t0
+    tb.log.info("ARP resolution and first datagram: %d ns, %d request(s)", arp_ns, tb.arp_requests)
+    assert tb.arp_requests >= 1
+    assert not check_ipv4_udp_batch(tb.tx_packets)
+    tb.tx_packets.clear()
+
+    do_tx = direction in ("tx", "both")
+    do_rx = direction in ("rx", "both")
+
+    tx_payloads = [rng.randbytes(n) for n in mixed_sizes(count, rng)] if do_tx else []
+    rx_payloads = [rng.randbytes(n) for n in mixed_sizes(count, rng)] if do_rx else []
+
+    rx_packets = [build_ipv4_udp(REMOTE_IP, LOCAL_IP, 5678, 1234, payload, ident=k)
+        for k, payload in enumerate(rx_payloads)]
+
+    # header handshake times, in cycles, at each side of each direction;
+    # datagrams stay in order so latency pairs up first in, first out
+    tx_in = []
+    tx_out = []
+    rx_in = []
+    rx_out = []
+    errors = 0
+    cycle = 0
+    done = False
+
+    error_signals = [dut.ip_rx_error_header_early_termination, dut.ip_rx_error_payload_early_termination,
+        dut.ip_rx_error_invalid_header, dut.ip_rx_error_invalid_checksum,
+        dut.ip_tx_error_payload_early_termination, dut.ip_tx_error_arp_failed,
+        dut.udp_rx_error_header_early_termination, dut.udp_rx_error_payload_early_termination,
+        dut.udp_tx_error_payload_early_termination]
+
+    async def watch():
+        nonlocal cycle, errors
+        while not done:
+            await RisingEdge(dut.clk)
+            cycle += 1
+            if dut.s_udp_hdr_valid.value and dut.s_udp_hdr_ready.value:
+                tx_in.append(cycle)
+            if dut.m_eth_hdr_valid.value and dut.m_eth_hdr_ready.value and dut.m_eth_type.value == 0x0800:
+                tx_out.append(cycle)
+            if dut.s_eth_hdr_valid.value and dut.s_eth_hdr_ready.value and dut.s_eth_type.value == 0x0800:
+                rx_in.append(cycle)
+            if dut.m_udp_hdr_valid.value and dut.m_udp_hdr_ready.value:
+                rx_out.append(cycle)
+            for sig in error_signals:
+                if sig.value:
+                    errors += 1
+
+    watcher = cocotb.start_soon(watch())
+
+    rx_hdrs = []
+    rx_data = []
+
+    async def udp_receiver():
+        while len(rx_data) < len(rx_payloads):
+            rx_hdrs.append(await tb.udp_header_sink.recv())
+            frame = await tb.udp_payload_sink.recv()
+            assert not frame.tuser
+            rx_data.append(bytes(frame.tdata))
+
+    receiver = cocotb.start_soon(udp_receiver())
+
+    # offer everything at once, both directions run back to back
+    t_start = get_sim_time('ns')
+
+    for payload in tx_payloads:
+        tb.send_udp_nowait(REMOTE_IP, 1234, 5678, payload)
+
+    for pkt in rx_packets:
+        tb.send_eth_nowait(LOCAL_MAC, REMOTE_MAC, 0x0800, pkt)
+
+    tx_done = None
+    rx_done = None
+
+    async def wait_done():
+        nonlocal tx_done, rx_done
+        while tx_done is None or rx_done is None:
+            await RisingEdge(dut.clk)
+            if tx_done is None and len(tb.tx_packets) >= len(tx_payloads):
+                tx_done = get_sim_time('ns')
+            if rx_done is None and receiver.done():
+                rx_done = get_sim_time('ns')
+
+    await with_timeout(wait_done(), int(CLK_PERIOD*(sum(map(len, tx_payloads+rx_payloads))+100*count)*10), 'ns')
+
+    done = True
+    await watcher
+
+    assert errors == 0
+
+    # bulk verification of contents and checksums, after the run
+    assert len(tb.tx_packets) == len(tx_payloads)
+    tx_bad = check_ipv4_udp_batch(tb.tx_packets)
+    for pkt, payload in zip(tb.tx_packets, tx_payloads):
+        src_ip, dst_ip = struct.unpack_from('>II', pkt, 12)
+        assert (src_ip, dst_ip) == (LOCAL_IP, REMOTE_IP)
+        assert struct.unpack_from('>HHH', pkt, 20) == (1234, 5678, 8+len(payload))
+        assert pkt[28:] == payload
+
+    # the stack passes the IP and UDP headers through, so rebuild each packet
+    # from the received fields and check the checksums against the data
+    rx_rebuilt = []
+    assert len(rx_data) == len(rx_payloads)
+    for k, (hdr, data) in enumerate(zip(rx_hdrs, rx_data)):
+        assert hdr.ip_source_ip.integer == REMOTE_IP
+        assert hdr.ip_dest_ip.integer == LOCAL_IP
+        assert hdr.source_port.integer == 5678
+        assert hdr.dest_port.integer == 1234
+        assert hdr.length.integer == 8+len(rx_payloads[k])
+        assert data == rx_payloads[k]
+        ip_hdr = struct.pack('>BBHHHBBHII',
+            (hdr.ip_version.integer << 4) | hdr.ip_ihl.integer,
+            (hdr.ip_dscp.integer << 2) | hdr.ip_ecn.integer,
+            hdr.ip_length.integer, hdr.ip_identification.integer,
+            (hdr.ip_flags.integer << 13) | hdr.ip_fragment_offset.integer,
+            hdr.ip_ttl.integer, hdr.ip_protocol.integer, hdr.ip_header_checksum.integer,
+            hdr.ip_source_ip.integer, hdr.ip_dest_ip.integer)
+        udp_hdr = struct.pack('>HHHH', hdr.source_port.integer, hdr.dest_port.integer,
+            hdr.length.integer, hdr.checksum.integer)
+        rx_rebuilt.append(ip_hdr + udp_hdr + data)
+    rx_bad = check_ipv4_udp_batch(rx_rebuilt)
+
+    assert tb.eth_header_source.empty() and tb.udp_header_source.empty()
+
+    rows = []
+    for name, payloads, t_done, lat_in, lat_out, bad in [
+            ("tx", tx_payloads, tx_done, tx_in, tx_out, tx_bad),
+            ("rx", rx_payloads, rx_done, rx_in, rx_out, rx_bad)]:
+        if not payloads:
+            continue
+
+        # 14 byte Ethernet header and 28 bytes of IP and UDP headers per datagram
+        payload_bytes = sum(len(p) for p in payloads)
+        wire_bytes = payload_bytes + 42*len(payloads)
+        time_ns = t_done-t_start
+        cycles = time_ns/CLK_PERIOD
+
+        lat = sorted(b-a for a, b in zip(lat_in, lat_out))
+        assert len(lat) == len(payloads)
+
+        row = {
+            'direction': name,
+            'datagrams': len(payloads),
+            'payload_bytes': payload_bytes,
+            'wire_bytes': wire_bytes,
+            'time_ns': time_ns,
+            'pps': len(payloads)/time_ns*1e9,
+            'payload_gbps': payload_bytes*8/time_ns,
+            'bus_utilization': (wire_bytes-14*len(payloads))/(cycles*8),
+            'lat_mean': sum(lat)/len(lat),
+            'lat_p50': percentile(lat, 50),
+            'lat_p99': percentile(lat, 99),
+            'lat_max': lat[-1],
+            'arp_ns': arp_ns,
+            'checksum_errors': len(bad),
+        }
+        rows.append(row)
+
+        tb.log.info("%s: %d datagrams, %d bytes in %.1f ns: %.3f Mpps, %.3f Gbps payload, %.1f%% of bus",
+            name, row['datagrams'], payload_bytes, time_ns, row['pps']/1e6, row['payload_gbps'],
+            row['bus_utilization']*100)
+        tb.log.info("%s latency (cycles): mean %.1f, p50 %d, p99 %d, max %d",
+            name, row['lat_mean'], row['lat_p50'], row['lat_p99'], row['lat_max'])
+
+        assert not bad
+
+    with open(f"udp_complete_64_bench_{direction}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=BENCH_FIELDS, lineterminator='\n')
+        w.writeheader()
+        w.writerows(rows)
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
+if cocotb.SIM_NAME:
+
+    # slow, so opt-in
+    if bool(int(os.getenv("UDP_COMPLETE_64_BENCH", "0"))):
+        factory = TestFactory(run_bench)
+        factory.add_option("direction", ["tx", "rx", "both"])
+        factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.abspath(os.path.dirname(__file__))
+rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
+lib_dir = os.path.abspath(os.path.join(rtl_dir, '..', 'lib'))
+axis_rtl_dir = os.path.abspath(os.path.join(lib_dir, 'axis', 'rtl'))
+
+
+def test_udp_complete_64(request):
+    dut = "udp_complete_64"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(rtl_dir, f"{dut}.v"),
+        os.path.join(rtl_dir, "udp_64.v"),
+        os.path.join(rtl_dir, "udp_checksum_gen_64.v"),
+        os.path.join(rtl_dir, "udp_ip_rx_64.v"),
+        os.path.join(rtl_dir, "udp_ip_tx_64.v"),
+        os.path.join(rtl_dir, "ip_complete_64.v"),
+        os.path.join(rtl_dir, "ip_64.v"),
+        os.path.join(rtl_dir, "ip_eth_rx_64.v"),
+        os.path.join(rtl_dir, "ip_eth_tx_64.v"),
+        os.path.join(rtl_dir, "ip_arb_mux.v"),
+        os.path.join(rtl_dir, "arp.v"),
+        os.path.join(rtl_dir, "arp_cache.v"),
+        os.path.join(rtl_dir, "arp_eth_rx.v"),
+        os.path.join(rtl_dir, "arp_eth_tx.v"),
+        os.path.join(rtl_dir, "eth_arb_mux.v"),
+        os.path.join(rtl_dir, "lfsr.v"),
+        os.path.join(axis_rtl_dir, "arbiter.v"),
+        os.path.join(axis_rtl_dir, "priority_encoder.v"),
+        os.path.join(axis_rtl_dir, "axis_fifo.v"),
+    ]
+
+    parameters = {}
+
+    parameters['ARP_CACHE_ADDR_WIDTH'] = 2
+    parameters['ARP_REQUEST_RETRY_COUNT'] = 4
+    parameters['ARP_REQUEST_RETRY_INTERVAL'] = 300
+    parameters['ARP_REQUEST_TIMEOUT'] = 800
+    parameters['UDP_CHECKSUM_GEN_ENABLE'] = 1
+    parameters['UDP_CHECKSUM_PAYLOAD_FIFO_DEPTH'] = 2048
+    parameters['UDP_CHECKSUM_HEADER_FIFO_DEPTH'] = 8
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
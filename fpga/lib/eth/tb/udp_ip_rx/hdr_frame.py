@@ -0,0 +1 @@
+../hdr_frame.py
\ No newline at end of file
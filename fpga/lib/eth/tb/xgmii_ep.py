@@ -24,8 +24,7 @@ THE SOFTWARE.
 
 from myhdl import *
 
-ETH_PRE = 0x55
-ETH_SFD = 0xD5
+from eth_fcs import ETH_PRE
 
 XGMII_IDLE   = 0x07
 XGMII_LPI    = 0x06
@@ -51,6 +50,8 @@ class XGMIIFrame(object):
             self.data = data.data
             self.error = data.error
             self.ctrl = data.ctrl
+        elif hasattr(data, 'build_wire'):
+            self.data = data.build_wire()
         else:
             self.data = bytearray(data)
 
@@ -96,6 +97,37 @@ class XGMIIFrame(object):
 
         return d, c
 
+    def encode(self, bw, offset=0):
+        # complete word sequence for the frame, starting offset lanes into
+        # the first word
+        d, c = self.build()
+
+        assert len(d) > 0
+        assert d[0] == ETH_PRE
+        d[0] = XGMII_START
+        c[0] = 1
+        d.append(XGMII_TERM)
+        c.append(1)
+
+        d = [XGMII_IDLE]*offset+d
+        c = [1]*offset+c
+
+        # lane of the last frame character, sets the following IFG
+        last_lane = (len(d)-1) % bw
+
+        pad = -len(d) % bw
+        d += [XGMII_IDLE]*pad
+        c += [1]*pad
+
+        dw = []
+        cw = []
+
+        for k in range(0, len(d), bw):
+            dw.append(int.from_bytes(bytes(d[k:k+bw]), 'little'))
+            cw.append(sum(c[k+i] << i for i in range(bw)))
+
+        return dw, cw, last_lane
+
     def parse(self, d, c):
         if d is None or c is None:
             return
@@ -105,10 +137,29 @@ class XGMIIFrame(object):
 
         self.error = [0]*len(self.data)
 
-        for i in range(len(self.data)):
-            if c[i] and d[i] == XGMII_ERROR:
+        for i in [i for i in range(len(c)) if c[i]]:
+            if d[i] == XGMII_ERROR:
                 self.error[i] = 1
 
+    def decode(self, dw, cw, bw, start_lane=0):
+        # words from the one containing the start character up to the one
+        # containing the first control character after it
+        end_lane = (cw[-1] & -cw[-1]).bit_length()-1
+
+        data = b''.join(w.to_bytes(bw, 'little') for w in dw)
+        d = bytearray([ETH_PRE])+data[start_lane+1:(len(dw)-1)*bw+end_lane]
+
+        c = [(cw[0] >> i) & 1 for i in range(start_lane+1, bw)]
+        c = [0]+c[:len(d)-1]
+        c += [0]*(len(d)-len(c))
+
+        if data[(len(dw)-1)*bw+end_lane] != XGMII_TERM:
+            # keep control character if it's not a termination
+            d.append(data[(len(dw)-1)*bw+end_lane])
+            c.append(1)
+
+        self.parse(d, c)
+
     def __eq__(self, other):
         if type(other) is XGMIIFrame:
             return self.data == other.data
@@ -155,11 +206,16 @@ class XGMIISource(object):
 
         bw = int(len(txd)/8)
 
+        idle_d = 0x0707070707070707 if bw == 8 else 0x07070707
+        idle_c = 0xff if bw == 8 else 0xf
+
         @instance
         def logic():
             frame = None
-            dl = []
-            cl = []
+            dw = []
+            cw = []
+            last_lane = 0
+            ptr = 0
             ifg_cnt = 0
             deficit_idle_cnt = 0
 
@@ -168,74 +224,49 @@ class XGMIISource(object):
 
                 if rst:
                     frame = None
-                    txd.next = 0x0707070707070707 if bw == 8 else 0x07070707
-                    txc.next = 0xff if bw == 8 else 0xf
-                    dl = []
-                    cl = []
+                    txd.next = idle_d
+                    txc.next = idle_c
+                    dw = []
+                    cw = []
+                    ptr = 0
                     ifg_cnt = 0
                     deficit_idle_cnt = 0
                 elif enable:
                     if ifg_cnt > bw-1 or (not self.enable_dic and ifg_cnt > 0):
                         ifg_cnt = max(ifg_cnt - bw, 0)
-                        txd.next = 0x0707070707070707 if bw == 8 else 0x07070707
-                        txc.next = 0xff if bw == 8 else 0xf
-                    elif dl:
-                        d = 0
-                        c = 0
-
-                        for i in range(bw):
-                            if dl:
-                                d |= dl.pop(0) << (8*i)
-                                c |= cl.pop(0) << i
-                                if not dl:
-                                    ifg_cnt = self.ifg - (bw-i) + deficit_idle_cnt
-                            else:
-                                d |= XGMII_IDLE << (8*i)
-                                c |= 1 << i
-
-                        txd.next = d
-                        txc.next = c
+                        txd.next = idle_d
+                        txc.next = idle_c
+                    elif ptr < len(dw):
+                        txd.next = dw[ptr]
+                        txc.next = cw[ptr]
+                        ptr += 1
+                        if ptr == len(dw):
+                            ifg_cnt = self.ifg - (bw-last_lane) + deficit_idle_cnt
                     elif self.queue:
                         frame = self.queue.pop(0)
-                        dl, cl = frame.build()
                         if name is not None:
                             print("[%s] Sending frame %s" % (name, repr(frame)))
 
-                        assert len(dl) > 0
-                        assert dl[0] == ETH_PRE
-                        dl[0] = XGMII_START
-                        cl[0] = 1
-                        dl.append(XGMII_TERM)
-                        cl.append(1)
-
+                        offset = 0
                         if (bw == 8 and ifg_cnt >= 4) or self.force_offset_start:
                             ifg_cnt = max(ifg_cnt-4, 0)
-                            dl = [XGMII_IDLE]*4+dl
-                            cl = [1]*4+cl
+                            offset = 4
+
+                        dw, cw, last_lane = frame.encode(bw, offset)
 
                         deficit_idle_cnt = max(ifg_cnt, 0)
                         ifg_cnt = 0
 
-                        d = 0
-                        c = 0
-
-                        for i in range(0,bw):
-                            if dl:
-                                d |= dl.pop(0) << (8*i)
-                                c |= cl.pop(0) << i
-                                if not dl:
-                                    ifg_cnt = self.ifg - (bw-i) + deficit_idle_cnt
-                            else:
-                                d |= XGMII_IDLE << (8*i)
-                                c |= 1 << i
-
-                        txd.next = d
-                        txc.next = c
+                        txd.next = dw[0]
+                        txc.next = cw[0]
+                        ptr = 1
+                        if ptr == len(dw):
+                            ifg_cnt = self.ifg - (bw-last_lane) + deficit_idle_cnt
                     else:
                         ifg_cnt = 0
                         deficit_idle_cnt = 0
-                        txd.next = 0x0707070707070707 if bw == 8 else 0x07070707
-                        txc.next = 0xff if bw == 8 else 0xf
+                        txd.next = idle_d
+                        txc.next = idle_c
 
         return instances()
 
@@ -287,54 +318,47 @@ class XGMIISink(object):
         @instance
         def logic():
             frame = None
-            d = []
-            c = []
+            start_lane = 0
+            dw = []
+            cw = []
 
             while True:
                 yield clk.posedge, rst.posedge
 
                 if rst:
                     frame = None
-                    d = []
-                    c = []
+                    dw = []
+                    cw = []
                 elif enable:
+                    d = int(rxd)
+                    c = int(rxc)
                     if frame is None:
-                        if rxc & 1 and rxd & 0xff == XGMII_START:
+                        if c & 1 and d & 0xff == XGMII_START:
                             # start in lane 0
                             frame = XGMIIFrame()
-                            d = [ETH_PRE]
-                            c = [0]
-                            for i in range(1,bw):
-                                d.append((int(rxd) >> (8*i)) & 0xff)
-                                c.append((int(rxc) >> i) & 1)
-                        elif bw == 8 and (rxc >> 4) & 1 and (rxd >> 32) & 0xff == XGMII_START:
+                            start_lane = 0
+                            dw = [d]
+                            cw = [c]
+                        elif bw == 8 and (c >> 4) & 1 and (d >> 32) & 0xff == XGMII_START:
                             # start in lane 4
                             frame = XGMIIFrame()
-                            d = [ETH_PRE]
-                            c = [0]
-                            for i in range(5,bw):
-                                d.append((int(rxd) >> (8*i)) & 0xff)
-                                c.append((int(rxc) >> i) & 1)
+                            start_lane = 4
+                            dw = [d]
+                            cw = [c]
                     else:
-                        for i in range(bw):
-                            if (rxc >> i) & 1:
-                                # got a control character; terminate frame reception
-                                if (rxd >> (8*i)) & 0xff != XGMII_TERM:
-                                    # store control character if it's not a termination
-                                    d.append((int(rxd) >> (8*i)) & 0xff)
-                                    c.append((int(rxc) >> i) & 1)
-                                frame.parse(d, c)
-                                self.queue.append(frame)
-                                self.sync.next = not self.sync
-                                if name is not None:
-                                    print("[%s] Got frame %s" % (name, repr(frame)))
-                                frame = None
-                                d = []
-                                c = []
-                                break
-                            else:
-                                d.append((int(rxd) >> (8*i)) & 0xff)
-                                c.append((int(rxc) >> i) & 1)
+                        # collect whole words, decode once the frame ends
+                        dw.append(d)
+                        cw.append(c)
+                        if c:
+                            # got a control character; terminate frame reception
+                            frame.decode(dw, cw, bw, start_lane)
+                            self.queue.append(frame)
+                            self.sync.next = not self.sync
+                            if name is not None:
+                                print("[%s] Got frame %s" % (name, repr(frame)))
+                            frame = None
+                            dw = []
+                            cw = []
 
         return instances()
 
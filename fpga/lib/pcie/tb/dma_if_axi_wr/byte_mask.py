@@ -0,0 +1 @@
+../byte_mask.py
\ No newline at end of file
@@ -253,6 +253,8 @@ async def run_test_write(dut, idle_inserter=None, backpressure_inserter=None):
 
                 cur_tag = (cur_tag + 1) % tag_count
 
+    tb.log.info("DMA RAM read stats: %s", tb.dma_ram.read_if.stats)
+
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
 
@@ -313,6 +315,8 @@ async def run_test_read(dut, idle_inserter=None, backpressure_inserter=None):
 
                 cur_tag = (cur_tag + 1) % tag_count
 
+    tb.log.info("DMA RAM write stats: %s", tb.dma_ram.write_if.stats)
+
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
 
@@ -33,6 +33,8 @@ from cocotb_bus.bus import Bus
 from cocotbext.axi.memory import Memory
 from cocotbext.axi import Region
 
+from byte_mask import mask_runs
+
 
 # master write helper objects
 class WriteCmd(NamedTuple):
@@ -89,6 +91,39 @@ class ReadResp(NamedTuple):
         return self.data
 
 
+class PsdpRamStats:
+    def __init__(self, seg_count, seg_byte_lanes):
+        self.seg_count = seg_count
+        self.seg_byte_lanes = seg_byte_lanes
+        self.reset()
+
+    def reset(self):
+        self.cycles = 0
+        self.bytes = 0
+        self.seg_words = [0]*self.seg_count
+
+    @property
+    def words(self):
+        return sum(self.seg_words)
+
+    @property
+    def bytes_per_cycle(self):
+        return self.bytes / self.cycles if self.cycles else 0.0
+
+    @property
+    def seg_utilization(self):
+        return [w / self.cycles if self.cycles else 0.0 for w in self.seg_words]
+
+    def __repr__(self):
+        return (
+            f'{type(self).__name__}(cycles={self.cycles}, '
+            f'bytes={self.bytes}, '
+            f'words={self.words}, '
+            f'bytes_per_cycle={self.bytes_per_cycle:.3f}, '
+            f'seg_utilization=[{", ".join(f"{u:.3f}" for u in self.seg_utilization)}])'
+        )
+
+
 class BaseBus(Bus):
 
     _signals = ["data"]
@@ -156,6 +191,8 @@ class PsdpRamMasterWrite(Region):
         self._pause_generator = None
         self._pause_cr = None
 
+        self.log_words = True
+
         self.in_flight_operations = 0
         self._idle = Event()
         self._idle.set()
@@ -262,7 +299,7 @@ class PsdpRamMasterWrite(Region):
 
             offset = 0
 
-            if self.log.isEnabledFor(logging.INFO):
+            if self.log_words and self.log.isEnabledFor(logging.INFO):
                 self.log.info("Write start addr: 0x%08x data: %s",
                         cmd.address, ' '.join((f'{c:02x}' for c in cmd.data)))
 
@@ -279,10 +316,8 @@ class PsdpRamMasterWrite(Region):
                     stop = seg_end_offset
                     be &= seg_be_end
 
-                val = 0
-                for j in range(start, stop):
-                    val |= cmd.data[offset] << j*8
-                    offset += 1
+                val = int.from_bytes(cmd.data[offset:offset+stop-start], 'little') << start*8
+                offset += stop-start
 
                 op = SegWriteData()
                 op.addr = (cmd.address + k*self.seg_byte_lanes) // self.byte_lanes
@@ -353,7 +388,7 @@ class PsdpRamMasterWrite(Region):
                         cmd_be |= ((op.be & self.seg_be_mask) << self.seg_be_width*seg)
                         cmd_valid |= seg_mask
 
-                        if self.log.isEnabledFor(logging.INFO):
+                        if self.log_words and self.log.isEnabledFor(logging.INFO):
                             self.log.info("Write word seg: %d addr: 0x%08x be 0x%02x data %s",
                                 seg, op.addr, op.be, ' '.join((f'{c:02x}' for c in op.data.to_bytes(self.seg_byte_lanes, 'little'))))
                     else:
@@ -393,6 +428,8 @@ class PsdpRamMasterRead(Region):
         self._pause_generator = None
         self._pause_cr = None
 
+        self.log_words = True
+
         self.in_flight_operations = 0
         self._idle = Event()
         self._idle.set()
@@ -524,12 +561,11 @@ class PsdpRamMasterRead(Region):
                 if k == cmd.segments-1:
                     stop = seg_end_offset
 
-                for j in range(start, stop):
-                    data.extend(bytearray([(seg_data >> j*8) & 0xff]))
+                data.extend(seg_data.to_bytes(self.seg_byte_lanes, 'little')[start:stop])
 
                 seg = (seg + 1) % self.seg_count
 
-            if self.log.isEnabledFor(logging.INFO):
+            if self.log_words and self.log.isEnabledFor(logging.INFO):
                 self.log.info("Read complete addr: 0x%08x data: %s",
                         cmd.address, ' '.join((f'{c:02x}' for c in data)))
 
@@ -578,7 +614,7 @@ class PsdpRamMasterRead(Region):
                         cmd_addr |= ((op.addr & self.seg_addr_mask) << self.seg_addr_width*seg)
                         cmd_valid |= seg_mask
 
-                        if self.log.isEnabledFor(logging.INFO):
+                        if self.log_words and self.log.isEnabledFor(logging.INFO):
                             self.log.info("Read word seg: %d addr: 0x%08x", seg, op.addr)
                     else:
                         cmd_valid &= ~seg_mask
@@ -642,6 +678,10 @@ class PsdpRamMaster(Region):
     async def write(self, address, data):
         return await self.write_if.write(address, data)
 
+    def set_log_words(self, enable):
+        self.write_if.log_words = enable
+        self.read_if.log_words = enable
+
 
 class PsdpRamWrite(Memory):
 
@@ -660,6 +700,8 @@ class PsdpRamWrite(Memory):
         self._pause_generator = None
         self._pause_cr = None
 
+        self.log_words = True
+
         self.width = len(self.bus.wr_cmd_data)
         self.byte_size = 8
         self.byte_lanes = len(self.bus.wr_cmd_be)
@@ -683,6 +725,8 @@ class PsdpRamWrite(Memory):
 
         assert self.seg_be_width*self.seg_count == len(self.bus.wr_cmd_be)
 
+        self.stats = PsdpRamStats(self.seg_count, self.seg_byte_lanes)
+
         self.bus.wr_cmd_ready.setimmediatevalue(0)
         self.bus.wr_done.setimmediatevalue(0)
 
@@ -704,6 +748,8 @@ class PsdpRamWrite(Memory):
     async def _run(self):
         cmd_ready = 0
 
+        log_words = False
+
         clock_edge_event = RisingEdge(self.clock)
 
         while True:
@@ -723,6 +769,11 @@ class PsdpRamWrite(Memory):
                 self.bus.wr_done.setimmediatevalue(0)
                 continue
 
+            self.stats.cycles += 1
+
+            if cmd_ready & cmd_valid_sample:
+                log_words = self.log_words and self.log.isEnabledFor(logging.INFO)
+
             # process segments
             for seg in range(self.seg_count):
                 if cmd_ready & cmd_valid_sample & (1 << seg):
@@ -732,35 +783,23 @@ class PsdpRamWrite(Memory):
 
                     addr = (seg_addr*self.seg_count+seg)*self.seg_byte_lanes
 
-                    # generate operation list
-                    offset = 0
-                    start_offset = None
-                    write_ops = []
-
                     data = seg_data.to_bytes(self.seg_byte_lanes, 'little')
 
-                    for i in range(self.byte_lanes):
-                        if seg_be & (1 << i):
-                            if start_offset is None:
-                                start_offset = offset
-                        else:
-                            if start_offset is not None and offset != start_offset:
-                                write_ops.append((addr+start_offset, data[start_offset:offset]))
-                            start_offset = None
-
-                        offset += 1
-
-                    if start_offset is not None and offset != start_offset:
-                        write_ops.append((addr+start_offset, data[start_offset:offset]))
-
-                    # perform writes
-                    for addr, data in write_ops:
+                    if seg_be == self.seg_be_mask:
                         self.write(addr, data)
+                    else:
+                        # write each run of enabled bytes
+                        for start, stop in mask_runs(seg_be, self.seg_byte_lanes):
+                            self.write(addr+start, data[start:stop])
 
                     wr_done |= 1 << seg
 
-                    self.log.info("Write word seg: %d addr: 0x%08x be 0x%02x data %s",
-                        seg, addr, seg_be, ' '.join((f'{c:02x}' for c in data)))
+                    self.stats.seg_words[seg] += 1
+                    self.stats.bytes += bin(seg_be).count('1')
+
+                    if log_words:
+                        self.log.info("Write word seg: %d addr: 0x%08x be 0x%02x data %s",
+                            seg, addr, seg_be, ' '.join((f'{c:02x}' for c in data)))
 
             cmd_ready = 2**self.seg_count-1
 
@@ -795,6 +834,8 @@ class PsdpRamRead(Memory):
         self._pause_generator = None
         self._pause_cr = None
 
+        self.log_words = True
+
         self.width = len(self.bus.rd_resp_data)
         self.byte_size = 8
         self.byte_lanes = self.width // self.byte_size
@@ -814,6 +855,8 @@ class PsdpRamRead(Memory):
         self.log.info("  Segment data width: %d bits (%d bytes)", self.seg_data_width, self.seg_byte_lanes)
         self.log.info("  Total data width: %d bits (%d bytes)", self.width, self.byte_lanes)
 
+        self.stats = PsdpRamStats(self.seg_count, self.seg_byte_lanes)
+
         self.bus.rd_cmd_ready.setimmediatevalue(0)
         self.bus.rd_resp_valid.setimmediatevalue(0)
 
@@ -839,6 +882,8 @@ class PsdpRamRead(Memory):
         resp_valid = 0
         resp_data = 0
 
+        log_words = False
+
         clock_edge_event = RisingEdge(self.clock)
 
         while True:
@@ -858,6 +903,11 @@ class PsdpRamRead(Memory):
                 resp_valid = 0
                 continue
 
+            self.stats.cycles += 1
+
+            if cmd_ready & cmd_valid_sample:
+                log_words = self.log_words and self.log.isEnabledFor(logging.INFO)
+
             # process segments
             for seg in range(self.seg_count):
                 seg_mask = 1 << seg
@@ -884,8 +934,12 @@ class PsdpRamRead(Memory):
                     data = self.read(addr % self.size, self.seg_byte_lanes)
                     pipeline[seg][0] = int.from_bytes(data, 'little')
 
-                    self.log.info("Read word seg: %d addr: 0x%08x data %s",
-                        seg, addr, ' '.join((f'{c:02x}' for c in data)))
+                    self.stats.seg_words[seg] += 1
+                    self.stats.bytes += self.seg_byte_lanes
+
+                    if log_words:
+                        self.log.info("Read word seg: %d addr: 0x%08x data %s",
+                            seg, addr, ' '.join((f'{c:02x}' for c in data)))
 
                 if (not resp_valid & seg_mask) or None in pipeline[seg]:
                     cmd_ready |= seg_mask
@@ -917,3 +971,7 @@ class PsdpRam(Memory):
 
         self.write_if = PsdpRamWrite(bus.write, clock, reset, mem=self.mem)
         self.read_if = PsdpRamRead(bus.read, clock, reset, mem=self.mem)
+
+    def set_log_words(self, enable):
+        self.write_if.log_words = enable
+        self.read_if.log_words = enable
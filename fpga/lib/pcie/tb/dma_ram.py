@@ -25,18 +25,30 @@ THE SOFTWARE.
 from myhdl import *
 import mmap
 
+from byte_mask import mask_runs
+
 class PSDPRam(object):
     def __init__(self, size = 1024):
         self.size = size
         self.mem = mmap.mmap(-1, size)
+        self.mem_view = memoryview(self.mem)
 
     def read_mem(self, address, length):
-        self.mem.seek(address)
-        return self.mem.read(length)
+        return self.mem[address:address+length]
+
+    def read_mem_view(self, address, length):
+        return self.mem_view[address:address+length]
 
     def write_mem(self, address, data):
-        self.mem.seek(address)
-        self.mem.write(bytes(data))
+        self.mem[address:address+len(data)] = bytes(data)
+
+    def write_mem_masked(self, address, data, mask):
+        width = len(data)
+        if mask == (1 << width)-1:
+            self.mem_view[address:address+width] = data
+        else:
+            for start, stop in mask_runs(mask, width):
+                self.mem_view[address+start:address+stop] = data[start:stop]
 
     def create_write_ports(self,
                 clk,
@@ -119,19 +131,10 @@ class PSDPRam(object):
                 addr = (ram_wr_cmd_addr*stride+offset)*bw
 
                 if ram_wr_cmd_ready and ram_wr_cmd_valid:
-                    self.mem.seek(addr % self.size)
-
-                    data = bytearray()
-                    val = int(ram_wr_cmd_data)
-
-                    for i in range(bw):
-                        data.extend(bytearray([val & 0xff]))
-                        val >>= 8
-                    for i in range(bw):
-                        if ram_wr_cmd_be & (1 << i):
-                            self.mem.write(bytes(data[i:i+1]))
-                        else:
-                            self.mem.seek(1, 1)
+                    data = int(ram_wr_cmd_data).to_bytes(bw, 'little')
+
+                    self.write_mem_masked(addr % self.size, data, int(ram_wr_cmd_be))
+
                     if name is not None:
                         print("[%s] Write word addr: 0x%08x be: 0x%02x data: %s" % (name, addr, ram_wr_cmd_be, " ".join(("{:02x}".format(c) for c in bytearray(data)))))
 
@@ -251,14 +254,10 @@ class PSDPRam(object):
                 addr = (ram_rd_cmd_addr*stride+offset)*bw
 
                 if ram_rd_cmd_ready and ram_rd_cmd_valid:
-                    self.mem.seek(addr % self.size)
-
-                    data = bytearray(self.mem.read(bw))
-                    val = 0
-                    for i in range(bw-1,-1,-1):
-                        val <<= 8
-                        val += data[i]
-                    pipeline[0] = val
+                    data = self.read_mem_view(addr % self.size, bw)
+
+                    pipeline[0] = int.from_bytes(data, 'little')
+
                     if name is not None:
                         print("[%s] Read word addr: 0x%08x data: %s" % (name, addr, " ".join(("{:02x}".format(c) for c in bytearray(data)))))
 
@@ -23,9 +23,12 @@ THE SOFTWARE.
 
 """
 
+import bisect
+import csv
 import itertools
 import logging
 import os
+import random
 
 import cocotb_test.simulator
 
@@ -33,6 +36,7 @@ import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge, Timer
 from cocotb.regression import TestFactory
+from cocotb.utils import get_sim_time
 
 from cocotbext.axi.stream import define_stream
 
@@ -141,6 +145,165 @@ async def run_test_irq(dut, idle_inserter=None, backpressure_inserter=None):
     await RisingEdge(dut.clk)
 
 
+BENCH_FIELDS = ['pattern', 'min_interval_us', 'requests', 'delivered', 'coalesce_ratio',
+    'irq_rate_mhz', 'mean_latency_ns', 'p99_latency_ns', 'max_latency_ns', 'min_gap_ns']
+
+
+def gen_requests(pattern, vector_count, rate_mhz, duration_ns, burst_len=8, seed=1):
+    # per-vector request times, merged into (time, vector) order
+    rng = random.Random(seed)
+    events = []
+
+    for vec in range(vector_count):
+        if pattern == "poisson":
+            t = rng.expovariate(rate_mhz*1e-3)
+            while t < duration_ns:
+                events.append((int(t), vec))
+                t += rng.expovariate(rate_mhz*1e-3)
+        elif pattern == "bursty":
+            period = burst_len/(rate_mhz*1e-3)
+            t = rng.uniform(0, period)
+            while t < duration_ns:
+                events.extend((int(t), vec) for k in range(burst_len))
+                t += period
+        else:
+            raise Exception("Unknown pattern")
+
+    events.sort()
+    return events
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values)*p/100), len(sorted_values)-1)]
+
+
+async def run_bench_irq(dut, pattern="poisson", vector_count=16, rate_mhz=0.25,
+        duration_us=200, intervals=(0, 1, 2, 5, 10, 20)):
+
+    tb = TB(dut)
+
+    in_monitor = IrqMonitor(IrqBus.from_prefix(dut, "in_irq"), dut.clk, dut.rst)
+
+    # 250 cycles per interval unit at 4 ns is 1 us
+    prescale = 249
+    tick_ns = (prescale+1)*4
+
+    rows = []
+
+    for interval in intervals:
+        await tb.cycle_reset()
+
+        dut.prescale.setimmediatevalue(prescale)
+        dut.min_interval.setimmediatevalue(interval)
+
+        events = gen_requests(pattern, vector_count, rate_mhz, duration_us*1000)
+
+        while not in_monitor.empty():
+            in_monitor.recv_nowait()
+
+        req_times = {vec: [] for vec in range(vector_count)}
+        irq_times = {vec: [] for vec in range(vector_count)}
+
+        async def collect_requests():
+            while True:
+                irq = await in_monitor.recv()
+                req_times[int(irq.index)].append(get_sim_time('ns'))
+
+        async def collect_irqs():
+            while True:
+                irq = await tb.irq_sink.recv()
+                irq_times[int(irq.index)].append(get_sim_time('ns'))
+
+        req_cr = cocotb.start_soon(collect_requests())
+        irq_cr = cocotb.start_soon(collect_irqs())
+
+        start = get_sim_time('ns')
+
+        for t, vec in events:
+            delay = start+t-get_sim_time('ns')
+            if delay > 0:
+                await Timer(delay, 'ns')
+            await tb.irq_source.send(IrqTransaction(index=vec))
+
+        await tb.irq_source.wait()
+
+        # let pending interrupts drain; the limiter scans the whole vector
+        # table to find expired entries
+        await Timer(interval*tick_ns + 2*(2**len(dut.in_irq_index))*4, 'ns')
+
+        req_cr.kill()
+        irq_cr.kill()
+
+        elapsed = get_sim_time('ns')-start
+
+        # latency from each request to the first interrupt delivered for it
+        latency = []
+        min_gap = None
+        for vec in range(vector_count):
+            irqs = irq_times[vec]
+            for t in req_times[vec]:
+                k = bisect.bisect_left(irqs, t)
+                if k < len(irqs):
+                    latency.append(irqs[k]-t)
+            for a, b in zip(irqs, irqs[1:]):
+                if min_gap is None or b-a < min_gap:
+                    min_gap = b-a
+
+        latency.sort()
+
+        requests = sum(len(v) for v in req_times.values())
+        delivered = sum(len(v) for v in irq_times.values())
+
+        row = {
+            'pattern': pattern,
+            'min_interval_us': interval*tick_ns/1000,
+            'requests': requests,
+            'delivered': delivered,
+            'coalesce_ratio': requests/delivered if delivered else 0.0,
+            'irq_rate_mhz': delivered*1e3/elapsed,
+            'mean_latency_ns': sum(latency)/len(latency) if latency else 0.0,
+            'p99_latency_ns': percentile(latency, 99),
+            'max_latency_ns': latency[-1] if latency else 0,
+            'min_gap_ns': min_gap,
+        }
+        rows.append(row)
+
+        tb.log.info("interval %d us: %d requests, %d interrupts (%.2fx), %.3f MHz, latency mean %.1f ns p99 %d ns",
+            interval, requests, delivered, row['coalesce_ratio'], row['irq_rate_mhz'],
+            row['mean_latency_ns'], row['p99_latency_ns'])
+
+        assert requests == len(events)
+        assert 0 < delivered <= requests
+
+        # every request is eventually followed by an interrupt on its vector
+        assert len(latency) == requests
+
+        # interrupts on a vector are spaced by the minimum interval, less up
+        # to one prescaler tick of quantisation
+        if interval and min_gap is not None:
+            assert min_gap >= (interval-1)*tick_ns
+
+    # moderation trades interrupt load for latency
+    assert rows[-1]['coalesce_ratio'] >= rows[0]['coalesce_ratio']
+    assert rows[-1]['mean_latency_ns'] >= rows[0]['mean_latency_ns']
+
+    tb.log.info("Interrupt moderation curve (%s):", pattern)
+    tb.log.info("%12s %12s %12s %12s %12s", "interval us", "irq MHz", "coalesce", "mean ns", "p99 ns")
+    for row in rows:
+        tb.log.info("%12.1f %12.3f %12.2f %12.1f %12d", row['min_interval_us'], row['irq_rate_mhz'],
+            row['coalesce_ratio'], row['mean_latency_ns'], row['p99_latency_ns'])
+
+    with open(f"irq_rate_limit_bench_{pattern}.csv", 'w') as f:
+        w = csv.DictWriter(f, fieldnames=BENCH_FIELDS, lineterminator='\n')
+        w.writeheader()
+        w.writerows(rows)
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
 def cycle_pause():
     return itertools.cycle([1, 1, 1, 0])
 
@@ -156,6 +319,12 @@ if cocotb.SIM_NAME:
         factory.add_option("backpressure_inserter", [None, cycle_pause])
         factory.generate_tests()
 
+    # slow, so opt-in
+    if bool(int(os.getenv("IRQ_RATE_LIMIT_BENCH", "0"))):
+        factory = TestFactory(run_bench_irq)
+        factory.add_option("pattern", ["poisson", "bursty"])
+        factory.generate_tests()
+
 
 # cocotb-test
 
@@ -22,9 +22,12 @@ THE SOFTWARE.
 
 """
 
+import hashlib
 import inspect
+import json
 import math
 import mmap
+import os
 import struct
 from myhdl import *
 
@@ -159,6 +162,17 @@ def byte_mask_update(old, mask, new, bitmask=-1):
     return old
 
 
+def enumeration_cache_key(files=(), **params):
+    # key for a cached enumeration: hash of the HDL sources and the
+    # parameters that affect the device configuration space
+    h = hashlib.sha256()
+    for fn in sorted(files):
+        with open(fn, 'rb') as f:
+            h.update(f.read())
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+
 def highlight(s):
     return "\033[32m%s\033[0m" % s
 
@@ -480,9 +494,7 @@ class TLP(object):
 
     def set_data(self, data):
         """Set DWORD data from byte data"""
-        self.data = []
-        for k in range(0, len(data), 4):
-            self.data.append(struct.unpack('<L', data[k:k+4])[0])
+        self.data = list(struct.unpack('<%dL' % (len(data)//4), data))
         self.length = len(self.data)
 
     def set_be_data(self, addr, data):
@@ -492,10 +504,7 @@ class TLP(object):
         self.set_data(bytearray(first_pad)+data+bytearray(last_pad))
 
     def get_data(self):
-        data = bytearray()
-        for dw in self.data:
-            data.extend(struct.pack('<L', dw))
-        return data
+        return bytearray(struct.pack('<%dL' % len(self.data), *self.data))
 
     def get_first_be_offset(self):
         """Offset to first transferred byte from first byte enable"""
@@ -3141,11 +3150,52 @@ class TreeItem(object):
         self.capabilities = []
         self.ext_capabilities = []
 
+        self.bridge = False
+        self.command = None
+        self.dev_ctrl = None
+
         self.msi_addr = None
         self.msi_data = None
 
         self.children = []
 
+    def to_dict(self):
+        return {
+            'bus_num': self.bus_num,
+            'device_num': self.device_num,
+            'function_num': self.function_num,
+            'vendor_id': self.vendor_id,
+            'device_id': self.device_id,
+            'sec_bus_num': self.sec_bus_num,
+            'sub_bus_num': self.sub_bus_num,
+            'bar': self.bar,
+            'bar_size': self.bar_size,
+            'io_base': self.io_base,
+            'io_limit': self.io_limit,
+            'mem_base': self.mem_base,
+            'mem_limit': self.mem_limit,
+            'prefetchable_mem_base': self.prefetchable_mem_base,
+            'prefetchable_mem_limit': self.prefetchable_mem_limit,
+            'capabilities': self.capabilities,
+            'ext_capabilities': self.ext_capabilities,
+            'bridge': self.bridge,
+            'command': self.command,
+            'dev_ctrl': self.dev_ctrl,
+            'children': [c.to_dict() for c in self.children],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        ti = cls()
+        for k, v in d.items():
+            if k == 'children':
+                ti.children = [cls.from_dict(c) for c in v]
+            elif k in ('capabilities', 'ext_capabilities'):
+                setattr(ti, k, [tuple(c) for c in v])
+            else:
+                setattr(ti, k, v)
+        return ti
+
     def find_dev(self, dev_id):
         if dev_id == self.get_id():
             return self
@@ -3222,6 +3272,9 @@ class RootComplex(Switch):
 
         self.current_tag = 0
 
+        # outstanding configuration requests during enumeration
+        self.max_config_outstanding = 8
+
         self.downstream_tag_recv_queues = {}
 
         self.rx_cpl_queues = [[] for k in range(256)]
@@ -3325,6 +3378,8 @@ class RootComplex(Switch):
             raise Exception("Invalid address")
         offset = addr - region[0]
         if len(region) == 3:
+            # slicing the mmap copies once into bytes, so the data of one
+            # read is not changed by later writes
             return region[2][offset:offset+length]
         elif len(region) == 4:
             if inspect.isgeneratorfunction(region[2]):
@@ -3413,12 +3468,12 @@ class RootComplex(Switch):
 
         return None
 
-    def get_free_tag(self):
+    def get_free_tag(self, busy=()):
         tag_count = 32
 
         for k in range(tag_count):
             self.current_tag = (self.current_tag + 1) % tag_count
-            if not self.rx_cpl_queues[self.current_tag]:
+            if not self.rx_cpl_queues[self.current_tag] and self.current_tag not in busy:
                 return self.current_tag
 
         return None
@@ -3709,6 +3764,76 @@ class RootComplex(Switch):
         data = yield from self.config_read_qwords(dev, addr, 1, timeout=timeout)
         return data[0]
 
+    def config_dword_batch(self, ops, timeout=0):
+        # issue independent dword configuration requests back to back, up to
+        # max_config_outstanding at a time, instead of one round trip each
+        # ops are (dev, addr) for reads and (dev, addr, data) for writes
+        # returns read data, 0xffffffff for failed reads, None for writes
+        res = [None]*len(ops)
+        pending = {}
+        n = 0
+
+        while n < len(ops) or pending:
+            while n < len(ops) and len(pending) < self.max_config_outstanding:
+                op = ops[n]
+
+                tlp = TLP()
+                tlp.requester_id = PcieId(0, 0, 0)
+                tlp.tag = self.get_free_tag(pending)
+                tlp.dest_id = op[0]
+
+                if tlp.tag is None:
+                    if not pending:
+                        # nothing in flight will free a tag, so waiting cannot make progress
+                        raise Exception("No free tags for configuration requests")
+                    break
+
+                if len(op) > 2:
+                    tlp.fmt_type = TLP_CFG_WRITE_1
+                    tlp.set_be_data(op[1] & ~3, struct.pack('<L', op[2]))
+                else:
+                    tlp.fmt_type = TLP_CFG_READ_1
+                    tlp.set_be(op[1] & ~3, 4)
+
+                tlp.register_number = op[1] >> 2
+
+                yield from self.send(tlp)
+
+                pending[tlp.tag] = n
+                n += 1
+
+            # wait for any outstanding completion
+            if not any(self.rx_cpl_queues[tag] for tag in pending):
+                sync = tuple(self.rx_cpl_sync[tag] for tag in pending)
+                if timeout:
+                    yield sync + (delay(timeout),)
+                else:
+                    yield sync
+
+            done = [tag for tag in pending if self.rx_cpl_queues[tag]]
+
+            if not done:
+                # timed out
+                for tag, k in pending.items():
+                    if len(ops[k]) == 2:
+                        res[k] = 0xffffffff
+                pending.clear()
+
+            for tag in done:
+                k = pending.pop(tag)
+                cpl = self.rx_cpl_queues[tag].pop(0)
+
+                if len(ops[k]) > 2:
+                    continue
+
+                if not cpl or cpl.status != CPL_STATUS_SC:
+                    res[k] = 0xffffffff
+                else:
+                    assert cpl.length == 1
+                    res[k] = cpl.data[0]
+
+        return res
+
     def config_write(self, dev, addr, data, timeout=0):
         n = 0
 
@@ -3970,7 +4095,7 @@ class RootComplex(Switch):
 
         if self.find_region(addr):
             val = yield from self.read_region(addr, length)
-            return val
+            return bytes(val)
 
         while n < length:
             tlp = TLP()
@@ -4208,6 +4333,27 @@ class RootComplex(Switch):
             return
         self.msi_callbacks[ti.msi_data+number].append(callback)
 
+    def set_bridge_windows(self, ti):
+        dev = ti.get_id()
+
+        # logging
+        print("[%s] Set IO base: %08x, limit: %08x" % (highlight(self.get_desc()), ti.io_base, ti.io_limit))
+
+        yield from self.config_write(dev, 0x01C, struct.pack('BB', (ti.io_base >> 8) & 0xf0, (ti.io_limit >> 8) & 0xf0))
+        yield from self.config_write(dev, 0x030, struct.pack('<HH', ti.io_base >> 16, ti.io_limit >> 16))
+
+        # logging
+        print("[%s] Set mem base: %08x, limit: %08x" % (highlight(self.get_desc()), ti.mem_base, ti.mem_limit))
+
+        yield from self.config_write(dev, 0x020, struct.pack('<HH', (ti.mem_base >> 16) & 0xfff0, (ti.mem_limit >> 16) & 0xfff0))
+
+        # logging
+        print("[%s] Set prefetchable mem base: %016x, limit: %016x" % (highlight(self.get_desc()), ti.prefetchable_mem_base, ti.prefetchable_mem_limit))
+
+        yield from self.config_write(dev, 0x024, struct.pack('<HH', (ti.prefetchable_mem_base >> 16) & 0xfff0, (ti.prefetchable_mem_limit >> 16) & 0xfff0))
+        yield from self.config_write(dev, 0x028, struct.pack('<L', ti.prefetchable_mem_base >> 32))
+        yield from self.config_write(dev, 0x02c, struct.pack('<L', ti.prefetchable_mem_limit >> 32))
+
     def enumerate_segment(self, tree, bus, timeout=1000, enable_bus_mastering=False, configure_msi=False):
         sec_bus = bus+1
         sub_bus = bus
@@ -4229,245 +4375,237 @@ class RootComplex(Switch):
         # logging
         print("[%s] Enumerating bus %d" % (highlight(self.get_desc()), bus))
 
-        for d in range(32):
-            if bus == 0 and d == 0:
-                continue
+        # probe all device numbers on the bus at once
+        devs = [d for d in range(32) if not (bus == 0 and d == 0)]
 
-            # read vendor ID and device ID
-            val = yield from self.config_read_dword(PcieId(bus, d, 0), 0x000, timeout)
+        vals = yield from self.config_dword_batch([(PcieId(bus, d, 0), 0x000) for d in devs], timeout)
+        devs = [d for d, val in zip(devs, vals) if val != 0xffffffff]
 
-            if val is None or val == 0xffffffff:
-                continue
+        # read header type
+        vals = yield from self.config_dword_batch([(PcieId(bus, d, 0), 0x00c) for d in devs], timeout)
 
+        funcs = []
+        for d, val in zip(devs, vals):
             # valid vendor ID
             # logging
             print("[%s] Found device at %02x:%02x.%x" % (highlight(self.get_desc()), bus, d, 0))
 
-            fc = 1
+            funcs.append((d, 0))
 
-            # read type
-            val = yield from self.config_read_byte(PcieId(bus, d, 0), 0x00e, timeout)
-
-            if val & 0x80:
+            if (val >> 16) & 0x80:
                 # multifunction device
-                fc = 8
+                funcs.extend((d, f) for f in range(1, 8))
 
-            for f in range(fc):
-                # read vendor ID and device ID
-                val = yield from self.config_read(PcieId(bus, d, f), 0x000, 4, timeout)
+        # read vendor ID, device ID, and header type of all functions
+        ops = []
+        for d, f in funcs:
+            ops.append((PcieId(bus, d, f), 0x000))
+            ops.append((PcieId(bus, d, f), 0x00c))
 
-                if val is None or val == b'\xff\xff\xff\xff':
-                    continue
+        vals = yield from self.config_dword_batch(ops, timeout)
 
-                ti = TreeItem()
-                tree.children.append(ti)
-                ti.bus_num = bus
-                ti.device_num = d
-                ti.function_num = f
-                ti.vendor_id, ti.device_id = struct.unpack('<HH', val)
+        for i, (d, f) in enumerate(funcs):
+            val = vals[i*2]
+            hdr = (vals[i*2+1] >> 16) & 0xff
 
-                # logging
-                print("[%s] Found function at %02x:%02x.%x" % (highlight(self.get_desc()), bus, d, f))
+            if val == 0xffffffff:
+                continue
 
-                # read type
-                val = yield from self.config_read_byte(PcieId(bus, d, f), 0x00e, timeout)
+            ti = TreeItem()
+            tree.children.append(ti)
+            ti.bus_num = bus
+            ti.device_num = d
+            ti.function_num = f
+            ti.vendor_id = val & 0xffff
+            ti.device_id = val >> 16
 
-                bridge = val & 0x7f == 0x01
+            # logging
+            print("[%s] Found function at %02x:%02x.%x" % (highlight(self.get_desc()), bus, d, f))
 
-                bar_cnt = 6
+            bridge = hdr & 0x7f == 0x01
+            ti.bridge = bridge
 
-                if bridge:
-                    # found a bridge
-                    # logging
-                    print("[%s] Found bridge at %02x:%02x.%x" % (highlight(self.get_desc()), bus, d, f))
+            bar_cnt = 6
 
-                    bar_cnt = 2
+            if bridge:
+                # found a bridge
+                # logging
+                print("[%s] Found bridge at %02x:%02x.%x" % (highlight(self.get_desc()), bus, d, f))
 
-                # configure base address registers
-                bar = 0
-                while bar < bar_cnt:
-                    # read BAR
-                    yield from self.config_write_dword(PcieId(bus, d, f), 0x010+bar*4, 0xffffffff)
-                    val = yield from self.config_read_dword(PcieId(bus, d, f), 0x010+bar*4)
+                bar_cnt = 2
 
-                    if val == 0:
-                        # unimplemented BAR
-                        bar += 1
-                        continue
-                    
+            # size all BARs at once
+            yield from self.config_dword_batch([(PcieId(bus, d, f), 0x010+k*4, 0xffffffff) for k in range(bar_cnt)])
+            bar_vals = yield from self.config_dword_batch([(PcieId(bus, d, f), 0x010+k*4) for k in range(bar_cnt)])
+            bar_writes = []
+
+            # configure base address registers
+            bar = 0
+            while bar < bar_cnt:
+                val = bar_vals[bar]
+
+                if val == 0:
+                    # unimplemented BAR
+                    bar += 1
+                    continue
+                
+                # logging
+                print("[%s] Configure %02x:%02x.%x BAR%d" % (highlight(self.get_desc()), bus, d, f, bar))
+
+                if val & 1:
+                    # IO BAR
+                    mask = (~val & 0xffffffff) | 3
+                    size = mask + 1
                     # logging
-                    print("[%s] Configure %02x:%02x.%x BAR%d" % (highlight(self.get_desc()), bus, d, f, bar))
+                    print("[%s] %02x:%02x.%x IO BAR%d raw: %08x, mask: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, mask, size))
 
-                    if val & 1:
-                        # IO BAR
-                        mask = (~val & 0xffffffff) | 3
-                        size = mask + 1
-                        # logging
-                        print("[%s] %02x:%02x.%x IO BAR%d raw: %08x, mask: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, mask, size))
+                    # align
+                    self.io_limit = align(self.io_limit, mask)
 
-                        # align
-                        self.io_limit = align(self.io_limit, mask)
+                    val = val & 3 | self.io_limit
 
-                        val = val & 3 | self.io_limit
+                    ti.bar[bar] = val
+                    ti.bar_size[bar] = size
 
-                        ti.bar[bar] = val
-                        ti.bar_size[bar] = size
+                    # logging
+                    print("[%s] %02x:%02x.%x IO BAR%d Allocation: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, size))
 
-                        # logging
-                        print("[%s] %02x:%02x.%x IO BAR%d Allocation: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, size))
+                    self.io_limit += size
 
-                        self.io_limit += size
+                    bar_writes.append((PcieId(bus, d, f), 0x010+bar*4, val))
 
-                        # write BAR
-                        yield from self.config_write_dword(PcieId(bus, d, f), 0x010+bar*4, val)
+                    bar += 1
+                else:
+                    # Memory BAR
 
-                        bar += 1
-                    else:
-                        # Memory BAR
-
-                        if val & 4:
-                            # 64 bit BAR
-                            if bar >= bar_cnt-1:
-                                raise Exception("Invalid BAR configuration")
-
-                            # read adjacent BAR
-                            yield from self.config_write_dword(PcieId(bus, d, f), 0x010+(bar+1)*4, 0xffffffff)
-                            val2 = yield from self.config_read_dword(PcieId(bus, d, f), 0x010+(bar+1)*4)
-                            val |= val2 << 32
-                            mask = (~val & 0xffffffffffffffff) | 15
-                            size = mask + 1
-                            # logging
-                            print("[%s] %02x:%02x.%x (64-bit) Mem BAR%d raw: %016x, mask: %016x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, mask, size))
-
-                            if val & 8:
-                                # prefetchable
-                                # align and allocate
-                                self.prefetchable_mem_limit = align(self.prefetchable_mem_limit, mask)
-                                val = val & 15 | self.prefetchable_mem_limit
-                                self.prefetchable_mem_limit += size
-
-                            else:
-                                # not-prefetchable
-                                # logging
-                                print("[%s] %02x:%02x.%x (64-bit) Mem BAR%d marked non-prefetchable, allocating from 32-bit non-prefetchable address space" % (highlight(self.get_desc()), bus, d, f, bar))
-                                # align and allocate
-                                self.mem_limit = align(self.mem_limit, mask)
-                                val = val & 15 | self.mem_limit
-                                self.mem_limit += size
-
-                            ti.bar[bar] = val
-                            ti.bar_size[bar] = size
+                    if val & 4:
+                        # 64 bit BAR
+                        if bar >= bar_cnt-1:
+                            raise Exception("Invalid BAR configuration")
 
-                            # logging
-                            print("[%s] %02x:%02x.%x (64-bit) Mem BAR%d Allocation: %016x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, size))
+                        # adjacent BAR
+                        val |= bar_vals[bar+1] << 32
+                        mask = (~val & 0xffffffffffffffff) | 15
+                        size = mask + 1
+                        # logging
+                        print("[%s] %02x:%02x.%x (64-bit) Mem BAR%d raw: %016x, mask: %016x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, mask, size))
 
-                            # write BAR
-                            yield from self.config_write_dword(PcieId(bus, d, f), 0x010+bar*4, val & 0xffffffff)
-                            yield from self.config_write_dword(PcieId(bus, d, f), 0x010+(bar+1)*4, (val >> 32) & 0xffffffff)
+                        if val & 8:
+                            # prefetchable
+                            # align and allocate
+                            self.prefetchable_mem_limit = align(self.prefetchable_mem_limit, mask)
+                            val = val & 15 | self.prefetchable_mem_limit
+                            self.prefetchable_mem_limit += size
 
-                            bar += 2
                         else:
-                            # 32 bit BAR
-                            mask = (~val & 0xffffffff) | 15
-                            size = mask + 1
+                            # not-prefetchable
                             # logging
-                            print("[%s] %02x:%02x.%x (32-bit) Mem BAR%d raw: %08x, mask: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, mask, size))
-
-                            if val & 8:
-                                # prefetchable
-                                # logging
-                                print("[%s] %02x:%02x.%x (32-bit) Mem BAR%d marked prefetchable, but allocating as non-prefetchable" % (highlight(self.get_desc()), bus, d, f, bar))
-
+                            print("[%s] %02x:%02x.%x (64-bit) Mem BAR%d marked non-prefetchable, allocating from 32-bit non-prefetchable address space" % (highlight(self.get_desc()), bus, d, f, bar))
                             # align and allocate
                             self.mem_limit = align(self.mem_limit, mask)
                             val = val & 15 | self.mem_limit
                             self.mem_limit += size
 
-                            ti.bar[bar] = val
-                            ti.bar_size[bar] = size
+                        ti.bar[bar] = val
+                        ti.bar_size[bar] = size
 
-                            # logging
-                            print("[%s] %02x:%02x.%x (32-bit) Mem BAR%d Allocation: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, size))
+                        # logging
+                        print("[%s] %02x:%02x.%x (64-bit) Mem BAR%d Allocation: %016x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, size))
 
-                            # write BAR
-                            yield from self.config_write_dword(PcieId(bus, d, f), 0x010+bar*4, val)
+                        bar_writes.append((PcieId(bus, d, f), 0x010+bar*4, val & 0xffffffff))
+                        bar_writes.append((PcieId(bus, d, f), 0x010+(bar+1)*4, (val >> 32) & 0xffffffff))
 
-                            bar += 1
+                        bar += 2
+                    else:
+                        # 32 bit BAR
+                        mask = (~val & 0xffffffff) | 15
+                        size = mask + 1
+                        # logging
+                        print("[%s] %02x:%02x.%x (32-bit) Mem BAR%d raw: %08x, mask: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, mask, size))
 
-                # logging
-                print("[%s] Walk capabilities of %02x:%02x.%x" % (highlight(self.get_desc()), bus, d, f))
+                        if val & 8:
+                            # prefetchable
+                            # logging
+                            print("[%s] %02x:%02x.%x (32-bit) Mem BAR%d marked prefetchable, but allocating as non-prefetchable" % (highlight(self.get_desc()), bus, d, f, bar))
 
-                # walk capabilities
-                ptr = yield from self.config_read_byte(PcieId(bus, d, f), 0x34)
-                ptr = ptr & 0xfc
+                        # align and allocate
+                        self.mem_limit = align(self.mem_limit, mask)
+                        val = val & 15 | self.mem_limit
+                        self.mem_limit += size
 
-                while ptr > 0:
-                    val = yield from self.config_read(PcieId(bus, d, f), ptr, 2)
-                    # logging
-                    print("[%s] Found capability 0x%02x at offset 0x%02x, next ptr 0x%02x" % (highlight(self.get_desc()), val[0], ptr, val[1] & 0xfc))
-                    ti.capabilities.append((val[0], ptr))
-                    ptr = val[1] & 0xfc
+                        ti.bar[bar] = val
+                        ti.bar_size[bar] = size
 
-                # walk extended capabilities
-                # TODO
+                        # logging
+                        print("[%s] %02x:%02x.%x (32-bit) Mem BAR%d Allocation: %08x, size: %d" % (highlight(self.get_desc()), bus, d, f, bar, val, size))
 
-                # set max payload size, max read request size, and extended tag enable
-                dev_cap = yield from self.capability_read_dword(PcieId(bus, d, f), PCIE_CAP_ID, 4)
-                dev_ctrl_sta = yield from self.capability_read_dword(PcieId(bus, d, f), PCIE_CAP_ID, 8)
+                        bar_writes.append((PcieId(bus, d, f), 0x010+bar*4, val))
 
-                max_payload = min(0x5, min(self.max_payload_size, dev_cap & 7))
-                ext_tag = bool(self.extended_tag_field_enable and (dev_cap & (1 << 5)))
-                max_read_req = min(0x5, self.max_read_request_size)
+                        bar += 1
 
-                new_dev_ctrl = dev_ctrl_sta & 0x00008e1f | (max_payload << 5) | (ext_tag << 8) | (max_read_req << 12)
+            # write BARs
+            yield from self.config_dword_batch(bar_writes)
 
-                yield from self.capability_write_dword(PcieId(bus, d, f), PCIE_CAP_ID, 8, new_dev_ctrl)
+            # logging
+            print("[%s] Walk capabilities of %02x:%02x.%x" % (highlight(self.get_desc()), bus, d, f))
 
-                if enable_bus_mastering:
-                    # enable bus mastering
-                    val = yield from self.config_read_word(PcieId(bus, d, f), 0x04)
-                    yield from self.config_write_word(PcieId(bus, d, f), 0x04, val | 4)
+            # walk capabilities
+            ptr = yield from self.config_read_byte(PcieId(bus, d, f), 0x34)
+            ptr = ptr & 0xfc
 
-                if configure_msi:
-                    # configure MSI
-                    yield from self.configure_msi(PcieId(bus, d, f))
+            while ptr > 0:
+                val = yield from self.config_read(PcieId(bus, d, f), ptr, 2)
+                # logging
+                print("[%s] Found capability 0x%02x at offset 0x%02x, next ptr 0x%02x" % (highlight(self.get_desc()), val[0], ptr, val[1] & 0xfc))
+                ti.capabilities.append((val[0], ptr))
+                ptr = val[1] & 0xfc
 
-                if bridge:
-                    # set bridge registers for enumeration
-                    # logging
-                    print("[%s] Set pri %d, sec %d, sub %d" % (highlight(self.get_desc()), bus, sec_bus, 255))
+            # walk extended capabilities
+            # TODO
 
-                    yield from self.config_write(PcieId(bus, d, f), 0x018, bytearray([bus, sec_bus, 255]))
+            # set max payload size, max read request size, and extended tag enable
+            dev_cap = yield from self.capability_read_dword(PcieId(bus, d, f), PCIE_CAP_ID, 4)
+            dev_ctrl_sta = yield from self.capability_read_dword(PcieId(bus, d, f), PCIE_CAP_ID, 8)
 
-                    # enumerate secondary bus
-                    sub_bus = yield from self.enumerate_segment(tree=ti, bus=sec_bus, timeout=timeout, enable_bus_mastering=enable_bus_mastering, configure_msi=configure_msi)
+            max_payload = min(0x5, min(self.max_payload_size, dev_cap & 7))
+            ext_tag = bool(self.extended_tag_field_enable and (dev_cap & (1 << 5)))
+            max_read_req = min(0x5, self.max_read_request_size)
 
-                    # finalize bridge configuration
-                    # logging
-                    print("[%s] Set pri %d, sec %d, sub %d" % (highlight(self.get_desc()), bus, sec_bus, sub_bus))
+            new_dev_ctrl = dev_ctrl_sta & 0x00008e1f | (max_payload << 5) | (ext_tag << 8) | (max_read_req << 12)
+            ti.dev_ctrl = new_dev_ctrl
 
-                    yield from self.config_write(PcieId(bus, d, f), 0x018, bytearray([bus, sec_bus, sub_bus]))
+            yield from self.capability_write_dword(PcieId(bus, d, f), PCIE_CAP_ID, 8, new_dev_ctrl)
 
-                    # set base/limit registers
-                    # logging
-                    print("[%s] Set IO base: %08x, limit: %08x" % (highlight(self.get_desc()), ti.io_base, ti.io_limit))
+            if enable_bus_mastering:
+                # enable bus mastering
+                val = yield from self.config_read_word(PcieId(bus, d, f), 0x04)
+                ti.command = val | 4
+                yield from self.config_write_word(PcieId(bus, d, f), 0x04, val | 4)
 
-                    yield from self.config_write(PcieId(bus, d, f), 0x01C, struct.pack('BB', (ti.io_base >> 8) & 0xf0, (ti.io_limit >> 8) & 0xf0))
-                    yield from self.config_write(PcieId(bus, d, f), 0x030, struct.pack('<HH', ti.io_base >> 16, ti.io_limit >> 16))
+            if configure_msi:
+                # configure MSI
+                yield from self.configure_msi(PcieId(bus, d, f))
 
-                    # logging
-                    print("[%s] Set mem base: %08x, limit: %08x" % (highlight(self.get_desc()), ti.mem_base, ti.mem_limit))
+            if bridge:
+                # set bridge registers for enumeration
+                # logging
+                print("[%s] Set pri %d, sec %d, sub %d" % (highlight(self.get_desc()), bus, sec_bus, 255))
 
-                    yield from self.config_write(PcieId(bus, d, f), 0x020, struct.pack('<HH', (ti.mem_base >> 16) & 0xfff0, (ti.mem_limit >> 16) & 0xfff0))
+                yield from self.config_write(PcieId(bus, d, f), 0x018, bytearray([bus, sec_bus, 255]))
 
-                    # logging
-                    print("[%s] Set prefetchable mem base: %016x, limit: %016x" % (highlight(self.get_desc()), ti.prefetchable_mem_base, ti.prefetchable_mem_limit))
+                # enumerate secondary bus
+                sub_bus = yield from self.enumerate_segment(tree=ti, bus=sec_bus, timeout=timeout, enable_bus_mastering=enable_bus_mastering, configure_msi=configure_msi)
 
-                    yield from self.config_write(PcieId(bus, d, f), 0x024, struct.pack('<HH', (ti.prefetchable_mem_base >> 16) & 0xfff0, (ti.prefetchable_mem_limit >> 16) & 0xfff0))
-                    yield from self.config_write(PcieId(bus, d, f), 0x028, struct.pack('<L', ti.prefetchable_mem_base >> 32))
-                    yield from self.config_write(PcieId(bus, d, f), 0x02c, struct.pack('<L', ti.prefetchable_mem_limit >> 32))
+                # finalize bridge configuration
+                # logging
+                print("[%s] Set pri %d, sec %d, sub %d" % (highlight(self.get_desc()), bus, sec_bus, sub_bus))
+
+                yield from self.config_write(PcieId(bus, d, f), 0x018, bytearray([bus, sec_bus, sub_bus]))
 
-                    sec_bus = sub_bus+1
+                # set base/limit registers
+                yield from self.set_bridge_windows(ti)
+
+                sec_bus = sub_bus+1
 
         tree.sub_bus_num = sub_bus
 
@@ -4485,7 +4623,122 @@ class RootComplex(Switch):
 
         return sub_bus
 
-    def enumerate(self, timeout=1000, enable_bus_mastering=False, configure_msi=False):
+    def restore_segment(self, tree, timeout=1000, configure_msi=False):
+        # replay a cached enumeration of one bus segment
+        # logging
+        print("[%s] Restoring bus %d" % (highlight(self.get_desc()), tree.sec_bus_num))
+
+        # validate vendor and device IDs; these reads also let each
+        # function capture its bus number
+        vals = yield from self.config_dword_batch([(ti.get_id(), 0x000) for ti in tree.children], timeout)
+
+        for ti, val in zip(tree.children, vals):
+            if val != ti.vendor_id | ti.device_id << 16:
+                # logging
+                print("[%s] ID mismatch at %s: %08x" % (highlight(self.get_desc()), ti.get_id(), val))
+                return False
+
+        # write BARs, then read back one per function
+        writes = []
+        checks = []
+
+        for ti in tree.children:
+            dev = ti.get_id()
+            bars = [k for k in range(6) if ti.bar[k] is not None]
+
+            for k in bars:
+                writes.append((dev, 0x010+k*4, ti.bar[k] & 0xffffffff))
+
+                if not ti.bar[k] & 1 and ti.bar[k] & 4:
+                    # 64 bit BAR
+                    writes.append((dev, 0x010+(k+1)*4, (ti.bar[k] >> 32) & 0xffffffff))
+
+            if bars:
+                checks.append((ti, bars[0]))
+
+            cap = ti.get_capability_offset(PCIE_CAP_ID)
+            if cap is not None and ti.dev_ctrl is not None:
+                writes.append((dev, cap+8, ti.dev_ctrl))
+
+        yield from self.config_dword_batch(writes)
+        vals = yield from self.config_dword_batch([(ti.get_id(), 0x010+k*4) for ti, k in checks])
+
+        for (ti, k), val in zip(checks, vals):
+            if val != ti.bar[k] & 0xffffffff:
+                # logging
+                print("[%s] BAR mismatch at %s: %08x" % (highlight(self.get_desc()), ti.get_id(), val))
+                return False
+
+        for ti in tree.children:
+            dev = ti.get_id()
+
+            if ti.command is not None:
+                yield from self.config_write_word(dev, 0x04, ti.command)
+
+            if configure_msi:
+                yield from self.configure_msi(dev)
+
+            if ti.bridge:
+                yield from self.config_write(dev, 0x018, bytearray([ti.bus_num, ti.sec_bus_num, ti.sub_bus_num]))
+
+                ok = yield from self.restore_segment(ti, timeout=timeout, configure_msi=configure_msi)
+                if not ok:
+                    return False
+
+                yield from self.set_bridge_windows(ti)
+
+        return True
+
+    def save_enumeration(self, filename, key, enable_bus_mastering=False):
+        data = {
+            'key': key,
+            'enable_bus_mastering': enable_bus_mastering,
+            'io_base': self.io_base,
+            'mem_base': self.mem_base,
+            'prefetchable_mem_base': self.prefetchable_mem_base,
+            'io_limit': self.io_limit,
+            'mem_limit': self.mem_limit,
+            'prefetchable_mem_limit': self.prefetchable_mem_limit,
+            'tree': self.tree.to_dict(),
+        }
+
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=1)
+
+    def restore_enumeration(self, filename, key, timeout=1000, enable_bus_mastering=False, configure_msi=False):
+        # returns True if the cached enumeration is still valid
+        if not os.path.exists(filename):
+            return False
+
+        with open(filename, 'r') as f:
+            data = json.load(f)
+
+        if (data['key'] != key or data['enable_bus_mastering'] != enable_bus_mastering or
+                data['io_base'] != self.io_base or data['mem_base'] != self.mem_base or
+                data['prefetchable_mem_base'] != self.prefetchable_mem_base):
+            # logging
+            print("[%s] Cached enumeration does not match, ignoring" % (highlight(self.get_desc())))
+            return False
+
+        self.tree = TreeItem.from_dict(data['tree'])
+
+        ok = yield from self.restore_segment(self.tree, timeout=timeout, configure_msi=configure_msi)
+
+        if not ok:
+            # logging
+            print("[%s] Cached enumeration is stale" % (highlight(self.get_desc())))
+            return False
+
+        self.io_limit = data['io_limit']
+        self.mem_limit = data['mem_limit']
+        self.prefetchable_mem_limit = data['prefetchable_mem_limit']
+
+        return True
+
+    def enumerate(self, timeout=1000, enable_bus_mastering=False, configure_msi=False, cache_file=None, cache_key=None):
+        # MyHDL model only; the cocotb testbenches enumerate through the
+        # RootComplex in cocotbext-pcie, which still walks the bus serially
+
         # logging
         print("[%s] Enumerating bus" % (highlight(self.get_desc())))
 
@@ -4493,8 +4746,25 @@ class RootComplex(Switch):
         self.mem_limit = self.mem_base
         self.prefetchable_mem_limit = self.prefetchable_mem_base
 
-        self.tree = TreeItem()
-        yield from self.enumerate_segment(tree=self.tree, bus=0, timeout=timeout, enable_bus_mastering=enable_bus_mastering, configure_msi=configure_msi)
+        restored = False
+
+        if cache_file and cache_key is not None:
+            restored = yield from self.restore_enumeration(cache_file, cache_key, timeout=timeout,
+                enable_bus_mastering=enable_bus_mastering, configure_msi=configure_msi)
+
+        if restored:
+            # logging
+            print("[%s] Restored cached enumeration" % (highlight(self.get_desc())))
+        else:
+            self.io_limit = self.io_base
+            self.mem_limit = self.mem_base
+            self.prefetchable_mem_limit = self.prefetchable_mem_base
+
+            self.tree = TreeItem()
+            yield from self.enumerate_segment(tree=self.tree, bus=0, timeout=timeout, enable_bus_mastering=enable_bus_mastering, configure_msi=configure_msi)
+
+            if cache_file and cache_key is not None:
+                self.save_enumeration(cache_file, cache_key, enable_bus_mastering)
 
         self.upstream_bridge.io_base = self.io_base
         self.upstream_bridge.io_limit = self.io_limit
@@ -25,10 +25,12 @@ THE SOFTWARE.
 import logging
 import mmap
 import struct
+from collections import deque
 
 import cocotb
 from cocotb.queue import Queue, QueueFull
 from cocotb.triggers import RisingEdge, Timer, First, Event
+from cocotb.utils import get_sim_time
 from cocotb_bus.bus import Bus
 
 from cocotbext.pcie.core import Device
@@ -1312,10 +1314,136 @@ class PcieIfDevice(Device):
                 self.tx_fc_cpld_cons.value = self.upstream_port.fc_state[0].cpld.tx_credits_consumed & 0xfff
 
 
+class TagPool:
+    def __init__(self, tag_count=32, ten_bit=False, limit=None):
+        self.tag_count = 0
+        self.tag_base = 0
+        self.ten_bit = False
+        self.max_outstanding = None
+        self.limit = None
+        self.active_count = 0
+        self.active = []
+        self.free = deque()
+        self.waiters = deque()
+
+        self.configure(tag_count, ten_bit, limit)
+        self.clear_stats()
+
+    def configure(self, tag_count=32, ten_bit=False, limit=None):
+        if self.active_count:
+            raise Exception("Cannot reconfigure tag pool with tags in flight")
+
+        if ten_bit:
+            # 10-bit tag values with tag[9:8] == 00 are not permitted
+            if not 0 < tag_count <= 768:
+                raise ValueError("10-bit tag count must be between 1 and 768")
+            self.tag_base = 256
+        else:
+            # 5-bit or 8-bit (extended) tags
+            if not 0 < tag_count <= 256:
+                raise ValueError("Tag count must be between 1 and 256")
+            self.tag_base = 0
+
+        self.tag_count = tag_count
+        self.ten_bit = ten_bit
+        self.active = [False]*(self.tag_base+tag_count)
+        self.free = deque(range(self.tag_base, self.tag_base+tag_count))
+        self.active_count = 0
+        self.set_limit(limit)
+
+    @property
+    def tag_space(self):
+        return self.tag_base+self.tag_count
+
+    def set_limit(self, limit=None):
+        # cap on outstanding requests, independent of the tag space
+        self.max_outstanding = limit
+        self.limit = min(limit, self.tag_count) if limit else self.tag_count
+        self._wake()
+
+    def clear_stats(self):
+        self.alloc_count = 0
+        self.stall_count = 0
+        self.stall_time = 0
+        self.max_stall_time = 0
+        self.max_occupancy = self.active_count
+        self._occupancy_integral = 0
+        self._last_time = get_sim_time('ns')
+        self._start_time = self._last_time
+
+    def _update_occupancy(self, delta):
+        t = get_sim_time('ns')
+        self._occupancy_integral += self.active_count*(t-self._last_time)
+        self._last_time = t
+        self.active_count += delta
+        self.max_occupancy = max(self.max_occupancy, self.active_count)
+
+    def _take(self):
+        tag = self.free.popleft()
+        self.active[tag] = True
+        self.alloc_count += 1
+        self._update_occupancy(1)
+        return tag
+
+    def _wake(self):
+        # hand released tags directly to waiters in arrival order
+        while self.waiters and self.free and self.active_count < self.limit:
+            self.waiters.popleft().set(self._take())
+
+    def try_alloc(self):
+        if not self.waiters and self.free and self.active_count < self.limit:
+            return self._take()
+        return None
+
+    async def alloc(self):
+        tag = self.try_alloc()
+        if tag is not None:
+            return tag
+
+        event = Event()
+        self.waiters.append(event)
+        start = get_sim_time('ns')
+        await event.wait()
+        stall = get_sim_time('ns')-start
+
+        self.stall_count += 1
+        self.stall_time += stall
+        self.max_stall_time = max(self.max_stall_time, stall)
+
+        return event.data
+
+    def release(self, tag):
+        assert self.active[tag]
+        self.active[tag] = False
+        self._update_occupancy(-1)
+        self.free.append(tag)
+        self._wake()
+
+    def get_stats(self):
+        self._update_occupancy(0)
+        elapsed = self._last_time-self._start_time
+        return {
+            'tag_count': self.tag_count,
+            'limit': self.limit,
+            'active': self.active_count,
+            'waiting': len(self.waiters),
+            'alloc_count': self.alloc_count,
+            'max_occupancy': self.max_occupancy,
+            'mean_occupancy': self._occupancy_integral/elapsed if elapsed else 0.0,
+            'stall_count': self.stall_count,
+            'stall_time_ns': self.stall_time,
+            'max_stall_time_ns': self.max_stall_time,
+        }
+
+
 class PcieIfTestDevice:
     def __init__(self,
             # configuration options
             force_64bit_addr=False,
+            tag_count=32,
+            ten_bit_tag=False,
+            max_outstanding=None,
+            tag_width=8,
 
             # signals
             # Clock and reset
@@ -1355,13 +1483,13 @@ class PcieIfTestDevice:
         self.bar_ptr = 0
         self.regions = [None]*6
 
-        self.current_tag = 0
-        self.tag_count = 32
-        self.tag_active = [False]*256
-        self.tag_release = Event()
+        # widest tag the requester interface of the DUT can carry
+        self.tag_width = tag_width
+        self._check_tags(tag_count, ten_bit_tag)
+        self.tag_pool = TagPool(tag_count, ten_bit_tag, max_outstanding)
 
-        self.rx_cpl_queues = [Queue() for k in range(256)]
-        self.rx_cpl_sync = [Event() for k in range(256)]
+        self.rx_cpl_queues = [Queue() for k in range(1024)]
+        self.rx_cpl_sync = [Event() for k in range(1024)]
 
         self.dev_max_payload = 0
         self.dev_max_read_req = 0
@@ -1483,25 +1611,38 @@ class PcieIfTestDevice:
 
         return None
 
-    async def alloc_tag(self):
-        tag_count = min(256, self.tag_count)
+    @property
+    def tag_count(self):
+        return self.tag_pool.tag_count
 
-        while True:
-            tag = self.current_tag
-            for k in range(tag_count):
-                tag = (tag + 1) % tag_count
-                if not self.tag_active[tag]:
-                    self.tag_active[tag] = True
-                    self.current_tag = tag
-                    return tag
+    @tag_count.setter
+    def tag_count(self, value):
+        self.configure_tags(value, self.tag_pool.ten_bit, self.tag_pool.max_outstanding)
 
-            self.tag_release.clear()
-            await self.tag_release.wait()
+    def _check_tags(self, tag_count, ten_bit_tag):
+        if ten_bit_tag and self.tag_width < 10:
+            raise ValueError(f"10-bit tags need a 10-bit tag field, interface has {self.tag_width} bits")
+        if not ten_bit_tag and tag_count > 2**self.tag_width:
+            raise ValueError(f"Tag count {tag_count} does not fit in a {self.tag_width}-bit tag field")
+
+    def configure_tags(self, tag_count=32, ten_bit_tag=False, max_outstanding=None):
+        self._check_tags(tag_count, ten_bit_tag)
+        self.tag_pool.configure(tag_count, ten_bit_tag, max_outstanding)
+
+    def set_max_outstanding(self, max_outstanding=None):
+        self.tag_pool.set_limit(max_outstanding)
+
+    def get_tag_stats(self):
+        return self.tag_pool.get_stats()
+
+    def clear_tag_stats(self):
+        self.tag_pool.clear_stats()
+
+    async def alloc_tag(self):
+        return await self.tag_pool.alloc()
 
     def release_tag(self, tag):
-        assert self.tag_active[tag]
-        self.tag_active[tag] = False
-        self.tag_release.set()
+        self.tag_pool.release(tag)
 
     async def perform_posted_operation(self, source, req):
         await source.send(PcieIfFrame.from_tlp(req, self.force_64bit_addr))
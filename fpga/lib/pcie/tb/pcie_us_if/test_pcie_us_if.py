@@ -40,12 +40,12 @@ from cocotbext.pcie.core import RootComplex
 from cocotbext.pcie.xilinx.us import UltraScalePlusPcieDevice
 
 try:
-    from pcie_if import PcieIfTestDevice, PcieIfRxBus, PcieIfTxBus
+    from pcie_if import PcieIfTestDevice, PcieIfRxBus, PcieIfTxBus, TagPool
 except ImportError:
     # attempt import from current directory
     sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
     try:
-        from pcie_if import PcieIfTestDevice, PcieIfRxBus, PcieIfTxBus
+        from pcie_if import PcieIfTestDevice, PcieIfRxBus, PcieIfTxBus, TagPool
     finally:
         del sys.path[0]
 
@@ -449,6 +449,102 @@ async def run_test_dma(dut, idle_inserter=None, backpressure_inserter=None):
     await RisingEdge(dut.clk)
 
 
+async def run_test_dma_outstanding(dut, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    mem = tb.rc.mem_pool.alloc_region(16*1024*1024)
+    mem_base = mem.get_absolute_address(0)
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+
+    await FallingEdge(dut.rst)
+    await Timer(100, 'ns')
+
+    await tb.rc.enumerate()
+
+    dev = tb.rc.find_device(tb.dev.functions[0].pcie_id)
+    await dev.enable_device()
+    await dev.set_master()
+
+    tb.test_dev.dev_max_payload = tb.dev.functions[0].pcie_cap.max_payload_size
+    tb.test_dev.dev_max_read_req = tb.dev.functions[0].pcie_cap.max_read_request_size
+    tb.test_dev.dev_bus_num = tb.dev.bus_num
+
+    count = 128
+    length = 256
+
+    for k in range(count):
+        mem[k*length:(k+1)*length] = bytearray([(x+k) % 256 for x in range(length)])
+
+    for tag_count, max_outstanding in [(32, None), (256, None), (256, 64)]:
+        tb.log.info("Outstanding reads: tag count %d, limit %s", tag_count, max_outstanding)
+
+        tb.test_dev.configure_tags(tag_count, max_outstanding=max_outstanding)
+        tb.test_dev.clear_tag_stats()
+
+        ops = []
+        for k in range(count):
+            ops.append(cocotb.start_soon(tb.test_dev.dma_mem_read(mem_base+k*length, length, timeout=50000, timeout_unit='ns')))
+
+        for k, op in enumerate(ops):
+            assert await op.join() == mem[k*length:(k+1)*length]
+
+        stats = tb.test_dev.get_tag_stats()
+        tb.log.info("Tag stats: %s", stats)
+
+        limit = min(tag_count, max_outstanding or tag_count)
+
+        assert stats['active'] == 0
+        assert stats['max_occupancy'] <= limit
+
+        # all reads are issued at once, so the pool fills up to the limit
+        # and the remaining requests stall until tags are released
+        assert stats['max_occupancy'] == min(limit, count)
+        if limit < count:
+            assert stats['stall_count'] > 0
+        else:
+            assert stats['stall_count'] == 0
+
+    # changing the tag count keeps the outstanding request limit
+    tb.test_dev.configure_tags(32, max_outstanding=16)
+    tb.test_dev.tag_count = 64
+    assert tb.test_dev.get_tag_stats()['limit'] == 16
+
+    # the UltraScale requester interface only carries 8-bit tags
+    try:
+        tb.test_dev.configure_tags(256, ten_bit_tag=True)
+    except ValueError:
+        pass
+    else:
+        assert False, "10-bit tags accepted on an 8-bit tag interface"
+
+    tb.test_dev.configure_tags()
+
+    # 10-bit tags, exercised on the tag pool directly
+    pool = TagPool(768, ten_bit=True, limit=300)
+
+    tags = [pool.try_alloc() for k in range(300)]
+    assert None not in tags
+    assert len(set(tags)) == 300
+    assert min(tags) >= 256 and max(tags) < pool.tag_space
+    assert pool.get_stats()['max_occupancy'] > 32
+
+    # at the limit, the next request waits for a release
+    assert pool.try_alloc() is None
+    waiter = cocotb.start_soon(pool.alloc())
+    await Timer(10, 'ns')
+    assert not waiter.done()
+    pool.release(tags[0])
+    tag = await waiter.join()
+    assert tag >= 256 and tag not in tags[1:]
+    assert pool.get_stats()['stall_count'] == 1
+
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+
+
 async def run_test_dma_errors(dut, idle_inserter=None, backpressure_inserter=None):
 
     tb = TB(dut)
@@ -578,6 +674,7 @@ if cocotb.SIM_NAME:
     for test in [
                 run_test_mem,
                 run_test_dma,
+                run_test_dma_outstanding,
                 run_test_dma_errors,
                 run_test_msi,
                 run_test_msix,
@@ -26,6 +26,7 @@ THE SOFTWARE.
 from myhdl import *
 import struct
 import os
+import tempfile
 
 import pcie
 
@@ -245,6 +246,59 @@ def bench():
 
         yield delay(100)
 
+        yield clk.posedge
+        print("test 8: concurrent and cached enumeration")
+        current_test.next = 8
+
+        tree = rc.tree.to_str()
+        bars = list(ep.bar)
+
+        rc.max_config_outstanding = 1
+        t = now()
+        yield from rc.enumerate(enable_bus_mastering=True, configure_msi=True)
+        t_serial = now()-t
+
+        assert rc.tree.to_str() == tree
+        assert ep.bar == bars
+
+        with tempfile.TemporaryDirectory() as d:
+            cache_file = os.path.join(d, 'enum.json')
+            key = pcie.enumeration_cache_key(test='test_pcie')
+
+            rc.max_config_outstanding = 8
+            t = now()
+            yield from rc.enumerate(enable_bus_mastering=True, configure_msi=True, cache_file=cache_file, cache_key=key)
+            t_concurrent = now()-t
+
+            assert os.path.exists(cache_file)
+            assert rc.tree.to_str() == tree
+            assert ep.bar == bars
+
+            t = now()
+            yield from rc.enumerate(enable_bus_mastering=True, configure_msi=True, cache_file=cache_file, cache_key=key)
+            t_cached = now()-t
+
+            assert rc.tree.to_str() == tree
+            assert ep.bar == bars
+            assert sw.upstream_bridge.sub_bus_num == 5
+
+            print("serial: %d, concurrent: %d, cached: %d" % (t_serial, t_concurrent, t_cached))
+
+            assert t_concurrent < t_serial
+            assert t_cached < t_concurrent
+
+            # different key forces a full walk
+            t = now()
+            yield from rc.enumerate(enable_bus_mastering=True, configure_msi=True, cache_file=cache_file, cache_key=key+'x')
+            assert now()-t > t_cached
+            assert rc.tree.to_str() == tree
+
+        yield from ep.issue_msi_interrupt(4)
+
+        yield rc.msi_get_signal(ep.get_id(), 4)
+
+        yield delay(100)
+
         raise StopSimulation
 
     return instances()